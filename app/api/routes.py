@@ -1,17 +1,64 @@
-from fastapi import APIRouter, HTTPException, Depends
-from app.models import QueryRequest, QueryResponse, HealthResponse, DocumentUploadResponse
+from fastapi import APIRouter, HTTPException, Depends, Response
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from app.models import (
+    QueryRequest, QueryResponse, HealthResponse, IndexJobResponse,
+    BatchQueryRequest, BatchQueryResponse
+)
+from typing import List
+from app.services.errors import ServiceUnavailableError
 from app.services.rag_pipeline import RAGPipeline
-from app.dependencies import get_rag_pipeline
+from app.dependencies import current_rag_pipeline, get_rag_pipeline
+from app.config import get_settings
+import json
+
+settings = get_settings()
 
 router = APIRouter()
 
+def _unavailable(error: ServiceUnavailableError) -> HTTPException:
+    """429 when overloaded, 503 while the LLM provider is down, with a Retry-After hint"""
+    return HTTPException(
+        status_code=error.status_code,
+        detail=str(error),
+        headers={"Retry-After": error.retry_after_header}
+    )
+
+def _format_sse(event: str, data: dict) -> str:
+    """Format a single Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
 @router.get("/health", response_model=HealthResponse)
 async def health_check(rag: RAGPipeline = Depends(get_rag_pipeline)):
     """Check system health"""
     return HealthResponse(
         status="healthy",
         vector_store_loaded=rag.vector_store.index.ntotal > 0,
-        redis_connected=rag.cache_service.is_connected()
+        redis_connected=await rag.cache_service.ais_connected()
+    )
+
+@router.get("/health/live")
+async def liveness():
+    """Liveness probe: the process is up and serving HTTP"""
+    return {"status": "alive"}
+
+@router.get("/health/ready", response_model=HealthResponse)
+async def readiness(response: Response):
+    """Readiness probe: the pipeline is built and warmed.
+    
+    With startup warm-up disabled, the first probe builds the pipeline, since
+    no traffic is routed to the worker until it reports ready.
+    """
+    rag = current_rag_pipeline()
+    if rag is None and not settings.startup_warmup_enabled:
+        rag = await run_in_threadpool(get_rag_pipeline)
+    if rag is None or not rag.ready:
+        response.status_code = 503
+        return HealthResponse(status="not_ready", vector_store_loaded=False, redis_connected=False)
+    return HealthResponse(
+        status="ready",
+        vector_store_loaded=rag.vector_store.index.ntotal > 0,
+        redis_connected=await rag.cache_service.ais_connected()
     )
 
 @router.post("/query", response_model=QueryResponse)
@@ -21,42 +68,118 @@ async def query(
 ):
     """Ask a question"""
     try:
-        return rag.query(request.question, request.conversation_id)
+        return await rag.aquery(request.question, request.conversation_id, request.filters)
+    except ServiceUnavailableError as e:
+        raise _unavailable(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
-@router.post("/index-documents", response_model=DocumentUploadResponse)
-async def index_documents(rag: RAGPipeline = Depends(get_rag_pipeline)):
-    """Index documents from data/documents directory"""
-    try:
-        result = rag.initialize_documents("data/documents")
-        return DocumentUploadResponse(
-            message="Documents indexed successfully",
-            **result
+@router.post("/query/batch", response_model=BatchQueryResponse)
+async def query_batch(
+    request: BatchQueryRequest,
+    rag: RAGPipeline = Depends(get_rag_pipeline)
+):
+    """Ask many independent questions at once; results are returned in input order"""
+    if len(request.questions) > settings.batch_max_questions:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch exceeds the maximum of {settings.batch_max_questions} questions"
         )
+    try:
+        return BatchQueryResponse(results=await rag.aquery_batch(request.questions))
+    except ServiceUnavailableError as e:
+        raise _unavailable(e)
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+
+@router.post("/query/stream")
+async def query_stream(
+    request: QueryRequest,
+    rag: RAGPipeline = Depends(get_rag_pipeline)
+):
+    """Ask a question and stream sources, then answer tokens, as Server-Sent Events"""
+    async def event_stream():
+        try:
+            async for event, data in rag.astream_query(request.question, request.conversation_id, request.filters):
+                yield _format_sse(event, data)
+        except ServiceUnavailableError as e:
+            yield _format_sse("error", {"detail": str(e), "retry_after": e.retry_after_header})
+        except Exception as e:
+            yield _format_sse("error", {"detail": str(e)})
     
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+@router.post("/index-documents", response_model=IndexJobResponse, status_code=202)
+async def index_documents(rag: RAGPipeline = Depends(get_rag_pipeline)):
+    """Start a background job indexing data/documents into a new index generation"""
+    job = rag.index_jobs.start("index", lambda progress: rag.build_generation("data/documents", progress))
+    if job is None:
+        raise HTTPException(status_code=409, detail="An index job is already running")
+    return IndexJobResponse(**job)
+
+@router.get("/index-jobs", response_model=List[IndexJobResponse])
+async def list_index_jobs(rag: RAGPipeline = Depends(get_rag_pipeline)):
+    """Recent index jobs, newest first"""
+    return [IndexJobResponse(**job) for job in rag.index_jobs.list()]
+
+@router.get("/index-jobs/{job_id}", response_model=IndexJobResponse)
+async def get_index_job(job_id: str, rag: RAGPipeline = Depends(get_rag_pipeline)):
+    """Status and progress of an index job"""
+    job = rag.index_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Index job not found")
+    return IndexJobResponse(**job)
+
 @router.get("/debug/store-info")
 async def get_store_info(rag: RAGPipeline = Depends(get_rag_pipeline)):
     """Get vector store information for debugging"""
+    store = rag.vector_store
     return {
-        "total_vectors": rag.vector_store.index.ntotal,
-        "total_documents": len(rag.vector_store.documents),
-        "embedding_dimension": rag.vector_store.dimension,
+        "generation": store.generation,
+        "memory_mapped": store.mapped,
+        "sources": store.metadata_index.sources(),
+        "tags": store.metadata_index.tags(),
+        "total_vectors": store.index.ntotal,
+        "total_documents": store.chunk_store.count(),
+        "embedding_dimension": store.dimension,
         "documents_sample": [
             {
                 "source": doc.metadata.get("source", "Unknown"),
                 "page": doc.metadata.get("page"),
                 "content_preview": doc.page_content[:100] + "..."
             }
-            for doc in rag.vector_store.documents[:3]
-        ] if rag.vector_store.documents else []
+            for doc in store.chunk_store.sample(3)
+        ]
     }
 
-@router.post("/clear-index")
+@router.get("/debug/hot-questions")
+async def get_hot_questions(rag: RAGPipeline = Depends(get_rag_pipeline)):
+    """Most frequent questions, whether their answers are cached, and cache warming status"""
+    return await rag.ahot_questions()
+
+@router.get("/debug/embedding-stats")
+async def get_embedding_stats(rag: RAGPipeline = Depends(get_rag_pipeline)):
+    """Get query embedding micro-batching metrics"""
+    return rag.embedding_service.stats()
+
+@router.get("/debug/llm-stats")
+async def get_llm_stats(rag: RAGPipeline = Depends(get_rag_pipeline)):
+    """Get LLM admission control and circuit breaker state"""
+    return rag.llm_service.dispatcher.stats()
+
+@router.get("/debug/cache-stats")
+async def get_cache_stats(rag: RAGPipeline = Depends(get_rag_pipeline)):
+    """Get semantic cache hit rate and request coalescing counters"""
+    return {**rag.cache_service.stats(), "single_flight": rag.single_flight.stats()}
+
+@router.post("/clear-index", response_model=IndexJobResponse, status_code=202)
 async def clear_index(rag: RAGPipeline = Depends(get_rag_pipeline)):
-    """Clear the vector store (use before re-indexing)"""
-    rag.vector_store.clear()
-    rag.vector_store.save()
-    return {"message": "Index cleared successfully"}
\ No newline at end of file
+    """Start a background job publishing an empty index generation (use before re-indexing)"""
+    job = rag.index_jobs.start("clear", lambda progress: rag.build_generation(None, progress))
+    if job is None:
+        raise HTTPException(status_code=409, detail="An index job is already running")
+    return IndexJobResponse(**job)
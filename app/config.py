@@ -17,6 +17,120 @@ class Settings(BaseSettings):
     top_k_results: int = 3
     cache_expiry: int = 3600
     
+    # Retrieval Configuration
+    retrieval_mode: str = "dense"  # dense or hybrid (BM25 + dense with reciprocal rank fusion)
+    hybrid_candidates: int = 20
+    rrf_k: int = 60
+    
+    # Context Assembly Configuration
+    # Up to top_k_results chunks are chosen from context_candidates by MMR, near-duplicates
+    # dropped and overlapping neighbours merged, within context_token_budget
+    context_builder_enabled: bool = True
+    context_candidates: int = 12
+    context_token_budget: int = 1000
+    context_mmr_lambda: float = 0.7  # 1 = relevance only, 0 = diversity only
+    context_duplicate_threshold: float = 0.95  # Cosine similarity above which chunks are duplicates
+    
+    # Ingestion Configuration (0 workers = one per CPU core)
+    document_tags_file: str = "tags.json"  # In the documents directory: {"file.pdf": ["tag", ...]}
+    ingest_workers: int = 0
+    ingest_page_batch_size: int = 8
+    ingest_embedding_batch_size: int = 128
+    
+    # Response Cache Configuration
+    # Keys are namespaced by index generation and models, so a rebuild invalidates every entry at once
+    cache_max_connections: int = 50  # Per pool; each worker has a sync and an async pool
+    cache_compress_min_bytes: int = 512  # Smaller payloads are stored uncompressed
+    cache_compression_level: int = 6
+    cache_l1_enabled: bool = True  # In-process LRU in front of Redis
+    cache_l1_max_entries: int = 1024
+    cache_l1_ttl: int = 60
+    
+    # Semantic Cache Configuration
+    semantic_cache_enabled: bool = True
+    semantic_cache_threshold: float = 0.95
+    semantic_cache_max_entries: int = 10000
+    semantic_cache_ttl: int = 3600
+    
+    # Cache Warming Configuration
+    # Question frequency is tracked in Redis (Count-Min sketch + top-N); the hottest answers are
+    # regenerated when they are about to expire and right after a re-index
+    hot_questions_enabled: bool = True
+    hot_questions_top_n: int = 100
+    hot_questions_sketch_width: int = 2048
+    hot_questions_sketch_depth: int = 4
+    hot_questions_decay_seconds: int = 3600  # Counts are halved this often, so past traffic fades
+    cache_warming_enabled: bool = True
+    cache_warming_interval: float = 60.0
+    cache_warming_refresh_ahead: int = 300  # Refresh answers expiring within this many seconds
+    cache_warming_min_count: int = 3  # Questions asked fewer times are not warmed
+    cache_warming_rate: float = 1.0  # Answers regenerated per second, at most
+    
+    # Request Coalescing Configuration
+    single_flight_enabled: bool = True
+    single_flight_lease_ms: int = 30000
+    single_flight_poll_ms: int = 50
+    
+    # Batch Query Configuration
+    batch_max_questions: int = 500
+    batch_llm_concurrency: int = 8
+    
+    # Conversation History Configuration
+    conversation_backend: str = "memory"  # memory (per worker) or redis (shared)
+    conversation_ttl: int = 3600
+    conversation_max_conversations: int = 10000
+    conversation_max_messages: int = 20
+    conversation_history_token_budget: int = 1000
+    
+    # LLM Dispatch Configuration
+    llm_max_concurrency: int = 16  # Concurrent Groq calls per worker
+    llm_max_queue: int = 64  # Calls waiting for a slot beyond which new ones are rejected (429)
+    llm_queue_timeout: float = 10.0  # Longest wait for a slot, in seconds
+    llm_timeout_seconds: float = 30.0  # Per attempt
+    llm_max_retries: int = 2  # On rate limits, timeouts, connection errors and 5xx
+    llm_retry_base_delay: float = 0.5
+    llm_retry_max_delay: float = 8.0
+    llm_circuit_failure_threshold: int = 5  # Consecutive provider failures that open the circuit (503)
+    llm_circuit_reset_seconds: float = 30.0
+    
+    # Concurrency Configuration
+    executor_max_workers: int = 4
+    
+    # Embedding Backend
+    embedding_backend: str = "torch"  # torch, onnx or onnx_int8 (ONNX Runtime, dynamic int8 quantization)
+    embedding_onnx_dir: str = "storage/onnx"  # Exported models, one directory per model
+    embedding_onnx_threads: int = 0  # 0 = ONNX Runtime default
+    
+    # Query Embedding Micro-batching
+    embedding_batching_enabled: bool = True
+    embedding_batch_window_ms: float = 5.0
+    embedding_max_batch_size: int = 32
+    embedding_batch_queue_size: int = 1024
+    
+    # Index Generation Configuration
+    index_generations_keep: int = 3  # Published generations kept on disk
+    index_generation_poll_seconds: float = 5.0  # How often workers check for a new generation (0 = never)
+    
+    # Vector Index Configuration
+    # One of: flat, hnsw, ivf_flat, ivf_pq, sq_fp16, sq8
+    vector_index_type: str = "flat"
+    vector_index_hnsw_m: int = 32
+    vector_index_ef_search: int = 64
+    vector_index_nlist: int = 0  # 0 = sqrt(number of vectors)
+    vector_index_nprobe: int = 8
+    vector_index_pq_m: int = 48
+    vector_index_pq_nbits: int = 8
+    vector_index_max_train_size: int = 100000
+    vector_index_mmap: bool = True  # Serve the published index memory-mapped, shared by all workers via the page cache
+    
+    # Startup Configuration
+    startup_warmup_enabled: bool = True  # Build and warm the pipeline before serving requests
+    startup_warm_llm_connection: bool = True  # Open the Groq connection pool with a models list call
+    
+    # Observability Configuration
+    log_level: str = "INFO"
+    timing_headers_enabled: bool = False  # Adds a Server-Timing header with per-stage durations
+    
     # Model Configuration
     embedding_model: str = "all-MiniLM-L6-v2"
     llm_model: str = "llama-3.1-8b-instant"
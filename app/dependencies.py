@@ -1,10 +1,72 @@
-from functools import lru_cache
+import asyncio
+import logging
+import threading
+import time
+from typing import Optional
+from fastapi.concurrency import run_in_threadpool
+from app.config import get_settings
+from app.services.metrics import request_timings, stage
 from app.services.rag_pipeline import RAGPipeline
 
-@lru_cache()
-def get_rag_pipeline():
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+_rag_pipeline: Optional[RAGPipeline] = None
+_rag_pipeline_lock = threading.Lock()
+
+def get_rag_pipeline() -> RAGPipeline:
     """Get singleton RAG pipeline instance"""
-    rag = RAGPipeline()
-    # Try to load existing index
-    rag.vector_store.load()
-    return rag
\ No newline at end of file
+    global _rag_pipeline
+    if _rag_pipeline is None:
+        # Concurrent first requests wait for one build instead of each loading the model
+        with _rag_pipeline_lock:
+            if _rag_pipeline is None:
+                rag = RAGPipeline()
+                # Try to load existing index
+                with stage("startup_index"):
+                    rag.load_index()
+                if not settings.startup_warmup_enabled:
+                    # Nothing else will warm it; ready as soon as the index is loaded
+                    rag.ready = True
+                _rag_pipeline = rag
+    return _rag_pipeline
+
+def current_rag_pipeline() -> Optional[RAGPipeline]:
+    """The pipeline if it has been built, without building it"""
+    return _rag_pipeline
+
+async def warm_up_rag_pipeline() -> RAGPipeline:
+    """Build and warm the pipeline at startup, logging where the time went"""
+    timings = {}
+    token = request_timings.set(timings)
+    started = time.perf_counter()
+    try:
+        rag = await run_in_threadpool(get_rag_pipeline)
+        await rag.awarm_up()
+    finally:
+        request_timings.reset(token)
+    
+    breakdown = ", ".join(f"{name}={duration:.0f}ms" for name, duration in timings.items())
+    logger.info("Pipeline ready in %.2fs (%s)", time.perf_counter() - started, breakdown)
+    return rag
+
+async def run_cache_warmer(poll_interval: float):
+    """Keep the hottest answers cached, once the pipeline has been built"""
+    rag = current_rag_pipeline()
+    while rag is None:
+        await asyncio.sleep(poll_interval)
+        rag = current_rag_pipeline()
+    if rag.cache_warmer is not None:
+        await rag.cache_warmer.run()
+
+async def watch_index_generations(interval: float):
+    """Pick up index generations published by other workers"""
+    while True:
+        await asyncio.sleep(interval)
+        rag = current_rag_pipeline()
+        if rag is None:
+            continue
+        try:
+            await run_in_threadpool(rag.refresh_generation)
+        except Exception as e:
+            logger.error("Error switching index generation: %s", e)
@@ -1,20 +1,78 @@
-from fastapi import FastAPI
+import asyncio
+import logging
+import time
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request, Response
+from prometheus_client import CONTENT_TYPE_LATEST, generate_latest
 from app.api.routes import router
 from app.config import get_settings
+from app.dependencies import current_rag_pipeline, run_cache_warmer, warm_up_rag_pipeline, watch_index_generations
+from app.services.metrics import QUERY_DURATION, format_server_timing, mark_worker_stopped, metrics_registry, request_timings
 
 settings = get_settings()
 
+logging.basicConfig(
+    level=settings.log_level.upper(),
+    format="%(asctime)s %(levelname)s %(name)s: %(message)s"
+)
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Warm the pipeline before accepting traffic, so a new replica's first requests aren't slow"""
+    if settings.startup_warmup_enabled:
+        await warm_up_rag_pipeline()
+    tasks = []
+    if settings.index_generation_poll_seconds > 0:
+        tasks.append(asyncio.create_task(watch_index_generations(settings.index_generation_poll_seconds)))
+    if settings.cache_warming_enabled:
+        tasks.append(asyncio.create_task(run_cache_warmer(poll_interval=1.0)))
+    yield
+    for task in tasks:
+        task.cancel()
+    # Fail readiness while in-flight requests drain
+    rag = current_rag_pipeline()
+    if rag is not None:
+        rag.ready = False
+    mark_worker_stopped()
+
 app = FastAPI(
     title="Medical Policy RAG Chatbot",
     description="Retrieval-Augmented Generation chatbot for medical policies",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 app.include_router(router, prefix="/api/v1", tags=["RAG"])
 
+@app.middleware("http")
+async def record_timings(request: Request, call_next):
+    """Observe request latency per route and optionally expose stage timings"""
+    timings = {}
+    token = request_timings.set(timings)
+    started = time.perf_counter()
+    try:
+        response = await call_next(request)
+    finally:
+        request_timings.reset(token)
+    
+    elapsed = time.perf_counter() - started
+    route = request.scope.get("route")
+    # Label by route template so path parameters don't explode cardinality
+    QUERY_DURATION.labels(endpoint=route.path if route else "unmatched").observe(elapsed)
+    
+    if settings.timing_headers_enabled:
+        timings["total"] = elapsed * 1000
+        response.headers["Server-Timing"] = format_server_timing(timings)
+    return response
+
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    """Prometheus metrics, of all workers with PROMETHEUS_MULTIPROC_DIR set, else of the worker serving the scrape"""
+    return Response(generate_latest(metrics_registry()), media_type=CONTENT_TYPE_LATEST)
+
 @app.get("/")
 async def root():
     return {
         "message": "Medical Policy RAG Chatbot API",
         "docs": "/docs"
-    }
\ No newline at end of file
+    }
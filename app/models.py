@@ -1,9 +1,16 @@
-from pydantic import BaseModel, Field
-from typing import List, Optional
+from pydantic import BaseModel, Field, constr
+from typing import Any, Dict, List, Optional
+
+class QueryFilter(BaseModel):
+    sources: Optional[List[str]] = Field(None, description="Only search these document files")
+    tags: Optional[List[str]] = Field(None, description="Only search documents with any of these tags")
+    page_min: Optional[int] = Field(None, ge=1, description="First page to search")
+    page_max: Optional[int] = Field(None, ge=1, description="Last page to search")
 
 class QueryRequest(BaseModel):
     question: str = Field(..., min_length=1, description="User's question")
     conversation_id: Optional[str] = Field(None, description="For multi-turn conversations")
+    filters: Optional[QueryFilter] = Field(None, description="Restrict retrieval to matching documents and pages")
 
 class SourceDocument(BaseModel):
     content: str
@@ -16,10 +23,29 @@ class QueryResponse(BaseModel):
     conversation_id: Optional[str] = None
     cached: bool = False
 
-class DocumentUploadResponse(BaseModel):
-    message: str
-    documents_processed: int
-    chunks_created: int
+class BatchQueryRequest(BaseModel):
+    questions: List[constr(min_length=1)] = Field(..., min_length=1, description="Questions answered independently, without conversation history")
+
+class BatchQueryItem(BaseModel):
+    question: str
+    answer: Optional[str] = None
+    sources: List[SourceDocument] = []
+    cached: bool = False
+    error: Optional[str] = None
+
+class BatchQueryResponse(BaseModel):
+    results: List[BatchQueryItem]
+
+class IndexJobResponse(BaseModel):
+    job_id: str
+    kind: str  # index or clear
+    status: str  # queued, running, succeeded or failed
+    created_at: float
+    started_at: Optional[float] = None
+    finished_at: Optional[float] = None
+    progress: Dict[str, Any] = {}
+    result: Optional[Dict[str, Any]] = None
+    error: Optional[str] = None
 
 class HealthResponse(BaseModel):
     status: str
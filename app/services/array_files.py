@@ -0,0 +1,29 @@
+import os
+import numpy as np
+from typing import Dict, Iterable, Optional
+
+# Named arrays saved as one raw .npy file each in a directory, so they can be
+# memory-mapped (np.load(mmap_mode='r')) like the FAISS index. Arrays inside an
+# .npz archive can't be mapped; arrays saved as <path>.npz before the switch
+# are still read, into the heap.
+
+def save_arrays(path: str, arrays: Dict[str, np.ndarray]):
+    """Write each array to <path>/<name>.npy, replacing them one by one"""
+    os.makedirs(path, exist_ok=True)
+    for name, array in arrays.items():
+        # Written aside and renamed, so workers mapping the old file never see it truncated
+        tmp_path = os.path.join(path, f"{name}.tmp.npy")
+        np.save(tmp_path, np.ascontiguousarray(array), allow_pickle=False)
+        os.replace(tmp_path, os.path.join(path, f"{name}.npy"))
+
+def load_arrays(path: str, names: Iterable[str], mmap: bool = False) -> Optional[Dict[str, np.ndarray]]:
+    """Arrays saved by save_arrays (mapped read-only with `mmap`), or None if there are none"""
+    if os.path.isdir(path):
+        return {
+            name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode='r' if mmap else None, allow_pickle=False)
+            for name in names
+        }
+    if os.path.exists(f"{path}.npz"):
+        with np.load(f"{path}.npz", allow_pickle=False) as data:
+            return {name: data[name] for name in names}
+    return None
@@ -1,66 +1,283 @@
+import logging
 import redis
+import redis.asyncio as aioredis
+import asyncio
 import json
 import hashlib
-from typing import Optional
+import time
+import uuid
+import zlib
+import numpy as np
+from typing import List, Optional
+from app.services.local_cache import LocalCache
+from app.services.semantic_cache import SemanticCache
+from app.services.metrics import record_cache_lookup
 from app.config import get_settings
 
 settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Deletes a lease only if it still holds this worker's token
+_RELEASE_LEASE_SCRIPT = """
+if redis.call("get", KEYS[1]) == ARGV[1] then
+    return redis.call("del", KEYS[1])
+end
+return 0
+"""
+
+# Payload format markers
+_RAW = b"\x00"
+_ZLIB = b"\x01"
+
+def cache_namespace(generation: Optional[str]) -> str:
+    """Namespace of response cache keys; answers depend on the index generation and on both models"""
+    parts = [generation or "legacy", settings.embedding_model, settings.embedding_backend, settings.llm_model]
+    return hashlib.md5("|".join(parts).encode()).hexdigest()[:12]
+
+def encode_payload(response: dict) -> bytes:
+    """Compact JSON, zlib-compressed once it is large enough to be worth it"""
+    data = json.dumps(response, separators=(",", ":"), ensure_ascii=False).encode()
+    if len(data) < settings.cache_compress_min_bytes:
+        return _RAW + data
+    return _ZLIB + zlib.compress(data, settings.cache_compression_level)
+
+def decode_payload(payload: bytes) -> dict:
+    if payload[:1] == _ZLIB:
+        return json.loads(zlib.decompress(payload[1:]))
+    return json.loads(payload[1:])
 
 class CacheService:
     def __init__(self):
+        connection_kwargs = dict(
+            host=settings.redis_host,
+            port=settings.redis_port,
+            db=settings.redis_db,
+            password=settings.redis_password if settings.redis_password else None,
+            max_connections=settings.cache_max_connections
+        )
         try:
-            self.redis_client = redis.Redis(
-                host=settings.redis_host,
-                port=settings.redis_port,
-                db=settings.redis_db,
-                password=settings.redis_password if settings.redis_password else None,
-                decode_responses=True
-            )
-            self.redis_client.ping()
+            # Requests only go through the async pool; a one-off connection checks Redis is up at startup
+            with redis.Redis(**connection_kwargs) as client:
+                client.ping()
+            self.async_redis_client = aioredis.Redis(connection_pool=aioredis.ConnectionPool(**connection_kwargs))
             self.enabled = True
         except:
-            print("Redis not available, caching disabled")
+            logger.warning("Redis not available, caching disabled")
             self.enabled = False
+        
+        self.semantic_cache = None
+        if self.enabled and settings.semantic_cache_enabled:
+            self.semantic_cache = SemanticCache(
+                threshold=settings.semantic_cache_threshold,
+                max_entries=settings.semantic_cache_max_entries,
+                ttl=min(settings.semantic_cache_ttl, settings.cache_expiry)
+            )
+        
+        self.local_cache = None
+        if self.enabled and settings.cache_l1_enabled:
+            self.local_cache = LocalCache(
+                max_entries=settings.cache_l1_max_entries,
+                ttl=min(settings.cache_l1_ttl, settings.cache_expiry)
+            )
+        
+        self.generation: Optional[str] = None
+        self.namespace = cache_namespace(None)
+    
+    def set_generation(self, generation: Optional[str]):
+        """Switch to the key namespace of an index generation, dropping in-process entries of the old one"""
+        namespace = cache_namespace(generation)
+        if namespace == self.namespace:
+            return
+        self.generation = generation
+        self.namespace = namespace
+        if self.local_cache is not None:
+            self.local_cache.clear()
+        if self.semantic_cache is not None:
+            self.semantic_cache.clear()
+        logger.info("Response cache namespace %s (index generation %s)", namespace, generation or "legacy")
     
     def _generate_key(self, question: str) -> str:
         """Generate cache key from question"""
-        return f"rag:{hashlib.md5(question.encode()).hexdigest()}"
+        return f"rag:{self.namespace}:{hashlib.md5(question.encode()).hexdigest()}"
+    
+    def _is_stale(self, namespace: Optional[str]) -> bool:
+        # An answer retrieved from a generation that has since been swapped out must not be cached
+        return namespace is not None and namespace != self.namespace
     
-    def get(self, question: str) -> Optional[dict]:
-        """Get cached response"""
+    def _local_get(self, key: str) -> Optional[dict]:
+        if self.local_cache is None:
+            return None
+        cached = self.local_cache.get(key)
+        record_cache_lookup("l1", cached is not None)
+        return cached
+    
+    def _local_set(self, key: str, response: dict):
+        if self.local_cache is not None:
+            self.local_cache.set(key, response)
+    
+    def _decode(self, key: str, payload: Optional[bytes]) -> Optional[dict]:
+        if not payload:
+            return None
+        response = decode_payload(payload)
+        self._local_set(key, response)
+        return response
+    
+    async def _aget_key(self, key: str, layer: str) -> Optional[dict]:
+        cached = self._local_get(key)
+        if cached is None:
+            cached = self._decode(key, await self.async_redis_client.get(key))
+        record_cache_lookup(layer, cached is not None)
+        return cached
+    
+    async def aget(self, question: str) -> Optional[dict]:
+        """Get cached response without blocking the event loop"""
         if not self.enabled:
             return None
         
         try:
-            key = self._generate_key(question)
-            cached = self.redis_client.get(key)
-            if cached:
-                return json.loads(cached)
+            return await self._aget_key(self._generate_key(question), "exact")
         except:
             pass
         return None
     
-    def set(self, question: str, response: dict):
-        """Cache response"""
-        if not self.enabled:
+    async def aset(self, question: str, response: dict, query_embedding: Optional[np.ndarray] = None,
+                   namespace: Optional[str] = None):
+        """Cache response without blocking the event loop"""
+        if not self.enabled or self._is_stale(namespace):
             return
         
         try:
             key = self._generate_key(question)
-            self.redis_client.setex(
-                key,
-                settings.cache_expiry,
-                json.dumps(response)
+            await self.async_redis_client.setex(key, settings.cache_expiry, encode_payload(response))
+            self._local_set(key, response)
+            if self.semantic_cache is not None and query_embedding is not None:
+                self.semantic_cache.add(query_embedding, key)
+        except:
+            pass
+    
+    async def aget_many(self, questions: List[str]) -> List[Optional[dict]]:
+        """Get cached responses for many questions, with a single MGET for those not held in process"""
+        if not self.enabled or not questions:
+            return [None] * len(questions)
+        
+        try:
+            keys = [self._generate_key(question) for question in questions]
+            responses = [self._local_get(key) for key in keys]
+            missing = [i for i, response in enumerate(responses) if response is None]
+            if missing:
+                values = await self.async_redis_client.mget([keys[i] for i in missing])
+                for i, value in zip(missing, values):
+                    responses[i] = self._decode(keys[i], value)
+            for response in responses:
+                record_cache_lookup("exact", response is not None)
+            return responses
+        except:
+            return [None] * len(questions)
+    
+    async def aget_similar(self, query_embedding: np.ndarray) -> Optional[dict]:
+        """Get the cached response of a semantically equivalent question without blocking the event loop"""
+        if self.semantic_cache is None:
+            return None
+        
+        try:
+            match = self.semantic_cache.lookup(query_embedding)
+            if match is None:
+                record_cache_lookup("semantic", False)
+                return None
+            entry_id, key = match
+            cached = await self._aget_key(key, "semantic")
+            if cached:
+                self.semantic_cache.record_hit()
+                return cached
+            self.semantic_cache.remove(entry_id)
+        except:
+            pass
+        return None
+    
+    def _lease_key(self, question: str) -> str:
+        return f"{self._generate_key(question)}:lease"
+    
+    async def aacquire_lease(self, question: str) -> Optional[str]:
+        """Claim the right to compute an answer across workers; returns a token, or None if held elsewhere"""
+        if not self.enabled:
+            return ""
+        token = uuid.uuid4().hex
+        try:
+            acquired = await self.async_redis_client.set(
+                self._lease_key(question), token, nx=True, px=settings.single_flight_lease_ms
             )
+            return token if acquired else None
+        except:
+            # Without Redis there is nothing to coordinate with
+            return ""
+    
+    async def arelease_lease(self, question: str, token: str):
+        """Release a lease taken with aacquire_lease"""
+        if not self.enabled or not token:
+            return
+        try:
+            await self.async_redis_client.eval(_RELEASE_LEASE_SCRIPT, 1, self._lease_key(question), token)
         except:
             pass
     
-    def is_connected(self) -> bool:
-        """Check Redis connection"""
+    async def await_fill(self, question: str) -> Optional[dict]:
+        """Wait for another worker holding the lease to cache an answer"""
+        deadline = time.monotonic() + settings.single_flight_lease_ms / 1000
+        key = self._generate_key(question)
+        while time.monotonic() < deadline:
+            await asyncio.sleep(settings.single_flight_poll_ms / 1000)
+            try:
+                # One round trip for both the answer and the lease
+                pipe = self.async_redis_client.pipeline(transaction=False)
+                pipe.get(key)
+                pipe.exists(self._lease_key(question))
+                payload, leased = await pipe.execute()
+            except:
+                return None
+            if payload:
+                return self._decode(key, payload)
+            if not leased:
+                # The holder finished without caching (or died), stop waiting
+                return None
+        return None
+    
+    async def aremaining_ttl(self, questions: List[str]) -> List[Optional[float]]:
+        """Seconds until each question's cached answer expires, None if it isn't cached"""
+        if not self.enabled or not questions:
+            return [None] * len(questions)
+        pipe = self.async_redis_client.pipeline(transaction=False)
+        for question in questions:
+            pipe.pttl(self._generate_key(question))
+        # -2 = no such key; entries are always written with an expiry
+        return [ttl / 1000 if ttl >= 0 else None for ttl in await pipe.execute()]
+    
+    async def aclaim(self, name: str, seconds: float) -> bool:
+        """Claim a periodic task in the current namespace for `seconds`, so only one worker runs it"""
+        if not self.enabled:
+            return True
+        try:
+            return bool(await self.async_redis_client.set(
+                f"rag:{self.namespace}:{name}:claim", uuid.uuid4().hex, nx=True, px=max(int(seconds * 1000), 1)
+            ))
+        except:
+            return False
+    
+    def stats(self) -> dict:
+        """Cache namespace, plus semantic and in-process cache configuration and hit rates"""
+        stats = {"namespace": self.namespace, "generation": self.generation}
+        if self.semantic_cache is None:
+            stats["semantic_cache_enabled"] = False
+        else:
+            stats.update({"semantic_cache_enabled": True, **self.semantic_cache.stats()})
+        stats["l1_cache"] = self.local_cache.stats() if self.local_cache is not None else {"enabled": False}
+        return stats
+    
+    async def ais_connected(self) -> bool:
+        """Check Redis connection without blocking the event loop"""
         if not self.enabled:
             return False
         try:
-            self.redis_client.ping()
+            await self.async_redis_client.ping()
             return True
         except:
-            return False
\ No newline at end of file
+            return False
@@ -0,0 +1,138 @@
+import asyncio
+import logging
+import threading
+import time
+from typing import Awaitable, Callable, Dict, Optional
+from app.services.hot_questions import HotQuestionTracker
+from app.services.errors import ServiceUnavailableError
+from app.services.metrics import CACHE_WARMING
+from app.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Regenerates and caches the answer to a question; returns whether the LLM produced it
+WarmFunction = Callable[[str], Awaitable[bool]]
+
+class CacheWarmer:
+    """Keeps the answers to the hottest questions cached ahead of demand.
+    
+    Every `interval` seconds, and as soon as a new index generation is live,
+    hot questions asked at least `min_count` times whose answers are missing or
+    expire within `refresh_ahead` seconds are regenerated, at most `rate` per
+    second. Only one worker warms per round, and an unavailable or overloaded
+    LLM or embedding queue ends the round early rather than adding to the load.
+    """
+    
+    def __init__(self, tracker: HotQuestionTracker, cache_service, warm: WarmFunction):
+        self.tracker = tracker
+        self.cache_service = cache_service
+        self.warm = warm
+        self.interval = settings.cache_warming_interval
+        self.refresh_ahead = settings.cache_warming_refresh_ahead
+        self.min_count = settings.cache_warming_min_count
+        self.rate = settings.cache_warming_rate
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._wake: Optional[asyncio.Event] = None
+        self._lock = threading.Lock()
+        self._pending: Optional[str] = None
+        self.current_round: Optional[Dict] = None
+        self.last_round: Optional[Dict] = None
+        self.totals = {"warmed": 0, "fresh": 0, "skipped": 0, "failed": 0}
+    
+    def trigger(self, reason: str):
+        """Start a round as soon as possible (any thread)"""
+        with self._lock:
+            self._pending = reason
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._wake.set)
+    
+    async def run(self):
+        """Warm on a schedule and on trigger, until cancelled"""
+        self._loop = asyncio.get_running_loop()
+        self._wake = asyncio.Event()
+        while True:
+            if self._pending is None:
+                try:
+                    await asyncio.wait_for(self._wake.wait(), timeout=self.interval)
+                except asyncio.TimeoutError:
+                    pass
+            self._wake.clear()
+            with self._lock:
+                reason, self._pending = self._pending or "schedule", None
+            try:
+                await self.warm_round(reason)
+            except Exception as e:
+                logger.error("Cache warming round failed: %s", e)
+    
+    def _count(self, round_: Dict, outcome: str, n: int = 1):
+        round_[outcome] += n
+        self.totals[outcome] += n
+        CACHE_WARMING.labels(outcome=outcome).inc(n)
+    
+    async def warm_round(self, reason: str) -> Optional[Dict]:
+        """Refresh the hot answers that are due; returns the round's summary, or None if another worker has it"""
+        namespace = self.cache_service.namespace
+        # A new generation has a new namespace, so it gets a round of its own right away
+        if not await self.cache_service.aclaim("warming", self.interval):
+            return None
+        await self.tracker.adecay()
+        
+        hot = [(question, count) for question, count in await self.tracker.atop() if count >= self.min_count]
+        ttls = await self.cache_service.aremaining_ttl([question for question, _ in hot])
+        due = [question for (question, _), ttl in zip(hot, ttls) if ttl is None or ttl < self.refresh_ahead]
+        
+        round_ = {
+            "reason": reason,
+            "started_at": time.time(),
+            "finished_at": None,
+            "hot": len(hot),
+            "due": len(due),
+            "warmed": 0,
+            "fresh": 0,
+            "skipped": 0,
+            "failed": 0,
+            "stopped": None
+        }
+        self._count(round_, "fresh", len(hot) - len(due))
+        self.current_round = round_
+        try:
+            for question in due:
+                if self.cache_service.namespace != namespace:
+                    round_["stopped"] = "index generation changed"
+                    break
+                started = time.monotonic()
+                try:
+                    self._count(round_, "warmed" if await self.warm(question) else "skipped")
+                except ServiceUnavailableError as e:
+                    self._count(round_, "failed")
+                    round_["stopped"] = str(e)
+                    break
+                except Exception as e:
+                    logger.warning("Could not warm answer to %r: %s", question, e)
+                    self._count(round_, "failed")
+                await asyncio.sleep(max(1 / self.rate - (time.monotonic() - started), 0))
+        finally:
+            round_["finished_at"] = time.time()
+            self.current_round = None
+            self.last_round = round_
+        
+        if due:
+            logger.info(
+                "Cache warming (%s): %d of %d hot answers due, %d warmed, %d failed",
+                reason, len(due), len(hot), round_["warmed"], round_["failed"]
+            )
+        return round_
+    
+    def status(self) -> dict:
+        return {
+            "state": "warming" if self.current_round is not None else "idle",
+            "interval": self.interval,
+            "refresh_ahead": self.refresh_ahead,
+            "min_count": self.min_count,
+            "rate": self.rate,
+            "pending": self._pending,
+            "current_round": self.current_round,
+            "last_round": self.last_round,
+            "totals": dict(self.totals)
+        }
@@ -0,0 +1,151 @@
+import json
+import os
+import sqlite3
+import threading
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+from langchain_core.documents import Document
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS chunks (
+    id INTEGER PRIMARY KEY,
+    content TEXT NOT NULL,
+    metadata TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+class ChunkStore:
+    """Chunk text and metadata keyed by vector ID, stored in SQLite.
+    
+    A new store lives in memory until it is first saved; after `save` or `load`
+    it is backed by a file opened with SQLite memory-mapped I/O, so chunk text
+    stays in the shared page cache and only the rows a search returns are
+    turned into `Document` objects.
+    """
+    
+    def __init__(self, mmap_size: int = 1 << 30):
+        self.mmap_size = mmap_size
+        self.path: Optional[str] = None
+        self._lock = threading.Lock()
+        self._conn = self._connect(":memory:")
+    
+    def _connect(self, path: str) -> sqlite3.Connection:
+        conn = sqlite3.connect(path, check_same_thread=False)
+        if path != ":memory:":
+            conn.execute(f"PRAGMA mmap_size={self.mmap_size}")
+        conn.executescript(_SCHEMA)
+        return conn
+    
+    def add(self, ids: List[int], documents: List[Document]):
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO chunks (id, content, metadata) VALUES (?, ?, ?)",
+                [
+                    (vector_id, doc.page_content, json.dumps(doc.metadata))
+                    for vector_id, doc in zip(ids, documents)
+                ]
+            )
+    
+    def remove(self, ids: Iterable[int]):
+        with self._lock:
+            self._conn.executemany("DELETE FROM chunks WHERE id = ?", [(vector_id,) for vector_id in ids])
+    
+    def get_many(self, ids: List[int]) -> Dict[int, Document]:
+        """Materialize only the requested chunks"""
+        if not ids:
+            return {}
+        placeholders = ",".join("?" * len(ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, content, metadata FROM chunks WHERE id IN ({placeholders})",
+                [int(vector_id) for vector_id in ids]
+            ).fetchall()
+        return {
+            vector_id: Document(page_content=content, metadata=json.loads(metadata))
+            for vector_id, content, metadata in rows
+        }
+    
+    def sample(self, limit: int) -> List[Document]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT content, metadata FROM chunks ORDER BY id LIMIT ?", (limit,)
+            ).fetchall()
+        return [Document(page_content=content, metadata=json.loads(metadata)) for content, metadata in rows]
+    
+    def iter_texts(self, batch_size: int = 1000) -> Iterator[Tuple[List[int], List[str]]]:
+        """Stream (ids, texts) batches of every chunk in ID order"""
+        last_id = -1
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT id, content FROM chunks WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            yield [row[0] for row in rows], [row[1] for row in rows]
+            last_id = rows[-1][0]
+    
+    def iter_documents(self, batch_size: int = 1000) -> Iterator[Tuple[List[int], List[Document]]]:
+        """Stream (ids, documents) batches of every chunk in ID order"""
+        last_id = -1
+        while True:
+            with self._lock:
+                rows = self._conn.execute(
+                    "SELECT id, content, metadata FROM chunks WHERE id > ? ORDER BY id LIMIT ?", (last_id, batch_size)
+                ).fetchall()
+            if not rows:
+                return
+            yield [row[0] for row in rows], [Document(page_content=row[1], metadata=json.loads(row[2])) for row in rows]
+            last_id = rows[-1][0]
+    
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+    
+    def get_meta(self, key: str, default: Optional[str] = None) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row[0] if row else default
+    
+    def set_meta(self, key: str, value: str):
+        with self._lock:
+            self._conn.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+    
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM chunks")
+            self._conn.execute("DELETE FROM meta")
+    
+    def save(self, path: str):
+        """Persist the store to `path`, committing in place if it is already file-backed"""
+        with self._lock:
+            if self.path == os.path.abspath(path):
+                self._conn.commit()
+                return
+            
+            # First save of an in-memory store (or a move): write a copy, then swap it in
+            tmp_path = f"{path}.tmp"
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            self._conn.commit()
+            target = sqlite3.connect(tmp_path)
+            with target:
+                self._conn.backup(target)
+            target.close()
+            os.replace(tmp_path, path)
+            
+            self._conn.close()
+            self._conn = self._connect(path)
+            self.path = os.path.abspath(path)
+    
+    def load(self, path: str) -> bool:
+        if not os.path.exists(path):
+            return False
+        with self._lock:
+            self._conn.close()
+            self._conn = self._connect(path)
+            self.path = os.path.abspath(path)
+        return True
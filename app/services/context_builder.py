@@ -0,0 +1,152 @@
+import logging
+from typing import List, Optional, Tuple
+import numpy as np
+from langchain_core.documents import Document
+from app.services.metrics import CONTEXT_CHUNKS, CONTEXT_TOKENS
+from app.services.tokens import CHARS_PER_TOKEN, estimate_tokens
+from app.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Shortest shared text treated as the overlap between two neighbouring chunks
+MIN_MERGE_OVERLAP = 16
+
+def format_chunk(doc: Document) -> str:
+    """A chunk as it appears in the prompt"""
+    source = doc.metadata.get("source", "Unknown")
+    page = doc.metadata.get("page", "")
+    page_info = f" (Page {page})" if page else ""
+    return f"[Source: {source}{page_info}]\n{doc.page_content}"
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    vectors = np.asarray(vectors, dtype=np.float32)
+    return vectors / np.clip(np.linalg.norm(vectors, axis=-1, keepdims=True), 1e-12, None)
+
+def mmr_select(query_embedding: np.ndarray, embeddings: np.ndarray, k: int,
+               relevance: Optional[np.ndarray] = None, lambda_: float = 0.7,
+               duplicate_threshold: float = 0.95) -> Tuple[List[int], int]:
+    """Pick up to k candidates by maximal marginal relevance.
+    
+    Each step takes the candidate maximizing lambda * relevance - (1 - lambda)
+    * similarity to the closest one already picked. Candidates whose cosine
+    similarity to a picked one reaches `duplicate_threshold` are dropped as
+    near-duplicates. Relevance defaults to cosine similarity with the query.
+    Returns the picked indices in order and the number of duplicates dropped.
+    """
+    vectors = _normalize(embeddings)
+    if relevance is None:
+        relevance = vectors @ _normalize(query_embedding).reshape(-1)
+    similarity = vectors @ vectors.T
+    
+    picked: List[int] = []
+    remaining = list(range(len(vectors)))
+    duplicates = 0
+    while remaining and len(picked) < k:
+        if picked:
+            redundancy = similarity[np.ix_(remaining, picked)].max(axis=1)
+        else:
+            redundancy = np.zeros(len(remaining), dtype=np.float32)
+        scores = lambda_ * relevance[remaining] - (1 - lambda_) * redundancy
+        best = remaining.pop(int(np.argmax(scores)))
+        picked.append(best)
+        # Near-duplicates of the new pick can never add anything
+        kept = [i for i in remaining if similarity[best, i] < duplicate_threshold]
+        duplicates += len(remaining) - len(kept)
+        remaining = kept
+    return picked, duplicates
+
+def _overlap(head: str, tail: str, max_overlap: int) -> int:
+    """Length of the longest end of `head` that `tail` starts with"""
+    for size in range(min(len(head), len(tail), max_overlap), MIN_MERGE_OVERLAP - 1, -1):
+        if head.endswith(tail[:size]):
+            return size
+    return 0
+
+def merge_adjacent(results: List[Tuple[Document, float]], max_overlap: int) -> Tuple[List[Tuple[Document, float]], int]:
+    """Merge chunks of the same source page that overlap (neighbours from the splitter) or contain one another.
+    
+    A merged chunk takes the place and score of the higher ranked one.
+    Returns the merged results and the number of chunks merged away.
+    """
+    merged: List[Tuple[Document, float]] = []
+    merges = 0
+    for doc, score in results:
+        key = (doc.metadata.get("source"), doc.metadata.get("page"))
+        text = doc.page_content
+        for position, (kept, kept_score) in enumerate(merged):
+            if (kept.metadata.get("source"), kept.metadata.get("page")) != key:
+                continue
+            kept_text = kept.page_content
+            if text in kept_text:
+                combined = kept_text
+            elif kept_text in text:
+                combined = text
+            else:
+                forward = _overlap(kept_text, text, max_overlap)
+                backward = 0 if forward else _overlap(text, kept_text, max_overlap)
+                if forward:
+                    combined = kept_text + text[forward:]
+                elif backward:
+                    combined = text + kept_text[backward:]
+                else:
+                    continue
+            merged[position] = (Document(page_content=combined, metadata=dict(kept.metadata)), kept_score)
+            merges += 1
+            break
+        else:
+            merged.append((doc, score))
+    return merged, merges
+
+def fit_token_budget(results: List[Tuple[Document, float]], token_budget: int) -> Tuple[List[Tuple[Document, float]], int]:
+    """Keep, in rank order, the results whose prompt text still fits the budget.
+    
+    The top result is always kept, cut to the budget if it alone exceeds it.
+    Returns the kept results and their estimated token count.
+    """
+    kept: List[Tuple[Document, float]] = []
+    used = 0
+    for doc, score in results:
+        cost = estimate_tokens(format_chunk(doc))
+        if used + cost > token_budget:
+            if kept:
+                continue
+            header_cost = cost - estimate_tokens(doc.page_content)
+            content = doc.page_content[:max(token_budget - header_cost, 1) * CHARS_PER_TOKEN]
+            doc = Document(page_content=content, metadata=dict(doc.metadata))
+            cost = estimate_tokens(format_chunk(doc))
+        kept.append((doc, score))
+        used += cost
+    return kept, used
+
+def select_context(query_embedding: np.ndarray, candidates: List[Tuple[Document, float]],
+                   embeddings: Optional[np.ndarray], relevance: Optional[np.ndarray] = None) -> List[Tuple[Document, float]]:
+    """Choose the chunks sent to the LLM from a retrieved candidate pool.
+    
+    Near-duplicates are dropped and diverse chunks preferred (MMR), overlapping
+    neighbours are merged, and the result is fitted to the context token budget.
+    Without candidate embeddings, MMR is skipped and candidates keep their rank order.
+    """
+    if not candidates:
+        return []
+    if embeddings is None:
+        picked, duplicates = list(range(min(settings.top_k_results, len(candidates)))), 0
+    else:
+        picked, duplicates = mmr_select(
+            query_embedding, embeddings, settings.top_k_results, relevance,
+            lambda_=settings.context_mmr_lambda,
+            duplicate_threshold=settings.context_duplicate_threshold
+        )
+    merged, merges = merge_adjacent([candidates[i] for i in picked], max_overlap=2 * settings.chunk_overlap)
+    selected, tokens = fit_token_budget(merged, settings.context_token_budget)
+    
+    CONTEXT_CHUNKS.labels(outcome="selected").inc(len(selected))
+    CONTEXT_CHUNKS.labels(outcome="duplicate").inc(duplicates)
+    CONTEXT_CHUNKS.labels(outcome="merged").inc(merges)
+    CONTEXT_CHUNKS.labels(outcome="over_budget").inc(len(merged) - len(selected))
+    CONTEXT_TOKENS.observe(tokens)
+    logger.debug(
+        "Context: %d of %d candidates, %d duplicates, %d merged, ~%d tokens",
+        len(selected), len(candidates), duplicates, merges, tokens
+    )
+    return selected
@@ -0,0 +1,119 @@
+import logging
+import json
+import threading
+import time
+from collections import OrderedDict
+from typing import List
+from app.services.tokens import estimate_tokens
+from app.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+def trim_history(messages: List[dict], token_budget: int) -> List[dict]:
+    """Keep the most recent user/assistant turns that fit in the token budget"""
+    trimmed = []
+    used = 0
+    # Walk back one turn (user + assistant pair) at a time so a turn is never split
+    for start in range(len(messages) - 2, -1, -2):
+        turn = messages[start:start + 2]
+        cost = sum(estimate_tokens(message["content"]) for message in turn)
+        if used + cost > token_budget:
+            break
+        trimmed[:0] = turn
+        used += cost
+    return trimmed
+
+class InMemoryConversationStore:
+    """Per-worker conversation history, bounded by conversation count, length and TTL"""
+    
+    def __init__(self, max_conversations: int, max_messages: int, ttl: int):
+        self.max_conversations = max_conversations
+        self.max_messages = max_messages
+        self.ttl = ttl
+        self._conversations: "OrderedDict[str, tuple]" = OrderedDict()  # id -> (messages, expires at)
+        self._lock = threading.Lock()
+    
+    def get(self, conversation_id: str) -> List[dict]:
+        with self._lock:
+            entry = self._conversations.get(conversation_id)
+            if entry is None:
+                return []
+            messages, expires_at = entry
+            if expires_at <= time.time():
+                del self._conversations[conversation_id]
+                return []
+            self._conversations.move_to_end(conversation_id)
+            return list(messages)
+    
+    def append(self, conversation_id: str, question: str, answer: str):
+        with self._lock:
+            entry = self._conversations.pop(conversation_id, None)
+            messages = entry[0] if entry and entry[1] > time.time() else []
+            messages.append({"role": "user", "content": question})
+            messages.append({"role": "assistant", "content": answer})
+            self._conversations[conversation_id] = (messages[-self.max_messages:], time.time() + self.ttl)
+            
+            # Least recently used conversations go first
+            while len(self._conversations) > self.max_conversations:
+                self._conversations.popitem(last=False)
+    
+    async def aget(self, conversation_id: str) -> List[dict]:
+        return self.get(conversation_id)
+    
+    async def aappend(self, conversation_id: str, question: str, answer: str):
+        self.append(conversation_id, question, answer)
+    
+    def __len__(self) -> int:
+        return len(self._conversations)
+
+class RedisConversationStore:
+    """Conversation history in Redis lists, shared by every worker"""
+    
+    def __init__(self, async_redis_client, max_messages: int, ttl: int):
+        self.async_redis_client = async_redis_client
+        self.max_messages = max_messages
+        self.ttl = ttl
+    
+    def _key(self, conversation_id: str) -> str:
+        return f"rag:conversation:{conversation_id}"
+    
+    def _encode_turn(self, question: str, answer: str) -> List[str]:
+        return [
+            json.dumps({"role": "user", "content": question}),
+            json.dumps({"role": "assistant", "content": answer})
+        ]
+    
+    async def aget(self, conversation_id: str) -> List[dict]:
+        try:
+            messages = await self.async_redis_client.lrange(self._key(conversation_id), 0, -1)
+            return [json.loads(message) for message in messages]
+        except:
+            return []
+    
+    async def aappend(self, conversation_id: str, question: str, answer: str):
+        key = self._key(conversation_id)
+        try:
+            pipe = self.async_redis_client.pipeline()
+            pipe.rpush(key, *self._encode_turn(question, answer))
+            pipe.ltrim(key, -self.max_messages, -1)
+            pipe.expire(key, self.ttl)
+            await pipe.execute()
+        except:
+            pass
+
+def create_conversation_store(cache_service):
+    """Conversation store for the configured backend, falling back to memory without Redis"""
+    if settings.conversation_backend == "redis":
+        if cache_service.enabled:
+            return RedisConversationStore(
+                cache_service.async_redis_client,
+                max_messages=settings.conversation_max_messages,
+                ttl=settings.conversation_ttl
+            )
+        logger.warning("Redis not available, using in-memory conversation store")
+    return InMemoryConversationStore(
+        max_conversations=settings.conversation_max_conversations,
+        max_messages=settings.conversation_max_messages,
+        ttl=settings.conversation_ttl
+    )
@@ -1,11 +1,17 @@
+import json
+import logging
 import os
-from typing import List
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, Iterator, List, Optional, Set, Tuple
 from PyPDF2 import PdfReader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
+from app.services.pdf_extraction import count_pdf_pages, extract_pdf_pages
 from app.config import get_settings
 
 settings = get_settings()
+logger = logging.getLogger(__name__)
 
 class DocumentLoader:
     def __init__(self):
@@ -31,36 +37,144 @@ class DocumentLoader:
                         }
                     ))
         except Exception as e:
-            print(f"Error loading PDF {file_path}: {e}")
+            logger.error("Error loading PDF %s: %s", file_path, e)
         return documents
     
     def load_text(self, file_path: str) -> List[Document]:
         """Load text file"""
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                text = f.read()
-            return [Document(
-                page_content=text,
-                metadata={"source": os.path.basename(file_path)}
-            )]
+            return self._read_text(file_path)
         except Exception as e:
-            print(f"Error loading text file {file_path}: {e}")
+            logger.error("Error loading text file %s: %s", file_path, e)
             return []
     
+    def _read_text(self, file_path: str) -> List[Document]:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            text = f.read()
+        return [Document(
+            page_content=text,
+            metadata={"source": os.path.basename(file_path)}
+        )]
+    
+    def list_files(self, directory: str) -> List[str]:
+        """List supported document filenames in a directory"""
+        return sorted(
+            filename for filename in os.listdir(directory)
+            if filename.endswith('.pdf') or filename.endswith('.txt')
+        )
+    
+    def load_tags(self, directory: str) -> Dict[str, List[str]]:
+        """Tags per document filename, from the directory's tags file if there is one"""
+        path = os.path.join(directory, settings.document_tags_file)
+        if not os.path.exists(path):
+            return {}
+        try:
+            with open(path) as f:
+                tags = json.load(f)
+            return {str(filename): [str(tag) for tag in file_tags] for filename, file_tags in tags.items()}
+        except Exception as e:
+            logger.error("Error loading document tags %s: %s", path, e)
+            return {}
+    
+    def load_file(self, file_path: str) -> List[Document]:
+        """Load a single supported document"""
+        if file_path.endswith('.pdf'):
+            return self.load_pdf(file_path)
+        elif file_path.endswith('.txt'):
+            return self.load_text(file_path)
+        return []
+    
     def load_documents_from_directory(self, directory: str) -> List[Document]:
         """Load all documents from a directory"""
         all_documents = []
         
-        for filename in os.listdir(directory):
-            file_path = os.path.join(directory, filename)
-            
-            if filename.endswith('.pdf'):
-                all_documents.extend(self.load_pdf(file_path))
-            elif filename.endswith('.txt'):
-                all_documents.extend(self.load_text(file_path))
+        for filename in self.list_files(directory):
+            all_documents.extend(self.load_file(os.path.join(directory, filename)))
         
         return all_documents
     
     def split_documents(self, documents: List[Document]) -> List[Document]:
         """Split documents into chunks"""
-        return self.text_splitter.split_documents(documents)
\ No newline at end of file
+        return self.text_splitter.split_documents(documents)
+    
+    def iter_documents(self, file_paths: List[str], failed: Optional[Set[str]] = None) -> Iterator[Tuple[str, Document]]:
+        """Stream (file path, page document) pairs, extracting PDF pages in a process pool.
+        
+        Pages are yielded as soon as their batch finishes, in completion order. At most
+        two page batches per worker are in flight, so memory stays bounded by the pool
+        size rather than the corpus size. Files that could not be read, or only in
+        part, are logged and added to `failed`.
+        """
+        if failed is None:
+            failed = set()
+        workers = settings.ingest_workers or os.cpu_count() or 1
+        page_batch = settings.ingest_page_batch_size
+        
+        tasks = []
+        for file_path in file_paths:
+            if file_path.endswith('.pdf'):
+                try:
+                    page_count = count_pdf_pages(file_path)
+                except Exception as e:
+                    logger.error("Error loading PDF %s: %s", file_path, e)
+                    failed.add(file_path)
+                    continue
+                tasks.extend((file_path, start, start + page_batch) for start in range(0, page_count, page_batch))
+            elif file_path.endswith('.txt'):
+                try:
+                    docs = self._read_text(file_path)
+                except Exception as e:
+                    logger.error("Error loading text file %s: %s", file_path, e)
+                    failed.add(file_path)
+                    continue
+                for doc in docs:
+                    yield file_path, doc
+        
+        if workers <= 1:
+            for file_path, start, end in tasks:
+                try:
+                    pages = extract_pdf_pages(file_path, start, end)
+                except Exception as e:
+                    logger.error("Error loading PDF %s pages %d-%d: %s", file_path, start + 1, end, e)
+                    failed.add(file_path)
+                    continue
+                for doc in self._page_documents(file_path, pages):
+                    yield file_path, doc
+            return
+        
+        with ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn")) as pool:
+            pending = {}
+            task_iter = iter(tasks)
+            while True:
+                while len(pending) < workers * 2:
+                    task = next(task_iter, None)
+                    if task is None:
+                        break
+                    pending[pool.submit(extract_pdf_pages, *task)] = task
+                if not pending:
+                    break
+                
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    file_path, start, end = pending.pop(future)
+                    try:
+                        pages = future.result()
+                    except Exception as e:
+                        logger.error("Error loading PDF %s pages %d-%d: %s", file_path, start + 1, end, e)
+                        failed.add(file_path)
+                        continue
+                    for doc in self._page_documents(file_path, pages):
+                        yield file_path, doc
+    
+    def _page_documents(self, file_path: str, pages: List[Tuple[int, str]]) -> List[Document]:
+        return [
+            Document(
+                page_content=text,
+                metadata={
+                    "source": os.path.basename(file_path),
+                    "page": page_num
+                }
+            )
+            for page_num, text in pages
+        ]
+
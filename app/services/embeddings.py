@@ -1,18 +1,181 @@
-from sentence_transformers import SentenceTransformer
-from typing import List
+from concurrent.futures import Executor, Future
+from typing import Callable, List, Optional
+import asyncio
+import logging
+import queue
+import threading
+import time
 import numpy as np
+from app.services.errors import ServiceUnavailableError
+from app.services.metrics import EMBEDDING_BATCH_CONFIG, EMBEDDING_BATCH_SIZE, EMBEDDING_QUEUE_DEPTH
 from app.config import get_settings
 
 settings = get_settings()
+logger = logging.getLogger(__name__)
+
+class EmbeddingOverloadedError(ServiceUnavailableError):
+    """The query embedding queue is full"""
+    status_code = 429
+
+class QueryEmbeddingBatcher:
+    """Collects concurrent query embeddings into a single encode call.
+    
+    Callers submit a text and get a Future back. A worker thread takes the first
+    waiting query, keeps collecting for up to `batch_window` seconds or until
+    `max_batch_size` queries are queued, encodes the batch once and routes each
+    vector back to its caller.
+    """
+    
+    def __init__(self, encode_fn: Callable[[List[str]], np.ndarray], max_batch_size: int, batch_window: float, max_queue_size: int):
+        self._encode = encode_fn
+        self.max_batch_size = max_batch_size
+        self.batch_window = batch_window
+        self.max_queue_size = max_queue_size
+        self._queue: queue.Queue = queue.Queue(maxsize=max_queue_size)
+        self._stats_lock = threading.Lock()
+        self._batches_processed = 0
+        self._queries_processed = 0
+        self._last_batch_size = 0
+        self._max_queue_depth = 0
+        self._worker = threading.Thread(target=self._run, name="embedding-batcher", daemon=True)
+        self._worker.start()
+        
+        EMBEDDING_BATCH_CONFIG.labels(setting="batch_window_seconds").set(batch_window)
+        EMBEDDING_BATCH_CONFIG.labels(setting="max_batch_size").set(max_batch_size)
+        EMBEDDING_BATCH_CONFIG.labels(setting="max_queue_size").set(max_queue_size)
+    
+    def submit(self, text: str, block: bool = True) -> Future:
+        """Queue a query for embedding; raises queue.Full when non-blocking and saturated"""
+        future: Future = Future()
+        self._queue.put((text, future), block=block)
+        depth = self._queue.qsize()
+        EMBEDDING_QUEUE_DEPTH.set(depth)
+        with self._stats_lock:
+            self._max_queue_depth = max(self._max_queue_depth, depth)
+        return future
+    
+    def _collect_batch(self) -> list:
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.batch_window
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        EMBEDDING_QUEUE_DEPTH.set(self._queue.qsize())
+        return batch
+    
+    def _run(self):
+        while True:
+            try:
+                self._process(self._collect_batch())
+            except Exception:
+                # One bad batch must not take every later query down with it
+                logger.exception("Embedding batch failed")
+    
+    def _process(self, batch: list):
+        # Callers that gave up while queued (e.g. a disconnected client) are dropped;
+        # the rest can no longer be cancelled, so resolving them below is safe
+        batch = [(text, future) for text, future in batch if future.set_running_or_notify_cancel()]
+        if not batch:
+            return
+        texts = [text for text, _ in batch]
+        try:
+            vectors = self._encode(texts)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+        
+        for (_, future), vector in zip(batch, vectors):
+            future.set_result(vector)
+        EMBEDDING_BATCH_SIZE.observe(len(batch))
+        
+        with self._stats_lock:
+            self._batches_processed += 1
+            self._queries_processed += len(batch)
+            self._last_batch_size = len(batch)
+    
+    def stats(self) -> dict:
+        """Batching configuration and counters"""
+        with self._stats_lock:
+            return {
+                "batch_window_ms": self.batch_window * 1000,
+                "max_batch_size": self.max_batch_size,
+                "max_queue_size": self.max_queue_size,
+                "queue_depth": self._queue.qsize(),
+                "max_queue_depth": self._max_queue_depth,
+                "batches_processed": self._batches_processed,
+                "queries_processed": self._queries_processed,
+                "last_batch_size": self._last_batch_size,
+                "avg_batch_size": (
+                    self._queries_processed / self._batches_processed
+                    if self._batches_processed else 0.0
+                ),
+            }
+
+def load_embedding_model():
+    """Load the configured embedding backend; PyTorch is only imported for the torch backend"""
+    if settings.embedding_backend in ("onnx", "onnx_int8"):
+        from app.services.onnx_embeddings import load_onnx_encoder
+        return load_onnx_encoder(
+            settings.embedding_model,
+            settings.embedding_onnx_dir,
+            quantized=settings.embedding_backend == "onnx_int8",
+            threads=settings.embedding_onnx_threads
+        )
+    if settings.embedding_backend != "torch":
+        raise ValueError(f"Unknown embedding backend: {settings.embedding_backend}")
+    from sentence_transformers import SentenceTransformer
+    return SentenceTransformer(settings.embedding_model)
 
 class EmbeddingService:
     def __init__(self):
-        self.model = SentenceTransformer(settings.embedding_model)
+        self.model = load_embedding_model()
+        self.batcher = None
+        if settings.embedding_batching_enabled:
+            self.batcher = QueryEmbeddingBatcher(
+                self._encode_queries,
+                max_batch_size=settings.embedding_max_batch_size,
+                batch_window=settings.embedding_batch_window_ms / 1000,
+                max_queue_size=settings.embedding_batch_queue_size
+            )
+    
+    def _encode_queries(self, queries: List[str]) -> np.ndarray:
+        return self.model.encode(queries, batch_size=len(queries))
     
-    def embed_documents(self, texts: List[str]) -> np.ndarray:
+    def embed_documents(self, texts: List[str], show_progress_bar: bool = True) -> np.ndarray:
         """Generate embeddings for multiple documents"""
-        return self.model.encode(texts, show_progress_bar=True)
+        return self.model.encode(texts, show_progress_bar=show_progress_bar)
     
     def embed_query(self, query: str) -> np.ndarray:
         """Generate embedding for a single query"""
-        return self.model.encode([query])[0]
\ No newline at end of file
+        if self.batcher is None:
+            return self.model.encode([query])[0]
+        return self.batcher.submit(query).result()
+    
+    def embed_queries(self, queries: List[str]) -> np.ndarray:
+        """Generate embeddings for many queries in a single encode call"""
+        return self.model.encode(queries, batch_size=settings.embedding_max_batch_size)
+    
+    async def aembed_query(self, query: str, executor: Optional[Executor] = None) -> np.ndarray:
+        """Generate embedding for a single query without blocking the event loop"""
+        if self.batcher is None:
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(executor, self.embed_query, query)
+        try:
+            future = self.batcher.submit(query, block=False)
+        except queue.Full:
+            # A full queue drains in about this many batch windows
+            batches = self.batcher.max_queue_size / self.batcher.max_batch_size
+            raise EmbeddingOverloadedError("Embedding queue is full, retry later", batches * self.batcher.batch_window)
+        return await asyncio.wrap_future(future)
+    
+    def stats(self) -> dict:
+        """Query embedding batching metrics"""
+        if self.batcher is None:
+            return {"backend": settings.embedding_backend, "batching_enabled": False}
+        return {"backend": settings.embedding_backend, "batching_enabled": True, **self.batcher.stats()}
@@ -0,0 +1,13 @@
+import math
+
+class ServiceUnavailableError(Exception):
+    """A dependency can't take the request right now; clients should retry after `retry_after` seconds"""
+    status_code = 503
+    
+    def __init__(self, message: str, retry_after: float):
+        super().__init__(message)
+        self.retry_after = retry_after
+    
+    @property
+    def retry_after_header(self) -> str:
+        return str(max(1, math.ceil(self.retry_after)))
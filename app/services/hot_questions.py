@@ -0,0 +1,132 @@
+import hashlib
+import logging
+import time
+from typing import List, Optional, Tuple
+import numpy as np
+from app.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+# Longer questions are one-offs, not worth a slot in the top-N set
+MAX_TRACKED_LENGTH = 1000
+
+# Counts a question in every sketch row and re-ranks it in the top-N set with
+# its new estimate (the smallest of its counters)
+_RECORD_SCRIPT = """
+local estimate = nil
+for i = 3, #ARGV do
+    local count = redis.call("hincrby", KEYS[1], ARGV[i], 1)
+    if estimate == nil or count < estimate then
+        estimate = count
+    end
+end
+redis.call("zadd", KEYS[2], estimate, ARGV[1])
+local top_n = tonumber(ARGV[2])
+if redis.call("zcard", KEYS[2]) > top_n then
+    redis.call("zremrangebyrank", KEYS[2], 0, -(top_n + 1))
+end
+return estimate
+"""
+
+# Halves every count once per decay period, whichever worker gets there first
+_DECAY_SCRIPT = """
+local now = tonumber(ARGV[1])
+local last = tonumber(redis.call("get", KEYS[3]) or "0")
+if now - last < tonumber(ARGV[2]) then
+    return 0
+end
+redis.call("set", KEYS[3], ARGV[1])
+if last == 0 then
+    return 0
+end
+local counters = redis.call("hgetall", KEYS[1])
+for i = 1, #counters, 2 do
+    local halved = math.floor(tonumber(counters[i + 1]) / 2)
+    if halved > 0 then
+        redis.call("hset", KEYS[1], counters[i], halved)
+    else
+        redis.call("hdel", KEYS[1], counters[i])
+    end
+end
+local top = redis.call("zrange", KEYS[2], 0, -1, "WITHSCORES")
+for i = 1, #top, 2 do
+    local halved = math.floor(tonumber(top[i + 1]) / 2)
+    if halved > 0 then
+        redis.call("zadd", KEYS[2], halved, top[i])
+    else
+        redis.call("zrem", KEYS[2], top[i])
+    end
+end
+return 1
+"""
+
+class HotQuestionTracker:
+    """Approximate question frequencies, shared by every worker through Redis.
+    
+    A Count-Min sketch (`depth` rows of `width` counters in one hash) bounds
+    memory however many distinct questions arrive; its estimates only ever
+    overcount. The `top_n` most frequent questions are kept in a sorted set by
+    estimate. Counts are halved every `decay_seconds`.
+    """
+    
+    def __init__(self, async_redis_client, width: int, depth: int, top_n: int, decay_seconds: int):
+        if not 1 <= depth <= 16:
+            raise ValueError(f"Sketch depth must be between 1 and 16, got {depth}")
+        self.async_redis_client = async_redis_client
+        self.width = width
+        self.depth = depth
+        self.top_n = top_n
+        self.decay_seconds = decay_seconds
+        self.keys = ["rag:hot:sketch", "rag:hot:top", "rag:hot:decayed_at"]
+        self._arecord = async_redis_client.register_script(_RECORD_SCRIPT)
+        self._adecay = async_redis_client.register_script(_DECAY_SCRIPT)
+        self._scripts_loaded = False
+    
+    async def _aload_scripts(self):
+        """Load the scripts once, so the first EVALSHA doesn't need a NOSCRIPT round trip"""
+        if self._scripts_loaded:
+            return
+        for script in (_RECORD_SCRIPT, _DECAY_SCRIPT):
+            await self.async_redis_client.script_load(script)
+        self._scripts_loaded = True
+    
+    def _counters(self, question: str) -> List[str]:
+        """Sketch counter of the question in each row"""
+        digest = hashlib.blake2b(question.encode(), digest_size=4 * self.depth).digest()
+        columns = np.frombuffer(digest, dtype='<u4') % self.width
+        return [f"{row}:{column}" for row, column in enumerate(columns.tolist())]
+    
+    def _args(self, question: str) -> list:
+        return [question, self.top_n, *self._counters(question)]
+    
+    async def arecord(self, question: str):
+        if len(question) > MAX_TRACKED_LENGTH:
+            return
+        try:
+            await self._aload_scripts()
+            await self._arecord(keys=self.keys[:2], args=self._args(question))
+        except Exception as e:
+            logger.debug("Could not record question frequency: %s", e)
+    
+    async def atop(self, n: Optional[int] = None) -> List[Tuple[str, int]]:
+        """Most frequent questions with their estimated counts, most frequent first"""
+        top = await self.async_redis_client.zrevrange(self.keys[1], 0, (n or self.top_n) - 1, withscores=True)
+        return [(question.decode(), int(count)) for question, count in top]
+    
+    async def adecay(self) -> bool:
+        """Halve all counts if a decay period has passed; returns whether it did"""
+        await self._aload_scripts()
+        return bool(await self._adecay(keys=self.keys, args=[time.time(), self.decay_seconds]))
+
+def create_hot_question_tracker(cache_service) -> Optional[HotQuestionTracker]:
+    """Question frequency tracker, or None when disabled or without Redis"""
+    if not settings.hot_questions_enabled or not cache_service.enabled:
+        return None
+    return HotQuestionTracker(
+        cache_service.async_redis_client,
+        width=settings.hot_questions_sketch_width,
+        depth=settings.hot_questions_sketch_depth,
+        top_n=settings.hot_questions_top_n,
+        decay_seconds=settings.hot_questions_decay_seconds
+    )
@@ -0,0 +1,125 @@
+import math
+import faiss
+import numpy as np
+from typing import Tuple
+
+# Index types selectable through Settings.vector_index_type
+INDEX_TYPES = ("flat", "hnsw", "ivf_flat", "ivf_pq", "sq_fp16", "sq8")
+
+# faiss recommends at least this many training points per k-means centroid
+TRAINING_POINTS_PER_CENTROID = 39
+
+def auto_nlist(num_vectors: int) -> int:
+    """Default number of IVF lists for a corpus size"""
+    return max(1, int(math.sqrt(num_vectors)))
+
+def factory_string(index_type: str, num_vectors: int, hnsw_m: int = 32, nlist: int = 0, pq_m: int = 48, pq_nbits: int = 8) -> str:
+    """faiss.index_factory description for an index type, ID-mapped for removal.
+    
+    IVF indexes store vector IDs themselves, so they can keep a hashtable direct
+    map for reconstruction alongside removal; the others are wrapped in IDMap2.
+    """
+    nlist = nlist or auto_nlist(num_vectors)
+    descriptions = {
+        "flat": "Flat",
+        "hnsw": f"HNSW{hnsw_m}",
+        "ivf_flat": f"IVF{nlist},Flat",
+        "ivf_pq": f"IVF{nlist},PQ{pq_m}x{pq_nbits}",
+        "sq_fp16": "SQfp16",
+        "sq8": "SQ8",
+    }
+    if index_type not in descriptions:
+        raise ValueError(f"Unknown vector index type '{index_type}', expected one of {INDEX_TYPES}")
+    if index_type in ("ivf_flat", "ivf_pq"):
+        return descriptions[index_type]
+    return f"IDMap2,{descriptions[index_type]}"
+
+def min_training_points(index_type: str, num_vectors: int, nlist: int = 0, pq_nbits: int = 8) -> int:
+    """Vectors needed before an index type can be trained"""
+    nlist = nlist or auto_nlist(num_vectors)
+    if index_type == "ivf_flat":
+        return nlist * TRAINING_POINTS_PER_CENTROID
+    if index_type == "ivf_pq":
+        return max(nlist, 2 ** pq_nbits) * TRAINING_POINTS_PER_CENTROID
+    if index_type == "sq8":
+        return 1
+    return 0
+
+def create_index(dimension: int, index_type: str, num_vectors: int = 0, **params) -> faiss.Index:
+    index = faiss.index_factory(dimension, factory_string(index_type, num_vectors, **params))
+    if isinstance(index, faiss.IndexIVF):
+        # Vectors stay reconstructable by ID (for context selection); unlike an array map this allows remove_ids
+        index.set_direct_map_type(faiss.DirectMap.Hashtable)
+    return index
+
+def _inner(index: faiss.Index) -> faiss.Index:
+    """The index doing the work, below an IDMap2 wrapper if there is one"""
+    return faiss.downcast_index(index.index if isinstance(index, faiss.IndexIDMap) else index)
+
+def configure_search(index: faiss.Index, nprobe: int, ef_search: int):
+    """Apply query-time parameters to whichever structure the index uses"""
+    inner = _inner(index)
+    if isinstance(inner, faiss.IndexIVF):
+        inner.nprobe = nprobe
+    elif isinstance(inner, faiss.IndexHNSW):
+        inner.hnsw.efSearch = ef_search
+
+def search_parameters(index: faiss.Index, selector: faiss.IDSelector, nprobe: int, ef_search: int) -> faiss.SearchParameters:
+    """Parameters restricting a search to `selector`, with the same query-time settings as configure_search"""
+    inner = _inner(index)
+    if isinstance(inner, faiss.IndexIVF):
+        return faiss.SearchParametersIVF(sel=selector, nprobe=nprobe)
+    if isinstance(inner, faiss.IndexHNSW):
+        return faiss.SearchParametersHNSW(sel=selector, efSearch=ef_search)
+    return faiss.SearchParameters(sel=selector)
+
+def read_index(path: str, mmap: bool = False) -> faiss.Index:
+    """Read an index from disk; mapped, its vectors and lists stay in the page cache instead of the heap.
+    
+    A mapped index is read-only: faiss aborts the process (rather than raising)
+    if vectors are added to or removed from it.
+    """
+    if not mmap:
+        return faiss.read_index(path)
+    # Older faiss builds can only map IVF lists
+    flag = getattr(faiss, "IO_FLAG_MMAP_IFC", faiss.IO_FLAG_MMAP)
+    return faiss.read_index(path, flag | faiss.IO_FLAG_READ_ONLY)
+
+def export_vectors(index: faiss.Index) -> Tuple[np.ndarray, np.ndarray]:
+    """(ids, vectors) of an ID-mapped index; lossy for quantized indexes"""
+    if not isinstance(index, faiss.IndexIDMap):
+        # IVF with its own IDs, read back list by list and reconstructed through the direct map
+        ivf = faiss.downcast_index(index)
+        invlists = ivf.invlists
+        ids = np.concatenate([np.empty(0, dtype='int64')] + [
+            faiss.rev_swig_ptr(invlists.get_ids(list_no), invlists.list_size(list_no)).copy()
+            for list_no in range(ivf.nlist) if invlists.list_size(list_no)
+        ]).astype('int64')
+        if len(ids) == 0:
+            return ids, np.empty((0, index.d), dtype='float32')
+        return ids, ivf.reconstruct_batch(ids)
+    ids = faiss.vector_to_array(index.id_map).astype('int64')
+    inner = faiss.downcast_index(index.index)
+    if inner.ntotal == 0:
+        return ids, np.empty((0, index.d), dtype='float32')
+    if isinstance(inner, faiss.IndexIVF):
+        inner.make_direct_map()
+        vectors = inner.reconstruct_n(0, inner.ntotal)
+        # Array direct maps block remove_ids, so drop it again
+        inner.make_direct_map(False)
+    else:
+        vectors = inner.reconstruct_n(0, inner.ntotal)
+    return ids, vectors
+
+def index_type_of(index: faiss.Index) -> str:
+    """Index type name of an ID-mapped index"""
+    inner = _inner(index)
+    if isinstance(inner, faiss.IndexHNSW):
+        return "hnsw"
+    if isinstance(inner, faiss.IndexIVFPQ):
+        return "ivf_pq"
+    if isinstance(inner, faiss.IndexIVF):
+        return "ivf_flat"
+    if isinstance(inner, faiss.IndexScalarQuantizer):
+        return "sq_fp16" if inner.sq.qtype == faiss.ScalarQuantizer.QT_fp16 else "sq8"
+    return "flat"
@@ -0,0 +1,84 @@
+import logging
+import os
+import shutil
+import time
+import uuid
+from typing import Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+POINTER_FILE = "CURRENT"
+GENERATIONS_DIR = "generations"
+# lexical.npz and metadata.npz are the lexical and metadata arrays as saved before they became directories
+INDEX_FILES = ("faiss.index", "chunks.db", "lexical", "metadata", "lexical.npz", "metadata.npz", "manifest.json")
+
+# Index generations
+#
+# Every rebuild writes a complete index into its own directory under
+# <root>/generations/ and is never modified once published. <root>/CURRENT
+# names the live generation and is replaced atomically, so a reader sees
+# either the old generation or the new one, never a half-written index.
+# Indexes saved before generations existed live directly in <root>.
+
+def generation_path(root: str, generation: str) -> str:
+    return os.path.join(root, GENERATIONS_DIR, generation)
+
+def current_generation(root: str) -> Optional[str]:
+    """Name of the published generation, or None for the legacy single-directory layout"""
+    try:
+        with open(os.path.join(root, POINTER_FILE)) as f:
+            generation = f.read().strip()
+    except FileNotFoundError:
+        return None
+    return generation if generation and os.path.isdir(generation_path(root, generation)) else None
+
+def current_path(root: str) -> str:
+    """Directory holding the live index files"""
+    generation = current_generation(root)
+    return generation_path(root, generation) if generation else root
+
+def create_generation(root: str, source_path: Optional[str] = None) -> Tuple[str, str]:
+    """Create an unpublished generation, seeded with a copy of the index files in `source_path`"""
+    # Names sort by creation time, to the nanosecond so two builds in the same
+    # second keep their order ("-" sorts before ".", so older names still sort first)
+    created_ns = time.time_ns()
+    seconds, nanoseconds = divmod(created_ns, 1_000_000_000)
+    generation = f"{time.strftime('%Y%m%dT%H%M%S', time.localtime(seconds))}.{nanoseconds:09d}-{uuid.uuid4().hex[:8]}"
+    path = generation_path(root, generation)
+    os.makedirs(path)
+    if source_path:
+        for filename in INDEX_FILES:
+            source = os.path.join(source_path, filename)
+            if os.path.isdir(source):
+                shutil.copytree(source, os.path.join(path, filename))
+            elif os.path.exists(source):
+                shutil.copy2(source, os.path.join(path, filename))
+    return generation, path
+
+def publish_generation(root: str, generation: str):
+    """Atomically point CURRENT at a generation"""
+    tmp_path = os.path.join(root, f"{POINTER_FILE}.{uuid.uuid4().hex}.tmp")
+    with open(tmp_path, 'w') as f:
+        f.write(generation)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, os.path.join(root, POINTER_FILE))
+    logger.info("Published index generation %s", generation)
+
+def discard_generation(root: str, generation: str):
+    shutil.rmtree(generation_path(root, generation), ignore_errors=True)
+
+def prune_generations(root: str, keep: int):
+    """Delete all but the newest `keep` generations, never the published one.
+    
+    Workers still serving a pruned generation keep their open files readable.
+    """
+    generations_dir = os.path.join(root, GENERATIONS_DIR)
+    if not os.path.isdir(generations_dir):
+        return
+    current = current_generation(root)
+    generations = sorted(os.listdir(generations_dir), reverse=True)
+    for generation in generations[max(keep, 1):]:
+        if generation != current:
+            discard_generation(root, generation)
+            logger.info("Pruned index generation %s", generation)
@@ -0,0 +1,143 @@
+import json
+import logging
+import os
+import re
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+try:
+    import fcntl
+except ImportError:
+    # No flock on Windows; jobs are then only serialized within one worker
+    fcntl = None
+
+logger = logging.getLogger(__name__)
+
+_JOB_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+def _modified_time(path: str) -> float:
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return 0.0
+
+# Runs with a progress callback and returns the job result
+JobFunction = Callable[[Callable[[Dict], None]], Dict]
+
+class IndexJobManager:
+    """Runs index builds as background jobs, one at a time.
+    
+    A job holds an exclusive file lock next to the index for its whole run, so
+    only one worker process builds at a time. Job state is written to a JSON
+    file in the same directory, so any worker can report a job's progress.
+    """
+    
+    def __init__(self, root: str, max_jobs: int = 50):
+        self.jobs_dir = os.path.join(root, "jobs")
+        self.lock_path = os.path.join(root, "index.lock")
+        self.max_jobs = max_jobs
+        os.makedirs(self.jobs_dir, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="index-job")
+        self._running = False
+    
+    def _job_file(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+    
+    def _write(self, job: Dict):
+        tmp_path = f"{self._job_file(job['job_id'])}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump(job, f)
+        os.replace(tmp_path, self._job_file(job["job_id"]))
+    
+    def _acquire(self):
+        """Take the cross-process job lock, or return None if another job holds it"""
+        if self._running:
+            return None
+        lock_file = open(self.lock_path, 'a')
+        if fcntl is not None:
+            try:
+                fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            except BlockingIOError:
+                lock_file.close()
+                return None
+        self._running = True
+        return lock_file
+    
+    def start(self, kind: str, fn: JobFunction) -> Optional[Dict]:
+        """Start a job in the background; returns None while another job is running"""
+        lock_file = self._acquire()
+        if lock_file is None:
+            return None
+        
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "kind": kind,
+            "status": "queued",
+            "created_at": time.time(),
+            "started_at": None,
+            "finished_at": None,
+            "progress": {},
+            "result": None,
+            "error": None
+        }
+        self._write(job)
+        self._executor.submit(self._run, job, fn, lock_file)
+        return dict(job)
+    
+    def _run(self, job: Dict, fn: JobFunction, lock_file):
+        def progress(update: Dict):
+            job["progress"] = update
+            self._write(job)
+        
+        job["status"] = "running"
+        job["started_at"] = time.time()
+        self._write(job)
+        try:
+            job["result"] = fn(progress)
+            job["status"] = "succeeded"
+        except Exception as e:
+            logger.exception("Index job %s failed", job["job_id"])
+            job["status"] = "failed"
+            job["error"] = str(e)
+        finally:
+            job["finished_at"] = time.time()
+            self._write(job)
+            self._running = False
+            lock_file.close()
+            self._prune()
+    
+    def get(self, job_id: str) -> Optional[Dict]:
+        if not _JOB_ID_PATTERN.match(job_id):
+            return None
+        try:
+            with open(self._job_file(job_id)) as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+    
+    def _job_files(self) -> List[str]:
+        """Job files, newest first"""
+        paths = [
+            os.path.join(self.jobs_dir, filename)
+            for filename in os.listdir(self.jobs_dir) if filename.endswith(".json")
+        ]
+        return sorted(paths, key=_modified_time, reverse=True)
+    
+    def list(self, limit: int = 20) -> List[Dict]:
+        jobs = []
+        for path in self._job_files()[:limit]:
+            try:
+                with open(path) as f:
+                    jobs.append(json.load(f))
+            except (FileNotFoundError, json.JSONDecodeError):
+                continue
+        return sorted(jobs, key=lambda job: job["created_at"], reverse=True)
+    
+    def _prune(self):
+        for path in self._job_files()[self.max_jobs:]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
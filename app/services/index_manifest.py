@@ -0,0 +1,63 @@
+import hashlib
+import json
+import os
+from typing import Dict, List, Tuple
+from langchain_core.documents import Document
+
+def hash_file(file_path: str) -> str:
+    """Content hash of a source file"""
+    digest = hashlib.sha256()
+    with open(file_path, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+def hash_chunk(chunk: Document) -> str:
+    """Content hash of a chunk, including the metadata stored alongside it"""
+    digest = hashlib.sha256()
+    digest.update(json.dumps(chunk.metadata, sort_keys=True, default=str).encode())
+    digest.update(b'\0')
+    digest.update(chunk.page_content.encode())
+    return digest.hexdigest()
+
+class IndexManifest:
+    """Tracks which files and chunks are in the vector store.
+    
+    For every indexed file it records the file content hash and a list of
+    (chunk hash, vector id) pairs, so re-indexing only embeds new chunks and
+    removes the vectors of changed or deleted ones.
+    """
+    
+    def __init__(self):
+        self.files: Dict[str, dict] = {}
+    
+    def file_hash(self, filename: str) -> str:
+        entry = self.files.get(filename)
+        return entry["hash"] if entry else None
+    
+    def chunks(self, filename: str) -> List[Tuple[str, int]]:
+        entry = self.files.get(filename)
+        return [tuple(chunk) for chunk in entry["chunks"]] if entry else []
+    
+    def set_file(self, filename: str, file_hash: str, chunks: List[Tuple[str, int]]):
+        self.files[filename] = {"hash": file_hash, "chunks": [list(chunk) for chunk in chunks]}
+    
+    def remove_file(self, filename: str):
+        self.files.pop(filename, None)
+    
+    def clear(self):
+        self.files = {}
+    
+    def save(self, path: str):
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({"files": self.files}, f)
+        os.replace(tmp_path, path)
+    
+    def load(self, path: str) -> bool:
+        if not os.path.exists(path):
+            self.files = {}
+            return False
+        with open(path) as f:
+            self.files = json.load(f)["files"]
+        return True
@@ -0,0 +1,168 @@
+import re
+import threading
+import numpy as np
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Tuple
+from app.services.array_files import load_arrays, save_arrays
+from app.services.metadata_index import IdFilter
+
+# Keeps dosages, section numbers and hyphenated drug names as single terms
+_TOKEN_PATTERN = re.compile(r"\w+(?:[.\-/]\w+)*")
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN_PATTERN.findall(text.lower())
+
+class BM25Index:
+    """In-process BM25 inverted index over chunk text, keyed by vector ID.
+    
+    Searches run on a compact CSR layout: the vocabulary maps each term to a
+    slice of flat postings arrays (internal document index, term frequency).
+    Additions and removals go to a mutable term -> {vector id: tf} form, which
+    is compacted back into arrays on the next search or save.
+    """
+    
+    def __init__(self, k1: float = 1.5, b: float = 0.75):
+        self.k1 = k1
+        self.b = b
+        # Compact, searchable form
+        self._vocab: Dict[str, int] = {}
+        self._offsets = np.zeros(1, dtype='int64')
+        self._postings = np.zeros(0, dtype='int32')
+        self._term_freqs = np.zeros(0, dtype='float32')
+        self._doc_ids = np.zeros(0, dtype='int64')
+        self._doc_lens = np.zeros(0, dtype='float32')
+        # Mutable form, only materialized while the index is being changed
+        self._terms: Optional[Dict[str, Dict[int, int]]] = None
+        self._lengths: Optional[Dict[int, int]] = None
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self._lengths) if self._lengths is not None else len(self._doc_ids)
+    
+    def _thaw(self):
+        if self._terms is not None:
+            return
+        self._terms = {}
+        for term, slot in self._vocab.items():
+            start, end = self._offsets[slot], self._offsets[slot + 1]
+            doc_ids = self._doc_ids[self._postings[start:end]].tolist()
+            self._terms[term] = dict(zip(doc_ids, self._term_freqs[start:end].astype(int).tolist()))
+        self._lengths = dict(zip(self._doc_ids.tolist(), self._doc_lens.astype(int).tolist()))
+    
+    def _compact(self):
+        if self._terms is None:
+            return
+        doc_ids = np.fromiter(self._lengths.keys(), dtype='int64', count=len(self._lengths))
+        position = {doc_id: i for i, doc_id in enumerate(doc_ids.tolist())}
+        
+        vocab = {}
+        offsets = [0]
+        postings = []
+        term_freqs = []
+        for term, docs in self._terms.items():
+            if not docs:
+                continue
+            vocab[term] = len(vocab)
+            postings.extend(position[doc_id] for doc_id in docs)
+            term_freqs.extend(docs.values())
+            offsets.append(len(postings))
+        
+        self._vocab = vocab
+        self._offsets = np.asarray(offsets, dtype='int64')
+        self._postings = np.asarray(postings, dtype='int32')
+        self._term_freqs = np.asarray(term_freqs, dtype='float32')
+        self._doc_ids = doc_ids
+        self._doc_lens = np.fromiter(self._lengths.values(), dtype='float32', count=len(self._lengths))
+        self._terms = None
+        self._lengths = None
+    
+    def add(self, ids: Iterable[int], texts: Iterable[str]):
+        with self._lock:
+            self._thaw()
+            for doc_id, text in zip(ids, texts):
+                tokens = tokenize(text)
+                self._lengths[doc_id] = len(tokens)
+                for term, count in Counter(tokens).items():
+                    self._terms.setdefault(term, {})[doc_id] = count
+    
+    def remove(self, ids: Iterable[int]):
+        with self._lock:
+            self._thaw()
+            removed = set(ids) & self._lengths.keys()
+            if not removed:
+                return
+            for doc_id in removed:
+                del self._lengths[doc_id]
+            for docs in self._terms.values():
+                for doc_id in removed.intersection(docs):
+                    del docs[doc_id]
+    
+    def clear(self):
+        with self._lock:
+            self._terms = {}
+            self._lengths = {}
+            self._compact()
+    
+    def search(self, query: str, k: int, id_filter: Optional[IdFilter] = None) -> List[Tuple[int, float]]:
+        """Top-k (vector id, BM25 score) pairs, only among `id_filter`'s IDs if given"""
+        with self._lock:
+            self._compact()
+            vocab, offsets, postings = self._vocab, self._offsets, self._postings
+            term_freqs, doc_ids, doc_lens = self._term_freqs, self._doc_ids, self._doc_lens
+        if len(doc_ids) == 0:
+            return []
+        
+        num_docs = len(doc_ids)
+        avg_len = float(doc_lens.mean()) or 1.0
+        scores = np.zeros(num_docs, dtype='float32')
+        for term in set(tokenize(query)):
+            slot = vocab.get(term)
+            if slot is None:
+                continue
+            start, end = offsets[slot], offsets[slot + 1]
+            docs = postings[start:end]
+            tf = term_freqs[start:end]
+            df = end - start
+            idf = np.log1p((num_docs - df + 0.5) / (df + 0.5))
+            norm = self.k1 * (1 - self.b + self.b * doc_lens[docs] / avg_len)
+            scores[docs] += idf * tf * (self.k1 + 1) / (tf + norm)
+        
+        if id_filter is not None:
+            scores[~id_filter.contains(doc_ids)] = 0
+        matched = np.flatnonzero(scores)
+        if len(matched) == 0:
+            return []
+        if len(matched) > k:
+            matched = matched[np.argpartition(-scores[matched], k - 1)[:k]]
+        matched = matched[np.argsort(-scores[matched])]
+        return [(int(doc_ids[i]), float(scores[i])) for i in matched]
+    
+    def save(self, path: str):
+        with self._lock:
+            self._compact()
+        vocab = "\n".join(self._vocab).encode()
+        save_arrays(path, {
+            "vocab": np.frombuffer(vocab, dtype='uint8'),
+            "offsets": self._offsets,
+            "postings": self._postings,
+            "term_freqs": self._term_freqs,
+            "doc_ids": self._doc_ids,
+            "doc_lens": self._doc_lens
+        })
+    
+    def load(self, path: str, mmap: bool = False) -> bool:
+        """Load a saved index; with `mmap`, the postings stay mapped read-only until the index is changed"""
+        data = load_arrays(path, ("vocab", "offsets", "postings", "term_freqs", "doc_ids", "doc_lens"), mmap)
+        if data is None:
+            return False
+        with self._lock:
+            vocab = data["vocab"].tobytes().decode()
+            self._vocab = {term: i for i, term in enumerate(vocab.split("\n"))} if vocab else {}
+            self._offsets = data["offsets"]
+            self._postings = data["postings"]
+            self._term_freqs = data["term_freqs"]
+            self._doc_ids = data["doc_ids"]
+            self._doc_lens = data["doc_lens"]
+            self._terms = None
+            self._lengths = None
+        return True
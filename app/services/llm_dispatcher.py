@@ -0,0 +1,240 @@
+import asyncio
+import logging
+import random
+import threading
+import time
+from contextlib import asynccontextmanager
+from typing import Awaitable, Callable, Optional, TypeVar
+import groq
+from app.services.errors import ServiceUnavailableError
+from app.services.metrics import LLM_CIRCUIT_STATE, LLM_IN_FLIGHT, LLM_QUEUE_DEPTH, LLM_REJECTED, LLM_RETRIES
+from app.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+class LLMUnavailableError(ServiceUnavailableError):
+    """The LLM can't take the call right now; clients should retry after `retry_after` seconds"""
+
+class LLMOverloadedError(LLMUnavailableError):
+    """Every slot is busy and the queue is full, or the wait for a slot ran out"""
+    status_code = 429
+
+class CircuitOpenError(LLMUnavailableError):
+    """Calls are suspended after repeated provider failures"""
+
+def _is_retryable(error: Exception) -> bool:
+    # Rate limits, timeouts, dropped connections and 5xx; other 4xx are the caller's fault
+    return isinstance(error, (groq.RateLimitError, groq.APIConnectionError, groq.InternalServerError))
+
+def _counts_as_outage(error: Exception) -> bool:
+    # A rate limit means the provider is up, just busy
+    return _is_retryable(error) and not isinstance(error, groq.RateLimitError)
+
+def _retry_after(error: Exception) -> Optional[float]:
+    """Delay the provider asked for, in seconds, if any"""
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        # HTTP-date values are not worth parsing, fall back to our own backoff
+        return None
+
+class CircuitBreaker:
+    """Closed until `failure_threshold` consecutive failures, then open for `reset_seconds`.
+    
+    Once the open period ends, a single trial call is let through (half-open):
+    success closes the circuit, failure opens it again.
+    """
+    
+    def __init__(self, failure_threshold: int, reset_seconds: float):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.times_opened = 0
+        self._lock = threading.Lock()
+        LLM_CIRCUIT_STATE.set(0)
+    
+    def _set_state(self, state: str):
+        self.state = state
+        LLM_CIRCUIT_STATE.set({"closed": 0, "half_open": 1, "open": 2}[state])
+    
+    def before_call(self):
+        """Raise CircuitOpenError unless a call may go through now"""
+        with self._lock:
+            if self.state == "closed":
+                return
+            remaining = self.opened_at + self.reset_seconds - time.monotonic()
+            if self.state == "open" and remaining <= 0:
+                self._set_state("half_open")
+            if self.state == "half_open" and not self.trial_in_flight:
+                self.trial_in_flight = True
+                return
+            raise CircuitOpenError("LLM provider unavailable, calls suspended", max(remaining, 1.0))
+    
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.trial_in_flight = False
+            if self.state != "closed":
+                logger.info("LLM circuit closed")
+                self._set_state("closed")
+    
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.state == "half_open" or (self.state == "closed" and self.failures >= self.failure_threshold):
+                self.opened_at = time.monotonic()
+                self.times_opened += 1
+                self._set_state("open")
+                logger.warning("LLM circuit opened after %d consecutive failures", self.failures)
+    
+    def release(self):
+        """End a call that neither succeeded nor failed against the provider"""
+        with self._lock:
+            self.trial_in_flight = False
+    
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "state": self.state,
+                "consecutive_failures": self.failures,
+                "times_opened": self.times_opened,
+            }
+
+class LLMDispatcher:
+    """Admission control, retries and circuit breaking for LLM calls.
+    
+    At most `max_concurrency` calls run at once; up to `max_queue` more wait
+    for a slot, each for at most `queue_timeout` seconds. Anything beyond that
+    is rejected with LLMOverloadedError instead of piling up. Rate limits,
+    timeouts and 5xx responses are retried with jittered exponential backoff,
+    honouring the provider's Retry-After. Provider outages open the circuit
+    breaker, which rejects calls with CircuitOpenError until it resets.
+    """
+    
+    def __init__(self):
+        self.max_concurrency = settings.llm_max_concurrency
+        self.max_queue = settings.llm_max_queue
+        self.queue_timeout = settings.llm_queue_timeout
+        self.breaker = CircuitBreaker(settings.llm_circuit_failure_threshold, settings.llm_circuit_reset_seconds)
+        self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.retries = 0
+    
+    def _enter_queue(self):
+        with self._lock:
+            if self.waiting >= self.max_queue:
+                self._reject("queue_full")
+            self.waiting += 1
+            LLM_QUEUE_DEPTH.set(self.waiting)
+    
+    def _leave_queue(self, admitted: bool):
+        with self._lock:
+            self.waiting -= 1
+            LLM_QUEUE_DEPTH.set(self.waiting)
+            if admitted:
+                self.in_flight += 1
+                LLM_IN_FLIGHT.set(self.in_flight)
+    
+    def _finish(self):
+        with self._lock:
+            self.in_flight -= 1
+            LLM_IN_FLIGHT.set(self.in_flight)
+    
+    def _reject(self, reason: str):
+        self.rejected += 1
+        LLM_REJECTED.labels(reason=reason).inc()
+        raise LLMOverloadedError(f"LLM overloaded ({reason.replace('_', ' ')}), retry later", self.queue_timeout)
+    
+    @asynccontextmanager
+    async def aslot(self):
+        """Hold one of the concurrency slots for the duration of a call"""
+        self._enter_queue()
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), timeout=self.queue_timeout)
+        except asyncio.TimeoutError:
+            self._leave_queue(admitted=False)
+            self._reject("queue_timeout")
+        except BaseException:
+            self._leave_queue(admitted=False)
+            raise
+        self._leave_queue(admitted=True)
+        try:
+            yield
+        finally:
+            self._finish()
+            self._semaphore.release()
+    
+    def _backoff(self, attempt: int, error: Exception) -> float:
+        """Full-jitter exponential backoff, or the provider's Retry-After when it sent one"""
+        requested = _retry_after(error)
+        if requested is not None:
+            return min(requested, settings.llm_retry_max_delay)
+        return random.uniform(0, min(settings.llm_retry_max_delay, settings.llm_retry_base_delay * 2 ** attempt))
+    
+    def _after_failure(self, error: Exception, attempt: int) -> Optional[float]:
+        """Record a failed attempt; returns the delay before retrying, or None to give up"""
+        if _counts_as_outage(error):
+            self.breaker.record_failure()
+        else:
+            self.breaker.release()
+        if not _is_retryable(error) or attempt >= settings.llm_max_retries or self.breaker.state == "open":
+            return None
+        self.retries += 1
+        LLM_RETRIES.labels(error=type(error).__name__).inc()
+        return self._backoff(attempt, error)
+    
+    def _give_up(self, error: Exception) -> Exception:
+        if _is_retryable(error):
+            fallback = self.breaker.reset_seconds if self.breaker.state == "open" else settings.llm_retry_max_delay
+            return LLMUnavailableError(f"LLM provider error after retries: {error}", _retry_after(error) or fallback)
+        return error
+    
+    async def arun(self, fn: Callable[[], Awaitable[T]]) -> T:
+        """Call the provider with retries and circuit breaking (no slot taken)"""
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            try:
+                result = await fn()
+            except asyncio.CancelledError:
+                self.breaker.release()
+                raise
+            except Exception as e:
+                delay = self._after_failure(e, attempt)
+                if delay is None:
+                    raise self._give_up(e) from e
+                logger.info("LLM call failed (%s), retrying in %.2fs", type(e).__name__, delay)
+                await asyncio.sleep(delay)
+                attempt += 1
+                continue
+            self.breaker.record_success()
+            return result
+    
+    async def acall(self, fn: Callable[[], Awaitable[T]]) -> T:
+        async with self.aslot():
+            return await self.arun(fn)
+    
+    def stats(self) -> dict:
+        with self._lock:
+            stats = {
+                "max_concurrency": self.max_concurrency,
+                "max_queue": self.max_queue,
+                "queue_timeout": self.queue_timeout,
+                "in_flight": self.in_flight,
+                "waiting": self.waiting,
+                "rejected": self.rejected,
+                "retries": self.retries,
+            }
+        return {**stats, "circuit": self.breaker.stats()}
@@ -1,16 +1,29 @@
-from groq import Groq
+import logging
+from groq import AsyncGroq
+from app.services.llm_dispatcher import LLMDispatcher
+from app.services.metrics import record_llm_error, record_llm_usage
 from app.config import get_settings
-from typing import List
+from typing import AsyncIterator, List
 
 settings = get_settings()
+logger = logging.getLogger(__name__)
 
 class LLMService:
     def __init__(self):
-        self.client = Groq(api_key=settings.groq_api_key)
+        # Retries are the dispatcher's job, so the SDK's own are turned off
+        self.async_client = AsyncGroq(api_key=settings.groq_api_key, timeout=settings.llm_timeout_seconds, max_retries=0)
         self.model = settings.llm_model
+        self.dispatcher = LLMDispatcher()
     
-    def generate_answer(self, question: str, context: str, conversation_history: List[dict] = None) -> str:
-        """Generate answer using Groq"""
+    async def awarm_up(self):
+        """Open the HTTP connection to Groq ahead of the first question"""
+        try:
+            await self.async_client.models.list()
+        except Exception as e:
+            logger.warning("Could not reach Groq during warm-up: %s", e)
+    
+    def _build_messages(self, question: str, context: str, conversation_history: List[dict] = None) -> List[dict]:
+        """Build the chat messages sent to Groq"""
         
         system_prompt = """You are a helpful medical policy assistant. 
         Answer questions based ONLY on the provided context. 
@@ -33,14 +46,48 @@ class LLMService:
             messages.extend(conversation_history)
         
         messages.append({"role": "user", "content": user_prompt})
+        return messages
+    
+    async def agenerate_answer(self, question: str, context: str, conversation_history: List[dict] = None) -> str:
+        """Generate answer using Groq; raises on failure so errors are never mistaken for answers"""
+        messages = self._build_messages(question, context, conversation_history)
         
         try:
-            response = self.client.chat.completions.create(
+            response = await self.dispatcher.acall(lambda: self.async_client.chat.completions.create(
                 model=self.model,
                 messages=messages,
                 temperature=0.3,
                 max_tokens=500
-            )
-            return response.choices[0].message.content
+            ))
+        except Exception as e:
+            record_llm_error(e)
+            raise
+        record_llm_usage(response.usage)
+        return response.choices[0].message.content
+    
+    async def astream_answer(self, question: str, context: str, conversation_history: List[dict] = None) -> AsyncIterator[str]:
+        """Stream answer tokens from Groq as they are generated"""
+        messages = self._build_messages(question, context, conversation_history)
+        
+        try:
+            # The slot is held until the stream ends; only opening the stream is retried
+            async with self.dispatcher.aslot():
+                stream = await self.dispatcher.arun(lambda: self.async_client.chat.completions.create(
+                    model=self.model,
+                    messages=messages,
+                    temperature=0.3,
+                    max_tokens=500,
+                    stream=True
+                ))
+                async for chunk in stream:
+                    # Groq reports usage on the final chunk
+                    x_groq = getattr(chunk, "x_groq", None)
+                    record_llm_usage(getattr(chunk, "usage", None) or getattr(x_groq, "usage", None))
+                    if not chunk.choices:
+                        continue
+                    token = chunk.choices[0].delta.content
+                    if token:
+                        yield token
         except Exception as e:
-            return f"Error generating response: {str(e)}"
\ No newline at end of file
+            record_llm_error(e)
+            raise
@@ -0,0 +1,56 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+class LocalCache:
+    """Bounded in-process LRU of decoded cache payloads, in front of Redis.
+    
+    Entries live for at most `ttl` seconds; once `max_entries` is reached the
+    least recently used entry is evicted. Cached values are shared between
+    callers, so `get` hands out shallow copies.
+    """
+    
+    def __init__(self, max_entries: int, ttl: float):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[str, Tuple[dict, float]]" = OrderedDict()  # key -> (payload, expires at)
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+    
+    def get(self, key: str) -> Optional[dict]:
+        with self._lock:
+            self.lookups += 1
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            payload, expires_at = entry
+            if expires_at <= time.monotonic():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return dict(payload)
+    
+    def set(self, key: str, payload: dict):
+        with self._lock:
+            self._entries[key] = (dict(payload), time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+    
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+            }
@@ -0,0 +1,175 @@
+import json
+import threading
+import faiss
+import numpy as np
+from typing import Dict, Iterable, List, Optional
+from langchain_core.documents import Document
+from app.services.array_files import load_arrays, save_arrays
+
+class IdFilter:
+    """A set of vector IDs as a packed bitmap (bit i of byte i >> 3 is ID i)"""
+    
+    def __init__(self, bitmap: np.ndarray):
+        self.bitmap = np.ascontiguousarray(bitmap, dtype=np.uint8)
+        self.count = int(np.unpackbits(self.bitmap).sum())
+    
+    def selector(self) -> faiss.IDSelector:
+        # faiss reads the bitmap in place, so this filter must outlive the search
+        return faiss.IDSelectorBitmap(len(self.bitmap), faiss.swig_ptr(self.bitmap))
+    
+    def contains(self, ids: np.ndarray) -> np.ndarray:
+        """Boolean mask of which IDs are in the set"""
+        ids = np.asarray(ids, dtype=np.int64)
+        result = np.zeros(len(ids), dtype=bool)
+        inside = (ids >= 0) & (ids < len(self.bitmap) * 8)
+        selected = ids[inside]
+        result[inside] = (self.bitmap[selected >> 3] >> (selected & 7)) & 1
+        return result
+
+class MetadataIndex:
+    """Source, page and tags of every vector ID, for filtering searches.
+    
+    Sources and pages are kept as columns indexed by vector ID; each source's
+    ID bitmap is built on first use and cached until the index changes. Tags
+    belong to source files and are resolved to their sources' bitmaps.
+    """
+    
+    def __init__(self):
+        self._sources: List[str] = []  # source code -> file name
+        self._source_codes: Dict[str, int] = {}
+        self._codes = np.full(0, -1, dtype=np.int32)  # vector id -> source code, -1 = no vector
+        self._pages = np.full(0, -1, dtype=np.int32)  # vector id -> page, -1 = unknown
+        self._tags: Dict[str, List[str]] = {}  # source -> tags
+        self._bitmaps: Dict[int, np.ndarray] = {}
+        self._lock = threading.Lock()
+    
+    def _grow(self, size: int):
+        if size <= len(self._codes):
+            if not self._codes.flags.writeable:
+                # Loaded memory-mapped, copy into the heap before the first change
+                self._codes = np.array(self._codes)
+                self._pages = np.array(self._pages)
+            return
+        capacity = max(size, 2 * len(self._codes), 1024)
+        self._codes = np.concatenate([self._codes, np.full(capacity - len(self._codes), -1, dtype=np.int32)])
+        self._pages = np.concatenate([self._pages, np.full(capacity - len(self._pages), -1, dtype=np.int32)])
+    
+    def _source_code(self, source: str) -> int:
+        code = self._source_codes.get(source)
+        if code is None:
+            code = self._source_codes[source] = len(self._sources)
+            self._sources.append(source)
+        return code
+    
+    def add(self, ids: List[int], documents: List[Document]):
+        if not ids:
+            return
+        with self._lock:
+            self._grow(max(ids) + 1)
+            for vector_id, doc in zip(ids, documents):
+                self._codes[vector_id] = self._source_code(doc.metadata.get("source", "Unknown"))
+                page = doc.metadata.get("page")
+                self._pages[vector_id] = page if isinstance(page, int) else -1
+            self._bitmaps.clear()
+    
+    def remove(self, ids: Iterable[int]):
+        with self._lock:
+            self._grow(0)
+            ids = np.asarray([vector_id for vector_id in ids if vector_id < len(self._codes)], dtype=np.int64)
+            self._codes[ids] = -1
+            self._pages[ids] = -1
+            self._bitmaps.clear()
+    
+    def clear(self):
+        with self._lock:
+            self._sources = []
+            self._source_codes = {}
+            self._codes = np.full(0, -1, dtype=np.int32)
+            self._pages = np.full(0, -1, dtype=np.int32)
+            self._tags = {}
+            self._bitmaps.clear()
+    
+    def set_tags(self, tags: Dict[str, List[str]]) -> bool:
+        """Replace the tags of every source file; returns whether anything changed"""
+        tags = {source: sorted(set(source_tags)) for source, source_tags in tags.items() if source_tags}
+        with self._lock:
+            if tags == self._tags:
+                return False
+            self._tags = tags
+            return True
+    
+    def sources(self) -> List[str]:
+        """Source files that still have vectors"""
+        with self._lock:
+            live = np.unique(self._codes[self._codes >= 0])
+            return sorted(self._sources[code] for code in live.tolist())
+    
+    def tags(self) -> Dict[str, List[str]]:
+        """Tag -> source files carrying it"""
+        with self._lock:
+            by_tag: Dict[str, List[str]] = {}
+            for source, source_tags in self._tags.items():
+                for tag in source_tags:
+                    by_tag.setdefault(tag, []).append(source)
+            return {tag: sorted(sources) for tag, sources in sorted(by_tag.items())}
+    
+    def _source_bitmap(self, code: int) -> np.ndarray:
+        bitmap = self._bitmaps.get(code)
+        if bitmap is None:
+            bitmap = self._bitmaps[code] = np.packbits(self._codes == code, bitorder='little')
+        return bitmap
+    
+    def build_filter(self, sources: Optional[List[str]] = None, tags: Optional[List[str]] = None,
+                     page_min: Optional[int] = None, page_max: Optional[int] = None) -> IdFilter:
+        """IDs matching any of `sources`, any of `tags` and the page range (each only if given)"""
+        with self._lock:
+            codes = None
+            if sources is not None:
+                codes = {self._source_codes[source] for source in sources if source in self._source_codes}
+            if tags is not None:
+                wanted = set(tags)
+                tagged = {
+                    self._source_codes[source] for source, source_tags in self._tags.items()
+                    if source in self._source_codes and wanted.intersection(source_tags)
+                }
+                codes = tagged if codes is None else codes & tagged
+            
+            if codes is None:
+                bitmap = np.packbits(self._codes >= 0, bitorder='little')
+            elif codes:
+                bitmap = np.bitwise_or.reduce([self._source_bitmap(code) for code in sorted(codes)])
+            else:
+                bitmap = np.zeros((len(self._codes) + 7) // 8, dtype=np.uint8)
+            
+            if page_min is not None or page_max is not None:
+                in_range = self._pages >= (page_min if page_min is not None else 0)
+                if page_max is not None:
+                    in_range &= self._pages <= page_max
+                bitmap = bitmap & np.packbits(in_range, bitorder='little')
+        return IdFilter(bitmap)
+    
+    def save(self, path: str):
+        with self._lock:
+            sources = "\n".join(self._sources).encode()
+            tags = json.dumps(self._tags).encode()
+            save_arrays(path, {
+                "sources": np.frombuffer(sources, dtype='uint8'),
+                "codes": self._codes,
+                "pages": self._pages,
+                "tags": np.frombuffer(tags, dtype='uint8')
+            })
+    
+    def load(self, path: str, mmap: bool = False) -> bool:
+        """Load a saved index; with `mmap`, the ID columns stay mapped read-only until the index is changed"""
+        data = load_arrays(path, ("sources", "codes", "pages", "tags"), mmap)
+        if data is None:
+            return False
+        with self._lock:
+            sources = data["sources"].tobytes().decode()
+            self._sources = sources.split("\n") if sources else []
+            self._source_codes = {source: code for code, source in enumerate(self._sources)}
+            self._codes = data["codes"]
+            self._pages = data["pages"]
+            self._tags = json.loads(data["tags"].tobytes().decode())
+            self._bitmaps.clear()
+        return True
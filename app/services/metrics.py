@@ -0,0 +1,145 @@
+import os
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, Optional
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Gauge, Histogram, multiprocess
+
+# Per-request stage timings (milliseconds), set by the timing middleware
+request_timings: ContextVar[Optional[Dict[str, float]]] = ContextVar("request_timings", default=None)
+
+STAGE_DURATION = Histogram(
+    "rag_stage_duration_seconds",
+    "Time spent in each query pipeline stage",
+    ["stage"],
+    buckets=(0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+)
+QUERY_DURATION = Histogram(
+    "rag_query_duration_seconds",
+    "End-to-end query latency by endpoint",
+    ["endpoint"],
+    buckets=(0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+)
+CACHE_REQUESTS = Counter(
+    "rag_cache_requests_total",
+    "Response cache lookups by layer and result",
+    ["layer", "result"]
+)
+LLM_TOKENS = Counter(
+    "rag_llm_tokens_total",
+    "Tokens reported by the LLM provider",
+    ["kind"]
+)
+LLM_ERRORS = Counter(
+    "rag_llm_errors_total",
+    "Failed LLM calls by exception type",
+    ["error"]
+)
+# Gauges say how to combine the workers' values when PROMETHEUS_MULTIPROC_DIR is
+# set (see multiprocess_registry); without it they are per-process as usual
+LLM_IN_FLIGHT = Gauge(
+    "rag_llm_in_flight",
+    "LLM calls holding a concurrency slot",
+    multiprocess_mode="livesum"
+)
+LLM_QUEUE_DEPTH = Gauge(
+    "rag_llm_queue_depth",
+    "LLM calls waiting for a concurrency slot",
+    multiprocess_mode="livesum"
+)
+LLM_REJECTED = Counter(
+    "rag_llm_rejected_total",
+    "LLM calls rejected by admission control",
+    ["reason"]
+)
+LLM_RETRIES = Counter(
+    "rag_llm_retries_total",
+    "Retried LLM calls by exception type",
+    ["error"]
+)
+LLM_CIRCUIT_STATE = Gauge(
+    "rag_llm_circuit_state",
+    "LLM circuit breaker state (0 closed, 1 half-open, 2 open), the worst of any worker",
+    multiprocess_mode="livemax"
+)
+CACHE_WARMING = Counter(
+    "rag_cache_warming_total",
+    "Hot questions considered by the cache warmer, by outcome",
+    ["outcome"]
+)
+CONTEXT_TOKENS = Histogram(
+    "rag_context_tokens",
+    "Estimated tokens of retrieved context sent to the LLM per question",
+    buckets=(64, 128, 256, 512, 768, 1024, 1536, 2048, 4096)
+)
+CONTEXT_CHUNKS = Counter(
+    "rag_context_chunks_total",
+    "Retrieved chunks by context assembly outcome",
+    ["outcome"]
+)
+EMBEDDING_QUEUE_DEPTH = Gauge(
+    "rag_embedding_queue_depth",
+    "Queries waiting in the embedding micro-batcher",
+    multiprocess_mode="livesum"
+)
+EMBEDDING_BATCH_SIZE = Histogram(
+    "rag_embedding_batch_size",
+    "Queries encoded per micro-batch",
+    buckets=(1, 2, 4, 8, 16, 32, 64, 128)
+)
+EMBEDDING_BATCH_CONFIG = Gauge(
+    "rag_embedding_batch_config",
+    "Embedding micro-batcher configuration",
+    ["setting"],
+    multiprocess_mode="livemax"
+)
+
+def metrics_registry() -> CollectorRegistry:
+    """Registry to serve: every worker's metrics when workers share PROMETHEUS_MULTIPROC_DIR, else this process's.
+    
+    The directory must be set (and emptied) before the server starts, since
+    metric values are written to it from the moment prometheus_client loads.
+    """
+    if not os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        return REGISTRY
+    registry = CollectorRegistry()
+    multiprocess.MultiProcessCollector(registry)
+    return registry
+
+def mark_worker_stopped():
+    """Drop this worker's live gauges from the aggregate once it shuts down"""
+    if os.environ.get("PROMETHEUS_MULTIPROC_DIR"):
+        multiprocess.mark_process_dead(os.getpid())
+
+def observe_stage(name: str, elapsed: float):
+    """Record a stage duration (seconds) measured by the caller"""
+    STAGE_DURATION.labels(stage=name).observe(elapsed)
+    timings = request_timings.get()
+    if timings is not None:
+        timings[name] = timings.get(name, 0.0) + elapsed * 1000
+
+@contextmanager
+def stage(name: str):
+    """Time a pipeline stage into the stage histogram and the current request's timings"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(name, time.perf_counter() - started)
+
+def record_cache_lookup(layer: str, hit: bool):
+    CACHE_REQUESTS.labels(layer=layer, result="hit" if hit else "miss").inc()
+
+def record_llm_usage(usage):
+    """Count prompt and completion tokens from a provider usage object"""
+    if usage is None:
+        return
+    LLM_TOKENS.labels(kind="prompt").inc(getattr(usage, "prompt_tokens", 0) or 0)
+    LLM_TOKENS.labels(kind="completion").inc(getattr(usage, "completion_tokens", 0) or 0)
+
+def record_llm_error(error: Exception):
+    LLM_ERRORS.labels(error=type(error).__name__).inc()
+
+def format_server_timing(timings: Dict[str, float]) -> str:
+    """Server-Timing header value for a request's stage timings"""
+    return ", ".join(f"{name};dur={duration:.2f}" for name, duration in timings.items())
@@ -0,0 +1,239 @@
+"""ONNX Runtime backend for sentence embeddings.
+
+The configured sentence-transformers model is exported once (this needs
+PyTorch), optionally quantized to dynamic int8, and then served with
+onnxruntime and the `tokenizers` library only, so PyTorch is never imported
+at runtime. Export ahead of time, e.g. in a build stage:
+
+    python -m app.services.onnx_embeddings --quantize --documents Data/documents
+"""
+import json
+import logging
+import os
+import re
+from typing import Callable, List
+import numpy as np
+from app.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
+
+MODEL_FILE = "model.onnx"
+QUANTIZED_MODEL_FILE = "model_int8.onnx"
+TOKENIZER_FILE = "tokenizer.json"
+CONFIG_FILE = "encoder_config.json"
+
+def export_dir(base_dir: str, model_name: str) -> str:
+    """Directory holding the exported files of one model"""
+    return os.path.join(base_dir, re.sub(r"[^A-Za-z0-9_.-]+", "_", model_name))
+
+def export_onnx(model_name: str, output_dir: str, quantize: bool = True) -> str:
+    """Export a sentence-transformers model's transformer to ONNX, with its tokenizer and pooling settings"""
+    import torch
+    from sentence_transformers import SentenceTransformer
+    from sentence_transformers.models import Normalize, Pooling
+    
+    os.makedirs(output_dir, exist_ok=True)
+    model = SentenceTransformer(model_name, device="cpu")
+    transformer = model[0].auto_model.eval()
+    tokenizer = model.tokenizer
+    pooling = next((module for module in model if isinstance(module, Pooling)), None)
+    pooling_config = pooling.get_config_dict() if pooling else {"pooling_mode_mean_tokens": True}
+    pooling_mode = "cls" if pooling_config.get("pooling_mode_cls_token") else (
+        "max" if pooling_config.get("pooling_mode_max_tokens") else "mean"
+    )
+    
+    sample = tokenizer(["export sample"], return_tensors="pt")
+    input_names = list(sample.keys())
+    
+    class Encoder(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.transformer = transformer
+        
+        def forward(self, *inputs):
+            return self.transformer(**dict(zip(input_names, inputs))).last_hidden_state
+    
+    dynamic_axes = {name: {0: "batch", 1: "sequence"} for name in input_names}
+    dynamic_axes["last_hidden_state"] = {0: "batch", 1: "sequence"}
+    model_path = os.path.join(output_dir, MODEL_FILE)
+    with torch.no_grad():
+        torch.onnx.export(
+            Encoder(), tuple(sample[name] for name in input_names), model_path,
+            input_names=input_names, output_names=["last_hidden_state"],
+            dynamic_axes=dynamic_axes, opset_version=14
+        )
+    tokenizer.backend_tokenizer.save(os.path.join(output_dir, TOKENIZER_FILE))
+    
+    with open(os.path.join(output_dir, CONFIG_FILE), 'w') as f:
+        json.dump({
+            "model": model_name,
+            "pooling": pooling_mode,
+            "normalize": any(isinstance(module, Normalize) for module in model),
+            "max_seq_length": model.max_seq_length,
+            "pad_token": tokenizer.pad_token,
+            "pad_token_id": tokenizer.pad_token_id,
+        }, f, indent=2)
+    
+    if quantize:
+        quantize_model(output_dir)
+    logger.info("Exported %s to %s", model_name, output_dir)
+    return output_dir
+
+def quantize_model(model_dir: str):
+    """Dynamic int8 quantization of the exported model's weights"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    quantize_dynamic(
+        os.path.join(model_dir, MODEL_FILE),
+        os.path.join(model_dir, QUANTIZED_MODEL_FILE),
+        weight_type=QuantType.QInt8
+    )
+
+class OnnxSentenceEncoder:
+    """Drop-in for SentenceTransformer.encode backed by ONNX Runtime"""
+    
+    def __init__(self, model_dir: str, quantized: bool = False, threads: int = 0):
+        import onnxruntime as ort
+        from tokenizers import Tokenizer
+        
+        with open(os.path.join(model_dir, CONFIG_FILE)) as f:
+            self.config = json.load(f)
+        self.tokenizer = Tokenizer.from_file(os.path.join(model_dir, TOKENIZER_FILE))
+        self.tokenizer.enable_truncation(max_length=self.config["max_seq_length"])
+        self.tokenizer.enable_padding(pad_id=self.config["pad_token_id"], pad_token=self.config["pad_token"])
+        
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        model_file = QUANTIZED_MODEL_FILE if quantized else MODEL_FILE
+        self.session = ort.InferenceSession(
+            os.path.join(model_dir, model_file), options, providers=["CPUExecutionProvider"]
+        )
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+    
+    def _encode_batch(self, texts: List[str]) -> np.ndarray:
+        encodings = self.tokenizer.encode_batch(texts)
+        inputs = {
+            "input_ids": np.asarray([e.ids for e in encodings], dtype=np.int64),
+            "attention_mask": np.asarray([e.attention_mask for e in encodings], dtype=np.int64),
+            "token_type_ids": np.asarray([e.type_ids for e in encodings], dtype=np.int64),
+        }
+        hidden = self.session.run(None, {name: inputs[name] for name in self.input_names})[0]
+        
+        mask = inputs["attention_mask"][..., None].astype(np.float32)
+        if self.config["pooling"] == "cls":
+            pooled = hidden[:, 0]
+        elif self.config["pooling"] == "max":
+            pooled = np.where(mask > 0, hidden, -1e9).max(axis=1)
+        else:
+            pooled = (hidden * mask).sum(axis=1) / np.clip(mask.sum(axis=1), 1e-9, None)
+        if self.config["normalize"]:
+            pooled = pooled / np.clip(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12, None)
+        return pooled.astype(np.float32)
+    
+    def encode(self, texts: List[str], batch_size: int = 32, show_progress_bar: bool = False, **kwargs) -> np.ndarray:
+        """Embed texts in length-sorted batches, so each batch pads to a similar length"""
+        if not texts:
+            return np.zeros((0, self.get_sentence_embedding_dimension()), dtype=np.float32)
+        order = np.argsort([-len(text) for text in texts], kind="stable")
+        vectors = [None] * len(texts)
+        for start in range(0, len(texts), batch_size):
+            batch = order[start:start + batch_size]
+            for position, vector in zip(batch, self._encode_batch([texts[i] for i in batch])):
+                vectors[position] = vector
+        return np.stack(vectors)
+    
+    def get_sentence_embedding_dimension(self) -> int:
+        return int(self.session.get_outputs()[0].shape[-1])
+
+def load_onnx_encoder(model_name: str, base_dir: str, quantized: bool = False, threads: int = 0) -> OnnxSentenceEncoder:
+    """Load the exported model, exporting it first when it doesn't exist yet"""
+    model_dir = export_dir(base_dir, model_name)
+    model_file = os.path.join(model_dir, QUANTIZED_MODEL_FILE if quantized else MODEL_FILE)
+    if not os.path.exists(model_file):
+        if os.path.exists(os.path.join(model_dir, MODEL_FILE)) and quantized:
+            logger.info("No int8 model in %s, quantizing the exported one", model_dir)
+            try:
+                quantize_model(model_dir)
+            except ImportError as e:
+                raise RuntimeError(
+                    f"Quantizing {model_name} needs the onnx package ({e}); install it or "
+                    f"run `python -m app.services.onnx_embeddings --quantize` where it is installed"
+                )
+        else:
+            logger.info("No ONNX export of %s in %s, exporting", model_name, model_dir)
+            try:
+                export_onnx(model_name, model_dir, quantize=quantized)
+            except ImportError as e:
+                raise RuntimeError(
+                    f"ONNX export of {model_name} needs sentence-transformers and torch ({e}); "
+                    f"run `python -m app.services.onnx_embeddings` where they are installed"
+                )
+    return OnnxSentenceEncoder(model_dir, quantized=quantized, threads=threads)
+
+def parity_report(reference: Callable[[List[str]], np.ndarray], candidate: Callable[[List[str]], np.ndarray],
+                  corpus: List[str], queries: List[str], k: int = 3) -> dict:
+    """Compare a candidate encoder with the reference one.
+    
+    Reports the cosine similarity between both encoders' vectors of the corpus
+    and, for each query, the overlap of the top-k corpus neighbours each
+    encoder retrieves.
+    """
+    def normalized(vectors: np.ndarray) -> np.ndarray:
+        vectors = np.asarray(vectors, dtype=np.float32)
+        return vectors / np.clip(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12, None)
+    
+    reference_corpus, candidate_corpus = normalized(reference(corpus)), normalized(candidate(corpus))
+    cosine = (reference_corpus * candidate_corpus).sum(axis=1)
+    
+    k = min(k, len(corpus))
+    reference_top = np.argsort(-normalized(reference(queries)) @ reference_corpus.T, axis=1)[:, :k]
+    candidate_top = np.argsort(-normalized(candidate(queries)) @ candidate_corpus.T, axis=1)[:, :k]
+    overlap = [len(set(a) & set(b)) / k for a, b in zip(reference_top.tolist(), candidate_top.tolist())]
+    
+    return {
+        "texts": len(corpus),
+        "queries": len(queries),
+        "k": k,
+        "cosine_mean": float(cosine.mean()),
+        "cosine_min": float(cosine.min()),
+        "retrieval_overlap_at_k": float(np.mean(overlap)),
+    }
+
+def sample_texts(directory: str, count: int) -> List[str]:
+    """Evenly spaced chunks of the documents in a directory"""
+    from app.services.document_loader import DocumentLoader
+    loader = DocumentLoader()
+    chunks = loader.split_documents(loader.load_documents_from_directory(directory))
+    step = max(1, len(chunks) // count)
+    return [chunk.page_content for chunk in chunks[::step][:count]]
+
+def main():
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Export the embedding model to ONNX and check parity with PyTorch")
+    parser.add_argument("--model", default=settings.embedding_model)
+    parser.add_argument("--output-dir", default=settings.embedding_onnx_dir)
+    parser.add_argument("--quantize", action="store_true", help="Also write a dynamic int8 model")
+    parser.add_argument("--documents", help="Check parity on chunks of the documents in this directory")
+    parser.add_argument("--samples", type=int, default=500)
+    args = parser.parse_args()
+    
+    model_dir = export_onnx(args.model, export_dir(args.output_dir, args.model), quantize=args.quantize)
+    print(f"Exported {args.model} to {model_dir}")
+    if not args.documents:
+        return
+    
+    from sentence_transformers import SentenceTransformer
+    reference = SentenceTransformer(args.model, device="cpu")
+    corpus = sample_texts(args.documents, args.samples)
+    # Leading sentences of every tenth chunk serve as questions
+    queries = [text.split(". ")[0] for text in corpus[::10]]
+    for quantized in ([False, True] if args.quantize else [False]):
+        encoder = OnnxSentenceEncoder(model_dir, quantized=quantized)
+        report = parity_report(reference.encode, encoder.encode, corpus, queries, k=settings.top_k_results)
+        print(f"{'onnx_int8' if quantized else 'onnx'}: {json.dumps(report)}")
+
+if __name__ == "__main__":
+    main()
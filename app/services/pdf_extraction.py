@@ -0,0 +1,31 @@
+"""PDF text extraction helpers that run inside ingestion worker processes.
+
+Kept free of heavy imports so spawned workers start quickly.
+"""
+import os
+from functools import lru_cache
+from typing import List, Tuple
+from PyPDF2 import PdfReader
+
+@lru_cache(maxsize=4)
+def _open_reader(file_path: str, mtime: float) -> PdfReader:
+    # Parsing the cross-reference table dominates small page batches, so each
+    # worker keeps its most recent readers open across batches of the same file
+    return PdfReader(file_path)
+
+def _reader(file_path: str) -> PdfReader:
+    return _open_reader(file_path, os.path.getmtime(file_path))
+
+def count_pdf_pages(file_path: str) -> int:
+    """Number of pages in a PDF"""
+    return len(_reader(file_path).pages)
+
+def extract_pdf_pages(file_path: str, start: int, end: int) -> List[Tuple[int, str]]:
+    """Extract (page number, text) for pages [start, end), skipping blank pages"""
+    reader = _reader(file_path)
+    pages = []
+    for page_num in range(start, min(end, len(reader.pages))):
+        text = reader.pages[page_num].extract_text()
+        if text.strip():
+            pages.append((page_num + 1, text))
+    return pages
@@ -1,69 +1,449 @@
-from typing import List, Dict, Optional
+import logging
+from typing import AsyncIterator, Callable, List, Dict, Optional, Set, Tuple
+from concurrent.futures import ThreadPoolExecutor
+from langchain_core.documents import Document
 from app.services.document_loader import DocumentLoader
 from app.services.embeddings import EmbeddingService
 from app.services.vector_store import FAISSVectorStore
+from app.services.index_generations import (
+    create_generation, current_generation, current_path, discard_generation,
+    publish_generation, prune_generations
+)
+from app.services.index_jobs import IndexJobManager
+from app.services.llm_dispatcher import LLMUnavailableError
 from app.services.llm_service import LLMService
 from app.services.cache_service import CacheService
-from app.models import QueryResponse, SourceDocument
+from app.services.cache_warmer import CacheWarmer
+from app.services.hot_questions import create_hot_question_tracker
+from app.services.context_builder import format_chunk, select_context
+from app.services.conversation_store import create_conversation_store, trim_history
+from app.services.single_flight import SingleFlight
+from app.services.metrics import observe_stage, stage
+from app.services.index_manifest import hash_chunk, hash_file
+from app.models import BatchQueryItem, QueryFilter, QueryResponse, SourceDocument
 from app.config import get_settings
+import asyncio
+import json
+import numpy as np
+import os
+import re
+import threading
+import time
 import uuid
 
 settings = get_settings()
+logger = logging.getLogger(__name__)
+
+NO_DOCUMENTS_ANSWER = "⚠️ No documents have been indexed yet. Please upload and index documents first using the /index-documents endpoint."
+NO_RESULTS_ANSWER = "I couldn't find any relevant information in the indexed documents to answer your question."
+
+WARMUP_QUESTION = "What is the recommended treatment?"
+
+# Splits a cached answer into word-sized pieces for replay as a token stream
+_REPLAY_TOKEN_PATTERN = re.compile(r"\S+\s*|\s+")
+
+def reciprocal_rank_fusion(rankings: List[List[Tuple[int, float]]], k: int = 60) -> List[Tuple[int, float]]:
+    """Fuse ranked (id, score) lists into one list ordered by summed 1 / (k + rank)"""
+    fused: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, (vector_id, _) in enumerate(ranking, start=1):
+            fused[vector_id] = fused.get(vector_id, 0.0) + 1.0 / (k + rank)
+    return sorted(fused.items(), key=lambda item: item[1], reverse=True)
+
+def normalize_filter(filters: Optional[QueryFilter]) -> Optional[QueryFilter]:
+    """Canonical form of a query filter, or None if it doesn't restrict anything"""
+    if filters is None:
+        return None
+    filters = QueryFilter(
+        sources=sorted(set(filters.sources)) if filters.sources else None,
+        tags=sorted(set(filters.tags)) if filters.tags else None,
+        page_min=filters.page_min,
+        page_max=filters.page_max
+    )
+    return filters if filters.dict(exclude_none=True) else None
+
+def cache_key(question: str, filters: Optional[QueryFilter]) -> str:
+    """Key for caching, leases and coalescing; filtered answers are kept apart from unfiltered ones"""
+    if filters is None:
+        return question
+    return f"{question}\0{json.dumps(filters.dict(exclude_none=True), sort_keys=True)}"
 
 class RAGPipeline:
     def __init__(self):
         self.document_loader = DocumentLoader()
-        self.embedding_service = EmbeddingService()
+        with stage("startup_embedding_model"):
+            self.embedding_service = EmbeddingService()
         self.vector_store = FAISSVectorStore()
-        self.llm_service = LLMService()
-        self.cache_service = CacheService()
-        self.conversation_store: Dict[str, List[dict]] = {}
+        with stage("startup_llm_client"):
+            self.llm_service = LLMService()
+        with stage("startup_redis"):
+            self.cache_service = CacheService()
+        self.conversation_store = create_conversation_store(self.cache_service)
+        self.hot_questions = create_hot_question_tracker(self.cache_service)
+        self.cache_warmer = None
+        if self.hot_questions is not None and settings.cache_warming_enabled:
+            self.cache_warmer = CacheWarmer(self.hot_questions, self.cache_service, self.awarm_answer)
+        # In-flight question counts, referenced until done so they aren't garbage collected
+        self._recording: Set[asyncio.Task] = set()
+        self.single_flight = SingleFlight()
+        # Bounded pool for CPU-bound work (embedding, FAISS search) on the async path
+        self.executor = ThreadPoolExecutor(
+            max_workers=settings.executor_max_workers,
+            thread_name_prefix="rag-cpu"
+        )
+        self.index_jobs = IndexJobManager(self.vector_store.index_root)
+        self._swap_lock = threading.Lock()
+        # Set once awarm_up() has run (or the index is loaded, with warm-up disabled); reported by the readiness probe
+        self.ready = False
+    
+    def load_index(self):
+        """Load the published index and key the response cache to its generation"""
+        self.vector_store.load(mmap=settings.vector_index_mmap)
+        self.cache_service.set_generation(self.vector_store.generation)
+        if self.cache_warmer is not None:
+            # A deploy may have changed the models and with them the cache namespace
+            self.cache_warmer.trigger("startup")
     
-    def initialize_documents(self, directory: str) -> Dict:
-        """Load and index documents"""
-        print(f"Loading documents from: {directory}")
+    async def awarm_up(self):
+        """Run each query stage once so the first real request doesn't pay for lazy initialization"""
+        with stage("warmup_embedding"):
+            query_embedding = await self.embedding_service.aembed_query(WARMUP_QUESTION, self.executor)
+        if self.vector_store.index.ntotal > 0:
+            with stage("warmup_search"):
+                await self._asearch(WARMUP_QUESTION, query_embedding)
+        with stage("warmup_redis"):
+            await self.cache_service.ais_connected()
+        if settings.startup_warm_llm_connection:
+            with stage("warmup_llm"):
+                await self.llm_service.awarm_up()
+        self.ready = True
+    
+    def initialize_documents(
+        self,
+        directory: str,
+        vector_store: Optional[FAISSVectorStore] = None,
+        progress: Optional[Callable[[Dict], None]] = None
+    ) -> Dict:
+        """Incrementally index documents, embedding only new or changed chunks.
+        
+        Updates `vector_store` (the live store by default) in place; `progress`
+        is called with the running stats after each embedding batch.
+        """
+        logger.info("Indexing documents from: %s", directory)
+        store = vector_store if vector_store is not None else self.vector_store
+        store.check_writable()
+        manifest = store.manifest
         
-        # Load documents
-        documents = self.document_loader.load_documents_from_directory(directory)
-        print(f"Loaded {len(documents)} documents")
+        if not manifest.files and store.index.ntotal > 0:
+            # Vectors indexed before the manifest existed can't be matched to files
+            logger.warning("Existing index has no manifest, rebuilding from scratch")
+            store.clear()
         
-        if not documents:
+        filenames = self.document_loader.list_files(directory)
+        tags_updated = store.metadata_index.set_tags(self.document_loader.load_tags(directory))
+        deleted = sorted(set(manifest.files) - set(filenames))
+        
+        if not filenames and not deleted:
             raise Exception("No documents found in directory")
         
-        # Split into chunks
-        chunks = self.document_loader.split_documents(documents)
-        print(f"Created {len(chunks)} chunks")
+        stats = {
+            "documents_processed": 0,
+            "chunks_created": 0,
+            "documents_added": 0,
+            "documents_updated": 0,
+            "documents_removed": 0,
+            "documents_skipped": 0,
+            "documents_failed": 0,
+            "tags_updated": tags_updated,
+            "chunks_removed": 0
+        }
+        started = time.perf_counter()
         
-        if not chunks:
-            raise Exception("No chunks created from documents")
+        # Only new or changed files go through the ingestion pipeline
+        changed: Dict[str, Tuple[str, Optional[str]]] = {}
+        for filename in filenames:
+            file_path = os.path.join(directory, filename)
+            file_hash = hash_file(file_path)
+            previous_hash = manifest.file_hash(filename)
+            if previous_hash == file_hash:
+                stats["documents_skipped"] += 1
+            else:
+                changed[file_path] = (file_hash, previous_hash)
         
-        # Generate embeddings
-        texts = [doc.page_content for doc in chunks]
-        embeddings = self.embedding_service.embed_documents(texts)
-        print(f"Generated embeddings with shape: {embeddings.shape}")
+        # Vectors of unchanged chunks are reused; whatever is left over afterwards is stale
+        previous_ids: Dict[str, Dict[str, List[int]]] = {}
+        entries: Dict[str, List[Tuple[str, int]]] = {}
+        added_ids: Dict[str, List[int]] = {}
+        for file_path in changed:
+            filename = os.path.basename(file_path)
+            previous_ids[filename] = {}
+            for chunk_hash, vector_id in manifest.chunks(filename):
+                previous_ids[filename].setdefault(chunk_hash, []).append(vector_id)
+            entries[filename] = []
+            added_ids[filename] = []
         
-        # Add to vector store
-        self.vector_store.add_documents(chunks, embeddings)
-        print(f"Added {len(chunks)} documents to vector store")
+        # Pages stream out of the extraction pool, are split one at a time and
+        # embedded in fixed-size batches that go straight into the vector store
+        pending: List[Tuple[str, str, Document]] = []
         
-        # Save index
-        self.vector_store.save()
-        print("Index saved successfully")
+        def flush():
+            if not pending:
+                return
+            chunks = [chunk for _, _, chunk in pending]
+            embeddings = self.embedding_service.embed_documents(
+                [chunk.page_content for chunk in chunks],
+                show_progress_bar=False
+            )
+            ids = store.add_documents(chunks, embeddings)
+            for (filename, chunk_hash, _), vector_id in zip(pending, ids):
+                entries[filename].append((chunk_hash, vector_id))
+                added_ids[filename].append(vector_id)
+            stats["chunks_created"] += len(chunks)
+            pending.clear()
+            if progress:
+                progress(dict(stats))
         
-        return {
-            "documents_processed": len(documents),
-            "chunks_created": len(chunks)
-        }
+        failed: Set[str] = set()
+        for file_path, document in self.document_loader.iter_documents(list(changed), failed):
+            stats["documents_processed"] += 1
+            filename = os.path.basename(file_path)
+            for chunk in self.document_loader.split_documents([document]):
+                chunk_hash = hash_chunk(chunk)
+                reusable = previous_ids[filename].get(chunk_hash)
+                if reusable:
+                    entries[filename].append((chunk_hash, reusable.pop()))
+                else:
+                    pending.append((filename, chunk_hash, chunk))
+                    if len(pending) >= settings.ingest_embedding_batch_size:
+                        flush()
+        flush()
+        
+        for file_path, (file_hash, previous_hash) in changed.items():
+            filename = os.path.basename(file_path)
+            if file_path in failed:
+                # Keep the previous version indexed and the old hash, so the next run retries the file
+                store.remove_ids(added_ids[filename])
+                stats["documents_failed"] += 1
+                logger.warning("Could not fully extract %s, keeping its previous version", filename)
+                continue
+            stale_ids = [vector_id for ids in previous_ids[filename].values() for vector_id in ids]
+            stats["chunks_removed"] += store.remove_ids(stale_ids)
+            manifest.set_file(filename, file_hash, entries[filename])
+            stats["documents_added" if previous_hash is None else "documents_updated"] += 1
+            logger.info("Indexed %s: %d chunks, %d removed", filename, len(entries[filename]), len(stale_ids))
+        
+        # Drop vectors of files that no longer exist
+        for filename in deleted:
+            stale_ids = [vector_id for _, vector_id in manifest.chunks(filename)]
+            stats["chunks_removed"] += store.remove_ids(stale_ids)
+            manifest.remove_file(filename)
+            stats["documents_removed"] += 1
+            logger.info("Removed %s: %d chunks", filename, len(stale_ids))
+        
+        if changed or deleted or tags_updated:
+            store.save()
+            logger.info("Index saved successfully")
+        
+        elapsed = time.perf_counter() - started
+        stats["elapsed_seconds"] = round(elapsed, 3)
+        stats["pages_per_second"] = round(stats["documents_processed"] / elapsed, 2) if elapsed else 0.0
+        stats["chunks_per_second"] = round(stats["chunks_created"] / elapsed, 2) if elapsed else 0.0
+        logger.info(
+            "Ingested %d pages (%s/s), embedded %d chunks (%s/s)",
+            stats["documents_processed"], stats["pages_per_second"],
+            stats["chunks_created"], stats["chunks_per_second"]
+        )
+        
+        return stats
+    
+    def build_generation(self, directory: Optional[str], progress: Optional[Callable[[Dict], None]] = None) -> Dict:
+        """Index into a new generation off to the side, then publish it and swap it in.
+        
+        The new generation starts as a copy of the published one, so unchanged
+        files are not re-embedded. Queries keep reading the old generation until
+        the swap. `directory=None` builds an empty generation (clearing the index).
+        """
+        live = self.vector_store
+        root = live.index_root
+        generation, path = create_generation(root, current_path(root))
+        staging = FAISSVectorStore(live.dimension, index_path=path)
+        staging.generation = generation
+        try:
+            staging.load()
+            if directory is None:
+                stats = {"documents_removed": len(staging.manifest.files), "chunks_removed": staging.index.ntotal}
+                staging.clear()
+                staging.save()
+            else:
+                stats = self.initialize_documents(directory, vector_store=staging, progress=progress)
+            
+            changed = any(stats.get(key) for key in (
+                "documents_added", "documents_updated", "documents_removed", "chunks_removed", "tags_updated"
+            ))
+            if not changed:
+                discard_generation(root, generation)
+                return {**stats, "generation": live.generation}
+            publish_generation(root, generation)
+        except Exception:
+            discard_generation(root, generation)
+            raise
+        
+        if settings.vector_index_mmap:
+            # Serve the published files like every other worker, not the heap copy built here
+            staging.load(mmap=True)
+        
+        with self._swap_lock:
+            self.vector_store = staging
+            self.cache_service.set_generation(generation)
+        if self.cache_warmer is not None:
+            self.cache_warmer.trigger("reindex")
+        prune_generations(root, settings.index_generations_keep)
+        return {**stats, "generation": generation}
+    
+    def refresh_generation(self) -> bool:
+        """Swap in a generation published by another worker"""
+        with self._swap_lock:
+            live = self.vector_store
+            generation = current_generation(live.index_root)
+            if generation is None or generation == live.generation:
+                return False
+            store = FAISSVectorStore(live.dimension)
+            store.load(mmap=settings.vector_index_mmap)
+            self.vector_store = store
+            self.cache_service.set_generation(store.generation)
+        logger.info("Switched to index generation %s", store.generation)
+        if self.cache_warmer is not None:
+            self.cache_warmer.trigger("generation_switch")
+        return True
     
-    def query(self, question: str, conversation_id: Optional[str] = None) -> QueryResponse:
-        """Process a query"""
+    async def _asearch(self, question: str, query_embedding,
+                       filters: Optional[QueryFilter] = None) -> List[Tuple[Document, float]]:
+        """Search the vector store off the event loop"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self._search, question, query_embedding, filters)
+    
+    def _search(self, question: str, query_embedding, filters: Optional[QueryFilter] = None) -> List[Tuple[Document, float]]:
+        """Search the vector store with a query embedding (CPU-bound)"""
+        logger.debug("Query embedding shape: %s", query_embedding.shape)
+        
+        results = self._search_batch([question], query_embedding.reshape(1, -1), filters)[0]
+        
+        logger.debug("Found %d similar documents", len(results))
+        
+        if logger.isEnabledFor(logging.DEBUG):
+            for i, (doc, distance) in enumerate(results):
+                logger.debug("  Result %d: score=%.4f, source=%s", i + 1, distance, doc.metadata.get("source", "Unknown"))
+        
+        return results
+    
+    def _search_batch(self, questions: List[str], query_embeddings,
+                      filters: Optional[QueryFilter] = None) -> List[List[Tuple[Document, float]]]:
+        """Search the vector store for many queries with one multi-row index search"""
+        # Pin one generation for the whole search; vector ids mean nothing in another generation
+        store = self.vector_store
+        # Filters are applied inside the index searches, not to their results
+        id_filter = None
+        if filters is not None:
+            id_filter = store.build_filter(filters.sources, filters.tags, filters.page_min, filters.page_max)
+        # The context builder chooses top_k_results chunks from a larger candidate pool
+        k = settings.top_k_results
+        if settings.context_builder_enabled:
+            k = max(settings.context_candidates, k)
+        if settings.retrieval_mode == "hybrid":
+            # Fuse dense and BM25 candidate lists; exact drug names, doses and
+            # section numbers are matched lexically even when MiniLM blurs them
+            candidates = max(settings.hybrid_candidates, k)
+            dense_rows = store.search_batch(query_embeddings, k=candidates, id_filter=id_filter) or [[] for _ in questions]
+            rows = [
+                reciprocal_rank_fusion(
+                    [dense, store.lexical_search(question, k=candidates, id_filter=id_filter)],
+                    settings.rrf_k
+                )[:k]
+                for question, dense in zip(questions, dense_rows)
+            ]
+        else:
+            # Search similar documents (increased k for better results)
+            rows = store.search_batch(query_embeddings, k=k, id_filter=id_filter) or [[] for _ in questions]
+        
+        if not settings.context_builder_enabled:
+            return store.get_documents_batch(rows)
+        
+        documents = store.chunk_store.get_many(list({vector_id for row in rows for vector_id, _ in row}))
+        return [
+            self._select_context(store, row, documents, query_embedding)
+            for row, query_embedding in zip(rows, query_embeddings)
+        ]
+    
+    def _select_context(self, store: FAISSVectorStore, row: List[Tuple[int, float]],
+                        documents: Dict[int, Document], query_embedding) -> List[Tuple[Document, float]]:
+        """Narrow one query's candidates down to the deduplicated, token-budgeted chunks sent to the LLM"""
+        row = [(vector_id, score) for vector_id, score in row if vector_id in documents]
+        if not row:
+            return []
+        candidates = [(documents[vector_id], score) for vector_id, score in row]
+        
+        # None for IVF indexes saved without a direct map; candidates then keep their rank order
+        embeddings = store.get_vectors([vector_id for vector_id, _ in row])
+        
+        relevance = None
+        if settings.retrieval_mode == "hybrid":
+            # Rank by the fused scores, which carry the lexical matches
+            scores = np.asarray([score for _, score in row], dtype=np.float32)
+            spread = scores.max() - scores.min()
+            relevance = (scores - scores.min()) / spread if spread > 0 else np.ones_like(scores)
+        
+        return select_context(query_embedding, candidates, embeddings, relevance)
+    
+    def _build_context(self, results: List[Tuple[Document, float]]) -> str:
+        """Prepare context from top results"""
+        context = "\n\n---\n\n".join(format_chunk(doc) for doc, distance in results)
+        logger.debug("Context length: %d characters", len(context))
+        return context
+    
+    def _build_sources(self, results: List[Tuple[Document, float]]) -> List[SourceDocument]:
+        """Prepare sources with more details"""
+        return [
+            SourceDocument(
+                content=doc.page_content[:300] + "..." if len(doc.page_content) > 300 else doc.page_content,
+                source=doc.metadata.get("source", "Unknown"),
+                page=doc.metadata.get("page")
+            )
+            for doc, distance in results
+        ]
+    
+    def _trim_history(self, messages: List[dict]) -> Optional[List[dict]]:
+        """Fit conversation history into the prompt token budget"""
+        if not messages:
+            return None
+        conversation_history = trim_history(messages, settings.conversation_history_token_budget)
+        logger.debug("Using conversation history with %d of %d messages", len(conversation_history), len(messages))
+        return conversation_history or None
+    
+    async def _aget_history(self, conversation_id: Optional[str]) -> Optional[List[dict]]:
+        """Get conversation history without blocking the event loop"""
+        if not conversation_id:
+            return None
+        return self._trim_history(await self.conversation_store.aget(conversation_id))
+    
+    async def _aupdate_history(self, conversation_id: Optional[str], question: str, answer: str):
+        """Update conversation history without blocking the event loop"""
+        if conversation_id:
+            await self.conversation_store.aappend(conversation_id, question, answer)
+    
+    async def aquery(self, question: str, conversation_id: Optional[str] = None,
+                     filters: Optional[QueryFilter] = None) -> QueryResponse:
+        """Process a query without blocking the event loop"""
         
         # Generate conversation ID if not provided
         if not conversation_id:
             conversation_id = str(uuid.uuid4())
+        filters = normalize_filter(filters)
+        key = cache_key(question, filters)
+        self._record_question(question, filters)
         
         # Check cache
-        cached_response = self.cache_service.get(question)
+        with stage("cache_lookup"):
+            cached_response = await self.cache_service.aget(key)
         if cached_response:
             cached_response['conversation_id'] = conversation_id
             return QueryResponse(**cached_response, cached=True)
@@ -71,92 +451,292 @@ class RAGPipeline:
         # Check if vector store has documents
         if self.vector_store.index.ntotal == 0:
             return QueryResponse(
-                answer="⚠️ No documents have been indexed yet. Please upload and index documents first using the /index-documents endpoint.",
+                answer=NO_DOCUMENTS_ANSWER,
                 sources=[],
                 conversation_id=conversation_id,
                 cached=False
             )
         
-        print(f"\n{'='*60}")
-        print(f"Processing query: {question}")
-        print(f"Vector store contains: {self.vector_store.index.ntotal} vectors")
+        if settings.single_flight_enabled:
+            # Concurrent requests for the same question share one computation
+            response, generated = await self.single_flight.run(
+                key, lambda: self._agenerate_once(question, conversation_id, filters)
+            )
+        else:
+            response, generated = await self._agenerate(question, conversation_id, filters)
         
-        # Generate query embedding
-        query_embedding = self.embedding_service.embed_query(question)
-        print(f"Query embedding shape: {query_embedding.shape}")
+        response = response.copy(update={"conversation_id": conversation_id})
+        if generated:
+            with stage("history_update"):
+                await self._aupdate_history(conversation_id, question, response.answer)
+        return response
+    
+    async def _agenerate_once(self, question: str, conversation_id: str,
+                              filters: Optional[QueryFilter] = None) -> Tuple[QueryResponse, bool]:
+        """Generate an answer unless another worker is already generating the same one"""
+        key = cache_key(question, filters)
+        lease = await self.cache_service.aacquire_lease(key)
+        if lease is None:
+            cached_response = await self.cache_service.await_fill(key)
+            if cached_response:
+                return QueryResponse(**cached_response, cached=True), False
+            logger.info("Lease holder did not fill the cache, generating answer")
         
-        # Search similar documents (increased k for better results)
-        results = self.vector_store.similarity_search(
-            query_embedding,
-            k=settings.top_k_results
-        )
+        try:
+            return await self._agenerate(question, conversation_id, filters)
+        finally:
+            await self.cache_service.arelease_lease(key, lease)
+    
+    async def _agenerate(self, question: str, conversation_id: str, filters: Optional[QueryFilter] = None,
+                         refresh: bool = False) -> Tuple[QueryResponse, bool]:
+        """Retrieve and generate an answer, returning it and whether the LLM produced it.
+        
+        `refresh` bypasses the semantic cache, which would return the very entry being refreshed.
+        """
+        logger.debug("Processing query: %s (%d vectors)", question, self.vector_store.index.ntotal)
+        cache_namespace = self.cache_service.namespace
         
-        print(f"Found {len(results)} similar documents")
+        # Embedding goes through the micro-batcher, FAISS search runs on the executor
+        with stage("embedding"):
+            query_embedding = await self.embedding_service.aembed_query(question, executor=self.executor)
         
-        # Debug: Print distances
-        for i, (doc, distance) in enumerate(results):
-            print(f"  Result {i+1}: distance={distance:.4f}, source={doc.metadata.get('source', 'Unknown')}")
+        # Check semantic cache for a paraphrase of an answered question (unfiltered questions only)
+        if filters is None and not refresh:
+            with stage("semantic_cache_lookup"):
+                cached_response = await self.cache_service.aget_similar(query_embedding)
+            if cached_response:
+                return QueryResponse(**cached_response, cached=True), False
+        
+        with stage("vector_search"):
+            results = await self._asearch(question, query_embedding, filters)
         
         # If no results found
         if not results:
-            return QueryResponse(
-                answer="I couldn't find any relevant information in the indexed documents to answer your question.",
-                sources=[],
-                conversation_id=conversation_id,
-                cached=False
-            )
+            return QueryResponse(answer=NO_RESULTS_ANSWER, sources=[], cached=False), False
         
-        # Prepare context from top results
-        context_parts = []
-        for doc, distance in results:
-            source = doc.metadata.get("source", "Unknown")
-            page = doc.metadata.get("page", "")
-            page_info = f" (Page {page})" if page else ""
-            context_parts.append(f"[Source: {source}{page_info}]\n{doc.page_content}")
+        with stage("context_assembly"):
+            context = self._build_context(results)
+        conversation_history = await self._aget_history(conversation_id)
         
-        context = "\n\n---\n\n".join(context_parts)
-        print(f"Context length: {len(context)} characters")
+        # Generate answer
+        with stage("llm"):
+            answer = await self.llm_service.agenerate_answer(question, context, conversation_history)
+        logger.debug("Generated answer length: %d characters", len(answer))
         
-        # Get conversation history
-        conversation_history = None
-        if conversation_id and conversation_id in self.conversation_store:
-            conversation_history = self.conversation_store[conversation_id]
-            print(f"Using conversation history with {len(conversation_history)} messages")
+        sources = self._build_sources(results)
         
-        # Generate answer
-        answer = self.llm_service.generate_answer(question, context, conversation_history)
-        print(f"Generated answer length: {len(answer)} characters")
+        response = QueryResponse(answer=answer, sources=sources, cached=False)
         
-        # Prepare sources with more details
-        sources = [
-            SourceDocument(
-                content=doc.page_content[:300] + "..." if len(doc.page_content) > 300 else doc.page_content,
-                source=doc.metadata.get("source", "Unknown"),
-                page=doc.metadata.get("page")
+        # Cache response (without conversation_id to make cache reusable)
+        cache_data = response.dict(exclude={"cached", "conversation_id"})
+        with stage("cache_write"):
+            await self.cache_service.aset(
+                cache_key(question, filters), cache_data, query_embedding if filters is None else None,
+                namespace=cache_namespace
             )
-            for doc, distance in results
-        ]
         
-        print(f"Prepared {len(sources)} source documents")
-        print(f"{'='*60}\n")
+        return response, True
+    
+    def _record_question(self, question: str, filters: Optional[QueryFilter]):
+        """Count a question towards the hot set in the background, so the cache lookup doesn't wait on Redis.
         
-        # Create response
-        response = QueryResponse(
-            answer=answer,
-            sources=sources,
-            conversation_id=conversation_id,
-            cached=False
-        )
+        Filtered questions are not warmed, so not counted.
+        """
+        if filters is None and self.hot_questions is not None:
+            task = asyncio.ensure_future(self.hot_questions.arecord(question))
+            self._recording.add(task)
+            task.add_done_callback(self._recording.discard)
+    
+    async def awarm_answer(self, question: str) -> bool:
+        """Regenerate and cache the answer to a hot question ahead of demand; returns whether the LLM produced it"""
+        if self.vector_store.index.ntotal == 0:
+            return False
+        lease = await self.cache_service.aacquire_lease(question)
+        if lease is None:
+            # A request is generating it right now
+            return False
+        try:
+            # A fresh conversation, so the answer doesn't depend on anyone's history
+            _, generated = await self._agenerate(question, str(uuid.uuid4()), refresh=True)
+            return generated
+        finally:
+            await self.cache_service.arelease_lease(question, lease)
+    
+    async def ahot_questions(self) -> dict:
+        """Hot questions with the state of their cached answers, and the cache warmer's status"""
+        if self.hot_questions is None:
+            return {"enabled": False}
+        hot = await self.hot_questions.atop()
+        ttls = await self.cache_service.aremaining_ttl([question for question, _ in hot])
+        return {
+            "enabled": True,
+            "questions": [
+                {"question": question, "count": count, "cached": ttl is not None, "expires_in": ttl}
+                for (question, count), ttl in zip(hot, ttls)
+            ],
+            "warming": self.cache_warmer.status() if self.cache_warmer is not None else {"enabled": False}
+        }
+    
+    def _replay_cached(self, cached_response: dict, conversation_id: str):
+        """Replay a cached answer as stream events"""
+        yield "sources", {"sources": cached_response["sources"], "conversation_id": conversation_id}
+        for token in _REPLAY_TOKEN_PATTERN.findall(cached_response["answer"]):
+            yield "token", {"content": token}
+        yield "done", {"conversation_id": conversation_id, "cached": True}
+    
+    async def astream_query(self, question: str, conversation_id: Optional[str] = None,
+                            filters: Optional[QueryFilter] = None) -> AsyncIterator[Tuple[str, dict]]:
+        """Process a query, yielding (event, data) pairs: sources first, then answer tokens"""
         
-        # Update conversation history
-        if conversation_id:
-            if conversation_id not in self.conversation_store:
-                self.conversation_store[conversation_id] = []
-            self.conversation_store[conversation_id].append({"role": "user", "content": question})
-            self.conversation_store[conversation_id].append({"role": "assistant", "content": answer})
+        # Generate conversation ID if not provided
+        if not conversation_id:
+            conversation_id = str(uuid.uuid4())
+        filters = normalize_filter(filters)
+        key = cache_key(question, filters)
+        self._record_question(question, filters)
+        
+        # Check cache and replay the stored answer as a stream
+        with stage("cache_lookup"):
+            cached_response = await self.cache_service.aget(key)
+        if cached_response:
+            for event in self._replay_cached(cached_response, conversation_id):
+                yield event
+            return
+        
+        # Check if vector store has documents
+        if self.vector_store.index.ntotal == 0:
+            yield "sources", {"sources": [], "conversation_id": conversation_id}
+            yield "token", {"content": NO_DOCUMENTS_ANSWER}
+            yield "done", {"conversation_id": conversation_id, "cached": False}
+            return
+        
+        logger.debug("Streaming query: %s", question)
+        cache_namespace = self.cache_service.namespace
+        
+        with stage("embedding"):
+            query_embedding = await self.embedding_service.aembed_query(question, executor=self.executor)
+        
+        if filters is None:
+            with stage("semantic_cache_lookup"):
+                cached_response = await self.cache_service.aget_similar(query_embedding)
+            if cached_response:
+                for event in self._replay_cached(cached_response, conversation_id):
+                    yield event
+                return
+        
+        with stage("vector_search"):
+            results = await self._asearch(question, query_embedding, filters)
+        
+        # If no results found
+        if not results:
+            yield "sources", {"sources": [], "conversation_id": conversation_id}
+            yield "token", {"content": NO_RESULTS_ANSWER}
+            yield "done", {"conversation_id": conversation_id, "cached": False}
+            return
+        
+        # Sources go out before the LLM call so the client has something to render immediately
+        sources = self._build_sources(results)
+        yield "sources", {
+            "sources": [source.dict() for source in sources],
+            "conversation_id": conversation_id
+        }
+        
+        with stage("context_assembly"):
+            context = self._build_context(results)
+        conversation_history = await self._aget_history(conversation_id)
+        
+        answer_parts = []
+        started = time.perf_counter()
+        try:
+            async for token in self.llm_service.astream_answer(question, context, conversation_history):
+                if not answer_parts:
+                    observe_stage("llm_first_token", time.perf_counter() - started)
+                answer_parts.append(token)
+                yield "token", {"content": token}
+            observe_stage("llm", time.perf_counter() - started)
+        except Exception as e:
+            # Partial answers are neither cached nor added to history
+            error = {"detail": f"Error generating response: {str(e)}"}
+            if isinstance(e, LLMUnavailableError):
+                error["retry_after"] = e.retry_after_header
+            yield "error", error
+            return
+        
+        answer = "".join(answer_parts)
+        logger.debug("Streamed answer length: %d characters", len(answer))
+        
+        with stage("history_update"):
+            await self._aupdate_history(conversation_id, question, answer)
         
         # Cache response (without conversation_id to make cache reusable)
-        cache_data = response.dict(exclude={"cached", "conversation_id"})
-        self.cache_service.set(question, cache_data)
+        cache_data = QueryResponse(answer=answer, sources=sources).dict(exclude={"cached", "conversation_id"})
+        with stage("cache_write"):
+            await self.cache_service.aset(
+                key, cache_data, query_embedding if filters is None else None, namespace=cache_namespace
+            )
+        
+        yield "done", {"conversation_id": conversation_id, "cached": False}
+    
+    async def aquery_batch(self, questions: List[str]) -> List[BatchQueryItem]:
+        """Answer many independent questions, vectorizing embedding, search and cache reads"""
+        items: List[Optional[BatchQueryItem]] = [None] * len(questions)
+        
+        # One MGET for every exact cache entry
+        for i, cached_response in enumerate(await self.cache_service.aget_many(questions)):
+            if cached_response:
+                items[i] = BatchQueryItem(question=questions[i], **cached_response, cached=True)
+        
+        # Identical questions within the batch are answered once
+        pending = list(dict.fromkeys(questions[i] for i, item in enumerate(items) if item is None))
+        answers: Dict[str, BatchQueryItem] = {}
+        
+        if pending and self.vector_store.index.ntotal == 0:
+            answers = {question: BatchQueryItem(question=question, answer=NO_DOCUMENTS_ANSWER) for question in pending}
+            pending = []
+        
+        if pending:
+            logger.info("Batch of %d questions, %d to answer", len(questions), len(pending))
+            cache_namespace = self.cache_service.namespace
+            loop = asyncio.get_running_loop()
+            embeddings = await loop.run_in_executor(self.executor, self.embedding_service.embed_queries, pending)
+            
+            # Semantic cache is a local vector lookup per question
+            uncached = []
+            for question, query_embedding in zip(pending, embeddings):
+                cached_response = await self.cache_service.aget_similar(query_embedding)
+                if cached_response:
+                    answers[question] = BatchQueryItem(question=question, **cached_response, cached=True)
+                else:
+                    uncached.append((question, query_embedding))
+            
+            if uncached:
+                uncached_questions = [question for question, _ in uncached]
+                uncached_embeddings = np.stack([query_embedding for _, query_embedding in uncached])
+                search_results = await loop.run_in_executor(
+                    self.executor, self._search_batch, uncached_questions, uncached_embeddings
+                )
+                
+                semaphore = asyncio.Semaphore(settings.batch_llm_concurrency)
+                
+                async def answer(question: str, query_embedding, results) -> BatchQueryItem:
+                    if not results:
+                        return BatchQueryItem(question=question, answer=NO_RESULTS_ANSWER)
+                    async with semaphore:
+                        answer_text = await self.llm_service.agenerate_answer(question, self._build_context(results))
+                    sources = self._build_sources(results)
+                    cache_data = QueryResponse(answer=answer_text, sources=sources).dict(exclude={"cached", "conversation_id"})
+                    await self.cache_service.aset(question, cache_data, query_embedding, namespace=cache_namespace)
+                    return BatchQueryItem(question=question, answer=answer_text, sources=sources)
+                
+                outcomes = await asyncio.gather(
+                    *[answer(question, query_embedding, results)
+                      for (question, query_embedding), results in zip(uncached, search_results)],
+                    return_exceptions=True
+                )
+                for question, outcome in zip(uncached_questions, outcomes):
+                    if isinstance(outcome, Exception):
+                        outcome = BatchQueryItem(question=question, error=str(outcome))
+                    answers[question] = outcome
         
-        return response
\ No newline at end of file
+        # Results come back in input order
+        return [item if item is not None else answers[question] for question, item in zip(questions, items)]
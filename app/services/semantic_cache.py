@@ -0,0 +1,125 @@
+import faiss
+import numpy as np
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+class SemanticCache:
+    """In-process vector index over the embeddings of answered questions.
+    
+    Maps each cached question's embedding to the Redis key holding its answer,
+    so a paraphrase whose cosine similarity clears `threshold` reuses that
+    answer. Entries are evicted after `ttl` seconds or, oldest first, once
+    `max_entries` is reached. Adding a key again replaces its entry.
+    """
+    
+    def __init__(self, threshold: float, max_entries: int, ttl: int):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.index = None  # Created on first add, once the embedding dimension is known
+        self._entries: "OrderedDict[int, Tuple[str, float]]" = OrderedDict()  # id -> (cache key, expires at)
+        self._ids: Dict[str, int] = {}  # cache key -> id
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.lookups = 0
+        self.hits = 0
+    
+    @staticmethod
+    def _normalize(embedding: np.ndarray) -> np.ndarray:
+        vector = np.asarray(embedding, dtype='float32').reshape(1, -1).copy()
+        faiss.normalize_L2(vector)
+        return vector
+    
+    def _remove_ids(self, ids):
+        if ids:
+            self.index.remove_ids(np.asarray(ids, dtype='int64'))
+    
+    def _forget(self, entry_id: int, key: str):
+        if self._ids.get(key) == entry_id:
+            del self._ids[key]
+    
+    def _evict_expired(self):
+        # TTL is fixed, so insertion order is also expiry order
+        now = time.time()
+        expired = []
+        for entry_id, (_, expires_at) in self._entries.items():
+            if expires_at > now:
+                break
+            expired.append(entry_id)
+        for entry_id in expired:
+            self._forget(entry_id, self._entries.pop(entry_id)[0])
+        self._remove_ids(expired)
+    
+    def lookup(self, embedding: np.ndarray) -> Optional[Tuple[int, str]]:
+        """Return (entry id, cache key) of the closest cached question above the threshold"""
+        with self._lock:
+            self.lookups += 1
+            if self.index is None:
+                return None
+            self._evict_expired()
+            if self.index.ntotal == 0:
+                return None
+            similarities, ids = self.index.search(self._normalize(embedding), 1)
+            entry_id = int(ids[0][0])
+            if entry_id < 0 or similarities[0][0] < self.threshold:
+                return None
+            return entry_id, self._entries[entry_id][0]
+    
+    def record_hit(self):
+        with self._lock:
+            self.hits += 1
+    
+    def add(self, embedding: np.ndarray, key: str):
+        """Index a cached question's embedding under its cache key"""
+        vector = self._normalize(embedding)
+        with self._lock:
+            if self.index is None:
+                self.index = faiss.IndexIDMap2(faiss.IndexFlatIP(vector.shape[1]))
+            self._evict_expired()
+            
+            # Re-caching an answer (e.g. by the cache warmer) replaces its entry rather than adding a duplicate
+            evicted = []
+            previous_id = self._ids.pop(key, None)
+            if previous_id is not None:
+                del self._entries[previous_id]
+                evicted.append(previous_id)
+            while len(self._entries) >= self.max_entries:
+                entry_id, (evicted_key, _) = self._entries.popitem(last=False)
+                self._forget(entry_id, evicted_key)
+                evicted.append(entry_id)
+            self._remove_ids(evicted)
+            
+            entry_id = self._next_id
+            self._next_id += 1
+            self.index.add_with_ids(vector, np.asarray([entry_id], dtype='int64'))
+            self._entries[entry_id] = (key, time.time() + self.ttl)
+            self._ids[key] = entry_id
+    
+    def remove(self, entry_id: int):
+        """Drop an entry whose payload is no longer in Redis"""
+        with self._lock:
+            entry = self._entries.pop(entry_id, None)
+            if entry is not None:
+                self._forget(entry_id, entry[0])
+                self._remove_ids([entry_id])
+    
+    def clear(self):
+        with self._lock:
+            if self.index is not None:
+                self.index.reset()
+            self._entries.clear()
+            self._ids.clear()
+    
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "entries": len(self._entries),
+                "threshold": self.threshold,
+                "max_entries": self.max_entries,
+                "ttl": self.ttl,
+                "lookups": self.lookups,
+                "hits": self.hits,
+                "hit_rate": self.hits / self.lookups if self.lookups else 0.0,
+            }
@@ -0,0 +1,6 @@
+# Llama-family tokenizers average roughly four characters of English text per token
+CHARS_PER_TOKEN = 4
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token count estimate, good enough for prompt budgeting"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
@@ -1,88 +1,336 @@
+import logging
 import faiss
 import numpy as np
 import pickle
 import os
-from typing import List, Tuple
+from typing import List, Optional, Tuple
 from langchain_core.documents import Document
+from app.services.chunk_store import ChunkStore
+from app.services.index_factory import (
+    configure_search, create_index, export_vectors, index_type_of, min_training_points, read_index,
+    search_parameters
+)
+from app.services.index_generations import current_generation, generation_path
+from app.services.index_manifest import IndexManifest
+from app.services.lexical_index import BM25Index
+from app.services.metadata_index import IdFilter, MetadataIndex
+from app.config import get_settings
+
+settings = get_settings()
+logger = logging.getLogger(__name__)
 
 class FAISSVectorStore:
-    def __init__(self, dimension: int = 384):
+    def __init__(self, dimension: int = 384, index_path: Optional[str] = None):
         self.dimension = dimension
-        self.index = faiss.IndexFlatL2(dimension)
-        self.documents: List[Document] = []
-        self.index_path = "storage/faiss_index"
+        self.index = self._new_index()
+        self.chunk_store = ChunkStore()
+        self.lexical_index = BM25Index()
+        self.metadata_index = MetadataIndex()
+        self.next_id = 0
+        self.manifest = IndexManifest()
+        self.index_root = "storage/faiss_index"
+        # Without an explicit path, load() follows the published generation
+        self.follows_current = index_path is None
+        self.index_path = index_path or self.index_root
+        self.generation: Optional[str] = None
+        # A memory-mapped index is shared with other workers and never modified
+        self.mapped = False
         os.makedirs(self.index_path, exist_ok=True)
     
-    def add_documents(self, documents: List[Document], embeddings: np.ndarray):
-        """Add documents and their embeddings to the index"""
+    def _index_params(self) -> dict:
+        return dict(
+            hnsw_m=settings.vector_index_hnsw_m,
+            nlist=settings.vector_index_nlist,
+            pq_m=settings.vector_index_pq_m,
+            pq_nbits=settings.vector_index_pq_nbits
+        )
+    
+    def _new_index(self):
+        # ID-mapped so vectors of changed or deleted files can be removed. Index
+        # types that need training start as a flat index until there is enough
+        # data to train them (see build_configured_index)
+        index = create_index(self.dimension, settings.vector_index_type, **self._index_params())
+        if not index.is_trained:
+            index = create_index(self.dimension, "flat")
+        configure_search(index, settings.vector_index_nprobe, settings.vector_index_ef_search)
+        return index
+    
+    def build_configured_index(self):
+        """Rebuild into the configured index type once there are enough vectors to train it"""
+        index_type = settings.vector_index_type
+        if index_type_of(self.index) == index_type or self.index.ntotal == 0:
+            return
+        
+        params = self._index_params()
+        required = min_training_points(index_type, self.index.ntotal, params["nlist"], params["pq_nbits"])
+        if self.index.ntotal < required:
+            logger.info("Keeping %s index: %s needs %d vectors to train, have %d", index_type_of(self.index), index_type, required, self.index.ntotal)
+            return
+        
+        ids, vectors = export_vectors(self.index)
+        index = create_index(self.dimension, index_type, len(ids), **params)
+        if not index.is_trained:
+            sample = vectors
+            max_train = max(required, settings.vector_index_max_train_size)
+            if len(vectors) > max_train:
+                sample = vectors[np.random.default_rng(0).choice(len(vectors), max_train, replace=False)]
+            index.train(sample)
+        index.add_with_ids(vectors, ids)
+        configure_search(index, settings.vector_index_nprobe, settings.vector_index_ef_search)
+        self.index = index
+        logger.info("Built %s index with %d vectors", index_type, self.index.ntotal)
+    
+    def add_documents(self, documents: List[Document], embeddings: np.ndarray) -> List[int]:
+        """Add documents and their embeddings to the index, returning their vector IDs"""
         if len(documents) != len(embeddings):
             raise ValueError(f"Document count ({len(documents)}) doesn't match embedding count ({len(embeddings)})")
         
-        self.documents.extend(documents)
+        self.check_writable()
+        ids = np.arange(self.next_id, self.next_id + len(documents), dtype='int64')
+        self.next_id += len(documents)
+        
         embeddings_float32 = embeddings.astype('float32')
-        self.index.add(embeddings_float32)
-        print(f"Added {len(documents)} documents. Total in index: {self.index.ntotal}")
+        self.index.add_with_ids(embeddings_float32, ids)
+        self.chunk_store.add(ids.tolist(), documents)
+        self.lexical_index.add(ids.tolist(), [doc.page_content for doc in documents])
+        self.metadata_index.add(ids.tolist(), documents)
+        logger.debug("Added %d documents. Total in index: %d", len(documents), self.index.ntotal)
+        return ids.tolist()
     
-    def similarity_search(self, query_embedding: np.ndarray, k: int = 3) -> List[Tuple[Document, float]]:
-        """Search for similar documents"""
+    def remove_ids(self, ids: List[int]) -> int:
+        """Remove vectors and their documents by vector ID"""
+        if not ids:
+            return 0
+        self.check_writable()
+        try:
+            removed = self.index.remove_ids(np.asarray(ids, dtype='int64'))
+        except RuntimeError:
+            # Graph indexes (HNSW) can't delete in place, rebuild without the removed IDs
+            removed = self._rebuild_without(ids)
+        self.chunk_store.remove(ids)
+        self.lexical_index.remove(ids)
+        self.metadata_index.remove(ids)
+        logger.debug("Removed %d documents. Total in index: %d", removed, self.index.ntotal)
+        return removed
+    
+    def check_writable(self):
+        """Raise if the store is memory-mapped and so can't take changes"""
+        if self.mapped:
+            raise RuntimeError(
+                f"Index generation {self.generation or '(legacy)'} is memory-mapped read-only, index into a new generation"
+            )
+    
+    def _rebuild_without(self, ids: List[int]) -> int:
+        all_ids, vectors = export_vectors(self.index)
+        keep = ~np.isin(all_ids, np.asarray(ids, dtype='int64'))
+        index = create_index(self.dimension, index_type_of(self.index), len(all_ids), **self._index_params())
+        index.add_with_ids(vectors[keep], all_ids[keep])
+        configure_search(index, settings.vector_index_nprobe, settings.vector_index_ef_search)
+        self.index = index
+        return int((~keep).sum())
+    
+    def search(self, query_embedding: np.ndarray, k: int = 3, id_filter: Optional[IdFilter] = None) -> List[Tuple[int, float]]:
+        """Search for the vector IDs nearest to a query embedding"""
+        rows = self.search_batch(query_embedding, k, id_filter)
+        return rows[0] if rows else []
+    
+    def search_batch(self, query_embeddings: np.ndarray, k: int = 3,
+                     id_filter: Optional[IdFilter] = None) -> List[List[Tuple[int, float]]]:
+        """Search for the nearest vector IDs of many query embeddings in one index call.
+        
+        With `id_filter`, only its IDs are considered, inside the index search itself.
+        """
         if self.index.ntotal == 0:
-            print("Warning: Vector store is empty!")
+            logger.warning("Vector store is empty")
             return []
         
         # Ensure proper shape and type
-        query_embedding = query_embedding.astype('float32')
-        if len(query_embedding.shape) == 1:
-            query_embedding = query_embedding.reshape(1, -1)
+        query_embeddings = query_embeddings.astype('float32')
+        if len(query_embeddings.shape) == 1:
+            query_embeddings = query_embeddings.reshape(1, -1)
         
         # Limit k to available documents
-        k = min(k, self.index.ntotal)
+        k = min(k, self.index.ntotal if id_filter is None else id_filter.count)
+        if k == 0:
+            return [[] for _ in query_embeddings]
         
-        distances, indices = self.index.search(query_embedding, k)
+        if id_filter is None:
+            distances, indices = self.index.search(query_embeddings, k)
+        else:
+            params = search_parameters(
+                self.index, id_filter.selector(), settings.vector_index_nprobe, settings.vector_index_ef_search
+            )
+            distances, indices = self.index.search(query_embeddings, k, params=params)
         
-        print(f"Search results - distances: {distances[0]}, indices: {indices[0]}")
+        # Approximate indexes pad with -1 when fewer than k neighbours are found
+        return [
+            [(int(idx), float(distance)) for idx, distance in zip(row_indices, row_distances) if idx >= 0]
+            for row_indices, row_distances in zip(indices, distances)
+        ]
+    
+    def lexical_search(self, query: str, k: int = 3, id_filter: Optional[IdFilter] = None) -> List[Tuple[int, float]]:
+        """Search for the vector IDs of the best BM25 matches for a query"""
+        return self.lexical_index.search(query, k, id_filter)
+    
+    def build_filter(self, sources: Optional[List[str]] = None, tags: Optional[List[str]] = None,
+                     page_min: Optional[int] = None, page_max: Optional[int] = None) -> IdFilter:
+        """Vector IDs matching metadata filters, for search_batch and lexical_search"""
+        return self.metadata_index.build_filter(sources, tags, page_min, page_max)
+    
+    def get_documents(self, scored_ids: List[Tuple[int, float]]) -> List[Tuple[Document, float]]:
+        """Materialize (vector id, score) pairs into (document, score) pairs"""
+        return self.get_documents_batch([scored_ids])[0]
+    
+    def get_documents_batch(self, rows: List[List[Tuple[int, float]]]) -> List[List[Tuple[Document, float]]]:
+        """Materialize several result lists with a single chunk store read"""
+        # Only the requested chunks are read from the chunk store
+        documents = self.chunk_store.get_many(list({vector_id for row in rows for vector_id, _ in row}))
         
         results = []
-        for idx, distance in zip(indices[0], distances[0]):
-            if 0 <= idx < len(self.documents):
-                results.append((self.documents[idx], float(distance)))
-            else:
-                print(f"Warning: Invalid index {idx}, documents length: {len(self.documents)}")
+        for row in rows:
+            row_results = []
+            for vector_id, score in row:
+                doc = documents.get(vector_id)
+                if doc is not None:
+                    row_results.append((doc, score))
+                else:
+                    logger.warning("Invalid index %d, not found in chunk store", vector_id)
+            results.append(row_results)
         
         return results
     
+    def get_vectors(self, ids: List[int]) -> Optional[np.ndarray]:
+        """Stored vectors by vector ID, or None if the index can't reconstruct them (ID-mapped IVF)"""
+        try:
+            return self.index.reconstruct_batch(np.asarray(ids, dtype='int64'))
+        except RuntimeError:
+            return None
+    
+    def similarity_search(self, query_embedding: np.ndarray, k: int = 3) -> List[Tuple[Document, float]]:
+        """Search for similar documents"""
+        return self.get_documents(self.search(query_embedding, k))
+    
     def save(self):
-        """Save index and documents to disk"""
+        """Save index, chunk store and manifest to disk"""
         try:
-            faiss.write_index(self.index, f"{self.index_path}/faiss.index")
-            with open(f"{self.index_path}/documents.pkl", 'wb') as f:
-                pickle.dump(self.documents, f)
-            print(f"Saved index with {self.index.ntotal} vectors and {len(self.documents)} documents")
+            self.build_configured_index()
+            # Written aside and renamed, so workers mapping the old file never see it truncated
+            index_file = f"{self.index_path}/faiss.index"
+            faiss.write_index(self.index, f"{index_file}.tmp")
+            os.replace(f"{index_file}.tmp", index_file)
+            self.chunk_store.set_meta("next_id", str(self.next_id))
+            self.chunk_store.save(f"{self.index_path}/chunks.db")
+            self.lexical_index.save(f"{self.index_path}/lexical")
+            self.metadata_index.save(f"{self.index_path}/metadata")
+            self.manifest.save(f"{self.index_path}/manifest.json")
+            logger.info("Saved index with %d vectors and %d documents", self.index.ntotal, self.chunk_store.count())
         except Exception as e:
-            print(f"Error saving index: {e}")
+            logger.error("Error saving index: %s", e)
             raise
     
-    def load(self):
-        """Load index and documents from disk"""
+    def load(self, mmap: bool = False):
+        """Load index, chunk store and manifest from disk.
+        
+        With `mmap`, the FAISS index and the lexical and metadata arrays are mapped
+        read-only instead of read into the heap, so every worker serving the same
+        generation shares one copy. The manifest is then left unloaded.
+        """
+        if self.follows_current:
+            self.generation = current_generation(self.index_root)
+            if self.generation:
+                self.index_path = generation_path(self.index_root, self.generation)
         try:
             index_file = f"{self.index_path}/faiss.index"
-            docs_file = f"{self.index_path}/documents.pkl"
+            chunks_file = f"{self.index_path}/chunks.db"
+            legacy_docs_file = f"{self.index_path}/documents.pkl"
             
-            if not os.path.exists(index_file) or not os.path.exists(docs_file):
-                print("No existing index found")
+            if not os.path.exists(index_file):
+                logger.info("No existing index found")
                 return False
             
-            self.index = faiss.read_index(index_file)
-            with open(docs_file, 'rb') as f:
-                self.documents = pickle.load(f)
+            if os.path.exists(chunks_file):
+                self.index = read_index(index_file, mmap)
+                self.mapped = mmap
+                configure_search(self.index, settings.vector_index_nprobe, settings.vector_index_ef_search)
+                self.chunk_store.load(chunks_file)
+                self.next_id = int(self.chunk_store.get_meta("next_id", "0"))
+                # Only needed to index changes, which mapped stores never take (see check_writable)
+                if mmap:
+                    self.manifest.clear()
+                else:
+                    self.manifest.load(f"{self.index_path}/manifest.json")
+                if not self.lexical_index.load(f"{self.index_path}/lexical", mmap):
+                    self._rebuild_lexical_index()
+                if not self.metadata_index.load(f"{self.index_path}/metadata", mmap):
+                    self._rebuild_metadata_index()
+            elif os.path.exists(legacy_docs_file):
+                self._migrate_legacy(index_file, legacy_docs_file)
+            else:
+                logger.info("No existing index found")
+                return False
             
-            print(f"Loaded index with {self.index.ntotal} vectors and {len(self.documents)} documents")
+            logger.info(
+                "Loaded index generation %s with %d vectors and %d documents%s",
+                self.generation or "(legacy)", self.index.ntotal, self.chunk_store.count(),
+                " (memory-mapped)" if self.mapped else ""
+            )
             return True
         except Exception as e:
-            print(f"Error loading index: {e}")
+            logger.error("Error loading index: %s", e)
             return False
     
+    def _migrate_legacy(self, index_file: str, docs_file: str):
+        """One-time conversion of a pickled document list into the chunk store"""
+        logger.info("Migrating documents.pkl to chunk store")
+        index = faiss.read_index(index_file)
+        with open(docs_file, 'rb') as f:
+            stored = pickle.load(f)
+        
+        if isinstance(stored, list):
+            # Positional flat index and a list of documents
+            self.index = self._new_index()
+            if index.ntotal:
+                self.index.add_with_ids(index.reconstruct_n(0, index.ntotal), np.arange(index.ntotal, dtype='int64'))
+            documents = dict(enumerate(stored))
+            self.next_id = len(stored)
+        else:
+            self.index = index
+            self.mapped = False
+            documents = stored["documents"]
+            self.next_id = stored["next_id"]
+        
+        self.chunk_store.clear()
+        self.chunk_store.add(list(documents), list(documents.values()))
+        self.lexical_index.clear()
+        self.lexical_index.add(list(documents), [doc.page_content for doc in documents.values()])
+        self.metadata_index.clear()
+        self.metadata_index.add(list(documents), list(documents.values()))
+        self.manifest.load(f"{self.index_path}/manifest.json")
+        self.save()
+    
+    def _rebuild_lexical_index(self):
+        """Build the BM25 index from the chunk store for indexes saved without one"""
+        logger.info("Building lexical index from chunk store")
+        self.lexical_index.clear()
+        for ids, texts in self.chunk_store.iter_texts():
+            self.lexical_index.add(ids, texts)
+        self.lexical_index.save(f"{self.index_path}/lexical")
+    
+    def _rebuild_metadata_index(self):
+        """Build the metadata index from the chunk store for indexes saved without one"""
+        logger.info("Building metadata index from chunk store")
+        self.metadata_index.clear()
+        for ids, documents in self.chunk_store.iter_documents():
+            self.metadata_index.add(ids, documents)
+        self.metadata_index.save(f"{self.index_path}/metadata")
+    
     def clear(self):
-        """Clear the index and documents"""
-        self.index = faiss.IndexFlatL2(self.dimension)
-        self.documents = []
-        print("Index cleared")
\ No newline at end of file
+        """Clear the index, documents and manifest"""
+        self.index = self._new_index()
+        self.mapped = False
+        self.chunk_store.clear()
+        self.lexical_index.clear()
+        self.metadata_index.clear()
+        self.next_id = 0
+        self.manifest.clear()
+        logger.info("Index cleared")
@@ -0,0 +1,96 @@
+"""Embedding backend comparison: PyTorch vs ONNX Runtime vs ONNX dynamic int8.
+
+Measures load time, document throughput and single-query latency per backend
+on chunks of the bundled documents, plus parity with the PyTorch vectors
+(cosine similarity and top-k retrieval overlap). ONNX backends are measured
+first, before anything imports torch.
+
+    python -m benchmarks.embedding_benchmark
+    python -m benchmarks.embedding_benchmark --backends onnx onnx_int8 --texts 2000 --output results/embedding.json
+"""
+import argparse
+import os
+import sys
+import time
+from benchmarks.harness import DOCUMENTS_DIR, Timer, configure_environment, latency_summary, write_results
+
+BACKENDS = ["onnx", "onnx_int8", "torch"]
+
+def load_backend(backend: str, args):
+    from app.config import get_settings
+    settings = get_settings()
+    if backend == "torch":
+        from sentence_transformers import SentenceTransformer
+        return SentenceTransformer(settings.embedding_model, device="cpu")
+    from app.services.onnx_embeddings import load_onnx_encoder
+    return load_onnx_encoder(settings.embedding_model, args.onnx_dir or settings.embedding_onnx_dir,
+                             quantized=backend == "onnx_int8", threads=args.threads)
+
+def benchmark(backend: str, texts: list, queries: list, args) -> tuple:
+    torch_loaded = "torch" in sys.modules
+    with Timer() as load:
+        model = load_backend(backend, args)
+    model.encode(texts[:args.batch_size], batch_size=args.batch_size)
+    
+    with Timer() as documents:
+        model.encode(texts, batch_size=args.batch_size)
+    
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        model.encode([query])
+        latencies.append(time.perf_counter() - started)
+    
+    return model, {
+        "backend": backend,
+        "load_seconds": load.seconds,
+        "imported_torch": not torch_loaded and "torch" in sys.modules,
+        "texts_per_second": len(texts) / documents.seconds,
+        "query_latency": latency_summary(latencies),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=BACKENDS)
+    parser.add_argument("--documents", default=DOCUMENTS_DIR)
+    parser.add_argument("--texts", type=int, default=1000, help="Chunks to embed per backend")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch-size", type=int, default=32)
+    parser.add_argument("--k", type=int, default=3, help="Neighbours compared for retrieval overlap")
+    parser.add_argument("--threads", type=int, default=0, help="ONNX Runtime intra-op threads (0 = default)")
+    parser.add_argument("--onnx-dir", help="Exported models directory (default: EMBEDDING_ONNX_DIR)")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+    configure_environment()
+    
+    from app.services.onnx_embeddings import parity_report, sample_texts
+    
+    texts = sample_texts(args.documents, args.texts)
+    # The first sentence of a chunk stands in for a user question
+    queries = [text.split(". ")[0] for text in texts[::max(1, len(texts) // args.queries)]][:args.queries]
+    
+    models = {}
+    results = []
+    print(f"{'backend':<10} {'load s':>7} {'texts/s':>8} {'query p50':>10} {'query p99':>10}")
+    for backend in sorted(args.backends, key=BACKENDS.index):
+        models[backend], result = benchmark(backend, texts, queries, args)
+        results.append(result)
+        latency = result["query_latency"]
+        print(f"{backend:<10} {result['load_seconds']:>7.2f} {result['texts_per_second']:>8.1f} "
+              f"{latency['p50_ms']:>10.2f} {latency['p99_ms']:>10.2f}")
+    
+    if "torch" in models:
+        for result in results:
+            if result["backend"] != "torch":
+                result["parity"] = parity_report(
+                    models["torch"].encode, models[result["backend"]].encode, texts, queries, k=args.k
+                )
+                print(f"{result['backend']} parity: cosine mean {result['parity']['cosine_mean']:.4f}, "
+                      f"min {result['parity']['cosine_min']:.4f}, overlap@{args.k} {result['parity']['retrieval_overlap_at_k']:.3f}")
+    
+    config = {name: value for name, value in vars(args).items() if name != "output"}
+    write_results(output, "embedding", config, results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Shared setup for the offline benchmarks: environment, timing statistics and JSON results."""
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from datetime import datetime, timezone
+import numpy as np
+
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DOCUMENTS_DIR = os.path.join(REPO_ROOT, "Data", "documents")
+
+def configure_environment(**overrides):
+    """Point the app at local stand-ins. Must run before anything under app/ is imported,
+    settings are read once per process."""
+    os.environ.setdefault("GROQ_API_KEY", "benchmark-stub")
+    # The embedding model has to come from the local Hugging Face cache
+    os.environ.setdefault("HF_HUB_OFFLINE", "1")
+    os.environ.setdefault("LOG_LEVEL", "WARNING")
+    for name, value in overrides.items():
+        os.environ[name.upper()] = str(value)
+    # Spawned ingestion workers and the server subprocess import app from the repo
+    paths = [REPO_ROOT] + [p for p in os.environ.get("PYTHONPATH", "").split(os.pathsep) if p]
+    os.environ["PYTHONPATH"] = os.pathsep.join(dict.fromkeys(paths))
+
+def work_directory(path: str = None) -> str:
+    """Switch to a scratch directory, so storage/ is never the repo's own index.
+    
+    A given path is kept between runs, letting incremental indexing skip unchanged documents.
+    """
+    path = os.path.abspath(path) if path else tempfile.mkdtemp(prefix="rag-benchmark-")
+    os.makedirs(path, exist_ok=True)
+    os.chdir(path)
+    return path
+
+def latency_summary(latencies: list) -> dict:
+    """Latency percentiles in milliseconds from durations in seconds"""
+    if not latencies:
+        return {"count": 0}
+    latencies_ms = np.asarray(latencies) * 1000
+    return {
+        "count": len(latencies_ms),
+        "mean_ms": float(latencies_ms.mean()),
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p90_ms": float(np.percentile(latencies_ms, 90)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+        "max_ms": float(latencies_ms.max()),
+    }
+
+def _git(*args) -> str:
+    try:
+        return subprocess.run(["git", *args], cwd=REPO_ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def environment_info() -> dict:
+    """Where and against which commit the numbers were taken"""
+    status = _git("status", "--porcelain", "--untracked-files=no")
+    return {
+        "commit": _git("rev-parse", "HEAD"),
+        "dirty": bool(status) if status is not None else None,
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+    }
+
+def write_results(path: str, benchmark: str, config: dict, results) -> dict:
+    """Write one benchmark's results as JSON, tagged with the commit they were taken at.
+    
+    Resolve `path` before work_directory() changes the working directory.
+    """
+    report = {"benchmark": benchmark, "environment": environment_info(), "config": config, "results": results}
+    if path:
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path, 'w') as f:
+            json.dump(report, f, indent=2)
+        print(f"Results written to {path}")
+    return report
+
+class Timer:
+    """Context manager recording elapsed wall time in seconds"""
+    
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+    
+    def __exit__(self, *exc):
+        self.seconds = time.perf_counter() - self.started
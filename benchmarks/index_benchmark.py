@@ -0,0 +1,123 @@
+"""Recall / latency / memory comparison of the supported vector index types.
+
+Uses the vectors of the saved index when one exists, otherwise synthetic
+clustered vectors. Exact results from a flat index are the ground truth.
+
+    python -m benchmarks.index_benchmark
+    python -m benchmarks.index_benchmark --synthetic 100000 --types flat hnsw ivf_flat --output results.json
+"""
+import argparse
+import os
+import time
+import faiss
+import numpy as np
+from benchmarks.harness import write_results
+from app.services.index_factory import (
+    INDEX_TYPES, configure_search, create_index, export_vectors, min_training_points
+)
+from app.services.index_generations import current_path
+
+def load_vectors(index_path: str) -> np.ndarray:
+    index_file = os.path.join(index_path, "faiss.index")
+    if not os.path.exists(index_file):
+        return None
+    index = faiss.read_index(index_file)
+    if index.ntotal == 0:
+        return None
+    if not isinstance(index, (faiss.IndexIDMap, faiss.IndexIVF)):
+        return index.reconstruct_n(0, index.ntotal)
+    return export_vectors(index)[1]
+
+def synthetic_vectors(count: int, dimension: int, seed: int = 0) -> np.ndarray:
+    """Clustered unit vectors, closer to sentence embeddings than uniform noise"""
+    rng = np.random.default_rng(seed)
+    centers = rng.standard_normal((max(1, count // 100), dimension)).astype('float32')
+    vectors = centers[rng.integers(0, len(centers), count)] + 0.3 * rng.standard_normal((count, dimension)).astype('float32')
+    faiss.normalize_L2(vectors)
+    return vectors
+
+def make_queries(vectors: np.ndarray, count: int, seed: int = 1) -> np.ndarray:
+    """Perturbed corpus vectors, so queries have real near neighbours"""
+    rng = np.random.default_rng(seed)
+    queries = vectors[rng.integers(0, len(vectors), count)] + 0.05 * rng.standard_normal((count, vectors.shape[1])).astype('float32')
+    return queries.astype('float32')
+
+def benchmark(index_type: str, vectors: np.ndarray, queries: np.ndarray, truth: np.ndarray, k: int, args) -> dict:
+    params = dict(hnsw_m=args.hnsw_m, nlist=args.nlist, pq_m=args.pq_m, pq_nbits=args.pq_nbits)
+    required = min_training_points(index_type, len(vectors), args.nlist, args.pq_nbits)
+    if len(vectors) < required:
+        return {"index_type": index_type, "skipped": f"needs {required} vectors to train"}
+    
+    started = time.perf_counter()
+    index = create_index(vectors.shape[1], index_type, len(vectors), **params)
+    if not index.is_trained:
+        index.train(vectors)
+    index.add_with_ids(vectors, np.arange(len(vectors), dtype='int64'))
+    build_seconds = time.perf_counter() - started
+    configure_search(index, args.nprobe, args.ef_search)
+    
+    latencies = []
+    hits = 0
+    for query, expected in zip(queries, truth):
+        started = time.perf_counter()
+        _, ids = index.search(query.reshape(1, -1), k)
+        latencies.append(time.perf_counter() - started)
+        hits += len(set(ids[0].tolist()) & set(expected.tolist()))
+    
+    latencies_ms = np.asarray(latencies) * 1000
+    return {
+        "index_type": index_type,
+        "recall_at_k": hits / (len(queries) * k),
+        "p50_ms": float(np.percentile(latencies_ms, 50)),
+        "p99_ms": float(np.percentile(latencies_ms, 99)),
+        "bytes_per_vector": faiss.serialize_index(index).nbytes / len(vectors),
+        "build_seconds": build_seconds,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--index-path", default="storage/faiss_index")
+    parser.add_argument("--synthetic", type=int, default=0, help="Use N synthetic vectors instead of the saved index")
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--types", nargs="+", default=list(INDEX_TYPES), choices=INDEX_TYPES)
+    parser.add_argument("--hnsw-m", type=int, default=32)
+    parser.add_argument("--ef-search", type=int, default=64)
+    parser.add_argument("--nlist", type=int, default=0)
+    parser.add_argument("--nprobe", type=int, default=8)
+    parser.add_argument("--pq-m", type=int, default=48)
+    parser.add_argument("--pq-nbits", type=int, default=8)
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+    
+    # The published generation, or the index root itself for indexes saved before generations
+    source = current_path(args.index_path)
+    vectors = None if args.synthetic else load_vectors(source)
+    if vectors is None:
+        vectors = synthetic_vectors(args.synthetic or 20000, args.dimension)
+        source = "synthetic"
+    vectors = np.ascontiguousarray(vectors, dtype='float32')
+    queries = make_queries(vectors, args.queries)
+    
+    exact = faiss.IndexFlatL2(vectors.shape[1])
+    exact.add(vectors)
+    _, truth = exact.search(queries, args.k)
+    
+    print(f"{len(vectors)} vectors ({source}), {len(queries)} queries, k={args.k}")
+    print(f"{'index':<10} {'recall@k':>9} {'p50 ms':>8} {'p99 ms':>8} {'B/vector':>9} {'build s':>8}")
+    results = []
+    for index_type in args.types:
+        result = benchmark(index_type, vectors, queries, truth, args.k, args)
+        results.append(result)
+        if "skipped" in result:
+            print(f"{index_type:<10} skipped: {result['skipped']}")
+        else:
+            print(f"{index_type:<10} {result['recall_at_k']:>9.3f} {result['p50_ms']:>8.3f} {result['p99_ms']:>8.3f} "
+                  f"{result['bytes_per_vector']:>9.1f} {result['build_seconds']:>8.2f}")
+    
+    config = {name: value for name, value in vars(args).items() if name != "output"}
+    write_results(args.output, "index", dict(config, vectors=len(vectors), source=source), results)
+
+if __name__ == "__main__":
+    main()
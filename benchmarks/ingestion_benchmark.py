@@ -0,0 +1,80 @@
+"""Ingestion throughput on the bundled documents.
+
+Each repetition indexes the documents into an empty store (extraction, splitting,
+embedding and FAISS insertion), followed by one incremental pass over the
+unchanged files. Needs the embedding model in the local Hugging Face cache.
+
+    python -m benchmarks.ingestion_benchmark
+    python -m benchmarks.ingestion_benchmark --repeat 3 --workers 4 --output results/ingestion.json
+"""
+import argparse
+import os
+from benchmarks.harness import DOCUMENTS_DIR, Timer, configure_environment, work_directory, write_results
+from benchmarks.stubs import RedisStandIn
+
+def run(args) -> dict:
+    from app.services.rag_pipeline import RAGPipeline
+    from app.services.vector_store import FAISSVectorStore
+    
+    workdir = work_directory(args.workdir)
+    with Timer() as model_load:
+        rag = RAGPipeline()
+    
+    runs = []
+    for repetition in range(args.repeat):
+        # A fresh directory per repetition, so nothing is skipped as unchanged
+        run_dir = os.path.join(workdir, f"run-{repetition}")
+        os.makedirs(run_dir, exist_ok=True)
+        os.chdir(run_dir)
+        rag.vector_store = FAISSVectorStore()
+        stats = rag.initialize_documents(args.documents)
+        runs.append(stats)
+        print(f"run {repetition + 1}: {stats['documents_processed']} pages, {stats['chunks_created']} chunks "
+              f"in {stats['elapsed_seconds']:.2f}s ({stats['pages_per_second']} pages/s, {stats['chunks_per_second']} chunks/s)")
+    
+    with Timer() as incremental:
+        unchanged = rag.initialize_documents(args.documents)
+    print(f"incremental pass over unchanged documents: {incremental.seconds:.3f}s")
+    
+    best = min(runs, key=lambda stats: stats["elapsed_seconds"])
+    return {
+        "model_load_seconds": model_load.seconds,
+        "pages": best["documents_processed"],
+        "chunks": best["chunks_created"],
+        "best_seconds": best["elapsed_seconds"],
+        "best_pages_per_second": best["pages_per_second"],
+        "best_chunks_per_second": best["chunks_per_second"],
+        "mean_seconds": sum(stats["elapsed_seconds"] for stats in runs) / len(runs),
+        "incremental_seconds": incremental.seconds,
+        "incremental_documents_skipped": unchanged["documents_skipped"],
+        "runs": runs,
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--documents", default=DOCUMENTS_DIR)
+    parser.add_argument("--repeat", type=int, default=1)
+    parser.add_argument("--workers", type=int, help="INGEST_WORKERS (0 = one per CPU core)")
+    parser.add_argument("--page-batch-size", type=int, help="INGEST_PAGE_BATCH_SIZE")
+    parser.add_argument("--embedding-batch-size", type=int, help="INGEST_EMBEDDING_BATCH_SIZE")
+    parser.add_argument("--workdir", help="Scratch directory for the index (default: a new temporary directory)")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+    args.documents = os.path.abspath(args.documents)
+    output = os.path.abspath(args.output) if args.output else None
+    
+    overrides = {
+        "ingest_workers": args.workers,
+        "ingest_page_batch_size": args.page_batch_size,
+        "ingest_embedding_batch_size": args.embedding_batch_size,
+    }
+    with RedisStandIn() as redis:
+        configure_environment(redis_host="127.0.0.1", redis_port=redis.port,
+                              **{name: value for name, value in overrides.items() if value is not None})
+        results = run(args)
+    
+    config = {name: value for name, value in vars(args).items() if name not in ("output", "workdir")}
+    write_results(output, "ingestion", config, results)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""End-to-end /query throughput and latency at increasing concurrency.
+
+Starts the Groq stub and the Redis stand-in in this process, indexes the bundled
+documents into a scratch directory, then runs the real API under uvicorn in a
+subprocess and drives POST /api/v1/query over HTTP.
+
+With --cache cold (default) every request is a distinct question and the
+semantic cache is disabled, so each request embeds, searches and calls the LLM.
+With --cache warm the question pool is answered once up front and the measured
+requests are all cache hits.
+
+    python -m benchmarks.query_benchmark
+    python -m benchmarks.query_benchmark --concurrency 1 8 32 --requests 400 --llm-latency-ms 300 --output results/query.json
+"""
+import argparse
+import asyncio
+import os
+import subprocess
+import sys
+import time
+import httpx
+from benchmarks.harness import (
+    DOCUMENTS_DIR, Timer, configure_environment, latency_summary, work_directory, write_results
+)
+from benchmarks.stubs import GroqStub, RedisStandIn, free_port
+
+QUESTIONS = [
+    "What is the recommended treatment for uncomplicated P. falciparum malaria?",
+    "How should severe malaria be treated in children?",
+    "What is the artesunate dose for severe malaria?",
+    "Which antimalarials are recommended in the first trimester of pregnancy?",
+    "When should primaquine be given to prevent relapse of P. vivax?",
+    "What are the recommendations for seasonal malaria chemoprevention?",
+    "How is malaria diagnosed before treatment?",
+    "What is intermittent preventive treatment in pregnancy?",
+    "Which insecticide-treated nets are recommended?",
+    "How should G6PD deficiency be assessed before primaquine?",
+    "What is the role of indoor residual spraying?",
+    "How long should artemisinin-based combination therapy be given?",
+    "What should be done if a patient vomits an antimalarial dose?",
+    "What are the criteria for severe malaria?",
+    "How should malaria be managed in travellers?",
+    "What is mass drug administration and when is it recommended?",
+]
+
+def ingest(documents: str) -> dict:
+    """Index the documents into the working directory, skipped when already up to date"""
+    from app.services.rag_pipeline import RAGPipeline
+    rag = RAGPipeline()
+    rag.load_index()
+    stats = rag.build_generation(documents)
+    rag.executor.shutdown()
+    return stats
+
+def start_server(workdir: str, workers: int, timeout: float) -> tuple:
+    port = free_port()
+    server = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "app.main:app", "--host", "127.0.0.1", "--port", str(port),
+         "--workers", str(workers), "--log-level", "warning", "--no-access-log"],
+        cwd=workdir, env=os.environ.copy()
+    )
+    url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise RuntimeError(f"API server exited with code {server.returncode}")
+        try:
+            if httpx.get(f"{url}/api/v1/health/ready", timeout=timeout).status_code == 200:
+                return server, url
+        except httpx.TransportError:
+            time.sleep(0.2)
+    server.terminate()
+    raise RuntimeError(f"API server not ready after {timeout}s")
+
+async def run_level(url: str, concurrency: int, questions: list) -> dict:
+    """Send every question with `concurrency` requests in flight"""
+    latencies = []
+    errors = 0
+    pending = iter(questions)
+    
+    async def worker(client: httpx.AsyncClient):
+        nonlocal errors
+        for question in pending:
+            started = time.perf_counter()
+            try:
+                response = await client.post("/api/v1/query", json={"question": question})
+                ok = response.status_code == 200
+            except httpx.HTTPError:
+                ok = False
+            if ok:
+                latencies.append(time.perf_counter() - started)
+            else:
+                errors += 1
+    
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=120) as client:
+        with Timer() as wall:
+            await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+    
+    return {
+        "concurrency": concurrency,
+        "requests": len(questions),
+        "errors": errors,
+        "seconds": wall.seconds,
+        "throughput_rps": len(latencies) / wall.seconds,
+        "latency": latency_summary(latencies),
+    }
+
+def make_questions(count: int, cache: str, tag: str) -> list:
+    questions = [QUESTIONS[i % len(QUESTIONS)] for i in range(count)]
+    if cache == "cold":
+        # A unique suffix per request misses the exact-match cache
+        questions = [f"{question} (benchmark {tag}-{i})" for i, question in enumerate(questions)]
+    return questions
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 4, 16, 64])
+    parser.add_argument("--requests", type=int, default=200, help="Requests per concurrency level")
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--cache", choices=["cold", "warm"], default="cold")
+    parser.add_argument("--workers", type=int, default=1, help="uvicorn worker processes")
+    parser.add_argument("--llm-latency-ms", type=float, default=200.0, help="Stub time to first token")
+    parser.add_argument("--llm-tokens-per-second", type=float, default=500.0)
+    parser.add_argument("--llm-completion-tokens", type=int, default=150)
+    parser.add_argument("--documents", default=DOCUMENTS_DIR)
+    parser.add_argument("--startup-timeout", type=float, default=300.0)
+    parser.add_argument("--workdir", help="Scratch directory for the index, reused between runs when given")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+    args.documents = os.path.abspath(args.documents)
+    output = os.path.abspath(args.output) if args.output else None
+    
+    groq = GroqStub(args.llm_latency_ms, args.llm_tokens_per_second, args.llm_completion_tokens).start()
+    redis = RedisStandIn().start()
+    server = None
+    try:
+        configure_environment(
+            groq_base_url=groq.base_url,
+            redis_host="127.0.0.1",
+            redis_port=redis.port,
+            semantic_cache_enabled=args.cache == "warm"
+        )
+        workdir = work_directory(args.workdir)
+        with Timer() as ingestion:
+            ingest_stats = ingest(args.documents)
+        print(f"Indexed {args.documents} in {ingestion.seconds:.1f}s ({ingest_stats['documents_skipped']} documents unchanged)")
+        
+        server, url = start_server(workdir, args.workers, args.startup_timeout)
+        tag = str(int(time.time()))
+        asyncio.run(run_level(url, min(args.concurrency), make_questions(args.warmup, args.cache, f"{tag}-warmup")))
+        if args.cache == "warm":
+            asyncio.run(run_level(url, 1, QUESTIONS))
+        
+        print(f"{'concurrency':>11} {'req/s':>8} {'p50 ms':>9} {'p99 ms':>9} {'errors':>7}")
+        results = []
+        for concurrency in args.concurrency:
+            llm_calls = groq.requests
+            result = asyncio.run(run_level(url, concurrency, make_questions(args.requests, args.cache, f"{tag}-{concurrency}")))
+            result["llm_calls"] = groq.requests - llm_calls
+            results.append(result)
+            latency = result["latency"]
+            print(f"{concurrency:>11} {result['throughput_rps']:>8.1f} {latency.get('p50_ms', 0):>9.1f} "
+                  f"{latency.get('p99_ms', 0):>9.1f} {result['errors']:>7}")
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait(timeout=30)
+        redis.stop()
+        groq.stop()
+    
+    config = {name: value for name, value in vars(args).items() if name not in ("output", "workdir")}
+    write_results(output, "query", config, {"ingestion_seconds": ingestion.seconds, "levels": results})
+
+if __name__ == "__main__":
+    main()
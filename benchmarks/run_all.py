@@ -0,0 +1,67 @@
+"""Run the offline benchmark suite and collect the results in one JSON file.
+
+Each benchmark runs in its own process (settings are read once per process)
+and writes its own JSON next to the combined file. Compare two commits by
+diffing their combined files.
+
+    python -m benchmarks.run_all --output benchmark-results/$(git rev-parse --short HEAD).json
+    python -m benchmarks.run_all --quick --output results.json
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+from benchmarks.harness import REPO_ROOT, environment_info
+
+BENCHMARKS = {
+    "ingestion": ["benchmarks.ingestion_benchmark"],
+    "embedding": ["benchmarks.embedding_benchmark"],
+    "search": ["benchmarks.search_benchmark"],
+    "index": ["benchmarks.index_benchmark", "--synthetic", "20000"],
+    "query": ["benchmarks.query_benchmark"],
+}
+
+# Smaller runs for a quick check before a full measurement
+QUICK_ARGS = {
+    "embedding": ["--texts", "200", "--queries", "50"],
+    "search": ["--sizes", "1000", "10000", "--queries", "200"],
+    "index": ["--queries", "100"],
+    "query": ["--concurrency", "1", "8", "--requests", "50"],
+}
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--only", nargs="+", choices=list(BENCHMARKS), default=list(BENCHMARKS))
+    parser.add_argument("--quick", action="store_true", help="Smaller corpus sizes and request counts")
+    parser.add_argument("--output", default="benchmark-results/results.json")
+    args = parser.parse_args()
+    output = os.path.abspath(args.output)
+    base, _ = os.path.splitext(output)
+    
+    combined = {"environment": environment_info(), "benchmarks": {}, "failed": []}
+    for name in args.only:
+        module, *module_args = BENCHMARKS[name]
+        result_file = f"{base}.{name}.json"
+        if os.path.exists(result_file):
+            os.remove(result_file)
+        command = [sys.executable, "-m", module, *module_args, "--output", result_file]
+        if args.quick:
+            command += QUICK_ARGS.get(name, [])
+        print(f"== {name}: {' '.join(command[1:])}", flush=True)
+        if subprocess.run(command, cwd=REPO_ROOT).returncode != 0 or not os.path.exists(result_file):
+            combined["failed"].append(name)
+            continue
+        with open(result_file) as f:
+            report = json.load(f)
+        combined["benchmarks"][name] = {"config": report["config"], "results": report["results"]}
+    
+    os.makedirs(os.path.dirname(output), exist_ok=True)
+    with open(output, 'w') as f:
+        json.dump(combined, f, indent=2)
+    print(f"Results written to {output}")
+    if combined["failed"]:
+        sys.exit(f"Failed: {', '.join(combined['failed'])}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,100 @@
+"""FAISSVectorStore.similarity_search latency at several corpus sizes.
+
+Synthetic clustered vectors and placeholder chunks go through the real store
+(FAISS index, SQLite chunk store, BM25 index), so no embedding model is needed.
+Search time is split into the index lookup and chunk materialization.
+
+    python -m benchmarks.search_benchmark
+    python -m benchmarks.search_benchmark --sizes 1000 10000 100000 --index-type hnsw --output results/search.json
+"""
+import argparse
+import os
+import time
+from benchmarks.harness import Timer, configure_environment, latency_summary, work_directory, write_results
+from benchmarks.index_benchmark import make_queries, synthetic_vectors
+
+def build_store(size: int, dimension: int, batch_size: int = 10000):
+    from langchain_core.documents import Document
+    from app.services.vector_store import FAISSVectorStore
+    
+    vectors = synthetic_vectors(size, dimension)
+    store = FAISSVectorStore(dimension=dimension)
+    for start in range(0, size, batch_size):
+        documents = [
+            Document(page_content=f"synthetic chunk {i} malaria treatment guideline section {i % 97}",
+                     metadata={"source": "synthetic.pdf", "page": i // 10 + 1})
+            for i in range(start, min(start + batch_size, size))
+        ]
+        store.add_documents(documents, vectors[start:start + batch_size])
+    store.build_configured_index()
+    return store, vectors
+
+def timed(fn, queries) -> list:
+    latencies = []
+    for query in queries:
+        started = time.perf_counter()
+        fn(query)
+        latencies.append(time.perf_counter() - started)
+    return latencies
+
+def benchmark(size: int, args) -> dict:
+    from app.services.index_factory import index_type_of
+    
+    with Timer() as build:
+        store, vectors = build_store(size, args.dimension)
+    queries = make_queries(vectors, args.queries)
+    
+    # Warm up caches and lazily initialized structures
+    for query in queries[:10]:
+        store.similarity_search(query, k=args.k)
+    
+    search = latency_summary(timed(lambda query: store.search(query, k=args.k), queries))
+    similarity_search = latency_summary(timed(lambda query: store.similarity_search(query, k=args.k), queries))
+    
+    batch_latencies = []
+    for start in range(0, len(queries), args.batch_size):
+        batch = queries[start:start + args.batch_size]
+        started = time.perf_counter()
+        store.get_documents_batch(store.search_batch(batch, k=args.k))
+        batch_latencies.append(time.perf_counter() - started)
+    
+    return {
+        "corpus_size": size,
+        "index_type": index_type_of(store.index),
+        "build_seconds": build.seconds,
+        "search": search,
+        "similarity_search": similarity_search,
+        "similarity_search_qps": 1000 / similarity_search["mean_ms"],
+        "batch_queries_per_second": len(queries) / sum(batch_latencies),
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--dimension", type=int, default=384)
+    parser.add_argument("--queries", type=int, default=500)
+    parser.add_argument("--k", type=int, default=3)
+    parser.add_argument("--batch-size", type=int, default=32, help="Queries per search_batch call")
+    parser.add_argument("--index-type", help="VECTOR_INDEX_TYPE (default: the configured type)")
+    parser.add_argument("--workdir", help="Scratch directory for the index (default: a new temporary directory)")
+    parser.add_argument("--output", help="Write results as JSON to this file")
+    args = parser.parse_args()
+    output = os.path.abspath(args.output) if args.output else None
+    
+    configure_environment(**({"vector_index_type": args.index_type} if args.index_type else {}))
+    work_directory(args.workdir)
+    
+    print(f"{'vectors':>8} {'build s':>8} {'search p50':>11} {'search p99':>11} {'full p50':>9} {'full p99':>9} {'batch q/s':>10}")
+    results = []
+    for size in args.sizes:
+        result = benchmark(size, args)
+        results.append(result)
+        print(f"{size:>8} {result['build_seconds']:>8.2f} {result['search']['p50_ms']:>11.3f} {result['search']['p99_ms']:>11.3f} "
+              f"{result['similarity_search']['p50_ms']:>9.3f} {result['similarity_search']['p99_ms']:>9.3f} "
+              f"{result['batch_queries_per_second']:>10.0f}")
+    
+    config = {name: value for name, value in vars(args).items() if name not in ("output", "workdir")}
+    write_results(output, "search", config, results)
+
+if __name__ == "__main__":
+    main()
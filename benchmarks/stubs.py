@@ -0,0 +1,168 @@
+"""Local stand-ins for the external services, so benchmarks run without network.
+
+GroqStub serves the OpenAI-compatible chat completions endpoint the Groq SDK
+calls, with a configurable time to first token and token rate. RedisStandIn is
+an in-process Redis speaking the real wire protocol (fakeredis), so the app's
+redis clients connect to it unchanged.
+"""
+import asyncio
+import json
+import socket
+import threading
+import time
+import uuid
+import uvicorn
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+def free_port() -> int:
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+class ServerThread:
+    """Runs an ASGI app with uvicorn on a background thread"""
+    
+    def __init__(self, app, port: int = 0):
+        self.port = port or free_port()
+        config = uvicorn.Config(app, host="127.0.0.1", port=self.port, log_level="warning", access_log=False)
+        self.server = uvicorn.Server(config)
+        self.thread = threading.Thread(target=self.server.run, name="benchmark-server", daemon=True)
+    
+    @property
+    def url(self) -> str:
+        return f"http://127.0.0.1:{self.port}"
+    
+    def start(self, timeout: float = 10.0):
+        self.thread.start()
+        deadline = time.monotonic() + timeout
+        while not self.server.started:
+            if time.monotonic() > deadline or not self.thread.is_alive():
+                raise RuntimeError(f"Server on port {self.port} failed to start")
+            time.sleep(0.01)
+        return self
+    
+    def stop(self):
+        self.server.should_exit = True
+        self.thread.join(timeout=10)
+
+class GroqStub:
+    """OpenAI/Groq-compatible chat completions server with synthetic latency.
+    
+    Every answer waits `latency_ms` before the first token, then emits
+    `completion_tokens` tokens at `tokens_per_second`.
+    """
+    
+    def __init__(self, latency_ms: float = 200.0, tokens_per_second: float = 500.0, completion_tokens: int = 150, port: int = 0):
+        self.latency = latency_ms / 1000
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.requests = 0
+        self.app = FastAPI()
+        self.app.post("/openai/v1/chat/completions")(self._chat_completions)
+        self.app.get("/openai/v1/models")(self._models)
+        self._server = ServerThread(self.app, port)
+    
+    @property
+    def base_url(self) -> str:
+        return self._server.url
+    
+    def start(self):
+        self._server.start()
+        return self
+    
+    def stop(self):
+        self._server.stop()
+    
+    def __enter__(self):
+        return self.start()
+    
+    def __exit__(self, *exc):
+        self.stop()
+    
+    def _usage(self, messages: list) -> dict:
+        prompt_tokens = sum(len(message.get("content") or "") for message in messages) // 4
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": self.completion_tokens,
+            "total_tokens": prompt_tokens + self.completion_tokens
+        }
+    
+    def _tokens(self):
+        return [f"token{i} " for i in range(self.completion_tokens)]
+    
+    async def _models(self):
+        # Listed by the app's startup warm-up
+        return {"object": "list", "data": [{"id": "stub", "object": "model", "created": 0, "owned_by": "benchmarks"}]}
+    
+    async def _chat_completions(self, request: Request):
+        body = await request.json()
+        self.requests += 1
+        completion_id = f"chatcmpl-{uuid.uuid4().hex}"
+        created = int(time.time())
+        model = body.get("model", "stub")
+        usage = self._usage(body.get("messages", []))
+        
+        if body.get("stream"):
+            return StreamingResponse(self._stream(completion_id, created, model, usage), media_type="text/event-stream")
+        
+        await asyncio.sleep(self.latency + self.completion_tokens / self.tokens_per_second)
+        return {
+            "id": completion_id,
+            "object": "chat.completion",
+            "created": created,
+            "model": model,
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": "".join(self._tokens()).strip()},
+                "finish_reason": "stop"
+            }],
+            "usage": usage
+        }
+    
+    async def _stream(self, completion_id: str, created: int, model: str, usage: dict):
+        def chunk(delta: dict, finish_reason=None, **extra) -> str:
+            payload = {
+                "id": completion_id,
+                "object": "chat.completion.chunk",
+                "created": created,
+                "model": model,
+                "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}],
+                **extra
+            }
+            return f"data: {json.dumps(payload)}\n\n"
+        
+        await asyncio.sleep(self.latency)
+        yield chunk({"role": "assistant", "content": ""})
+        interval = 1 / self.tokens_per_second
+        for token in self._tokens():
+            await asyncio.sleep(interval)
+            yield chunk({"content": token})
+        # Groq reports usage on the final chunk
+        yield chunk({}, "stop", x_groq={"id": completion_id, "usage": usage})
+        yield "data: [DONE]\n\n"
+
+class RedisStandIn:
+    """In-process Redis server on a local TCP port"""
+    
+    def __init__(self, port: int = 0):
+        # Imported here so benchmarks that don't need Redis don't need fakeredis
+        from fakeredis import TcpFakeServer
+        self.port = port or free_port()
+        self.server = TcpFakeServer(("127.0.0.1", self.port))
+        self.server.daemon_threads = True
+        self.thread = threading.Thread(target=self.server.serve_forever, name="redis-stand-in", daemon=True)
+    
+    def start(self):
+        self.thread.start()
+        return self
+    
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+    
+    def __enter__(self):
+        return self.start()
+    
+    def __exit__(self, *exc):
+        self.stop()